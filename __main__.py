@@ -1,3 +1,4 @@
 import toolkit
 
-toolkit.run()
+if __name__ == "__main__":
+    toolkit.run()
@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+# Front-end resources aren't needed (and usually aren't built) when benchmarking the API
+os.environ["DEBUG"] = "1"
+# Benchmark runs in a temporary directory, the repository has to stay importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.generator import GeneratorOptions
+from benchmark.suite import run_suite, compare
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Measures hot paths of the toolkit on a synthetic database")
+    parser.add_argument("--environments", type=int, default=1)
+    parser.add_argument("--profiles", type=int, default=20, help="profiles per environment")
+    parser.add_argument("--properties", type=int, default=2000, help="properties per profile")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="ratio of property names shared by all profiles")
+    parser.add_argument("--references", type=float, default=0.05,
+                        help="ratio of values containing a {{name}} reference")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs of every case")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs of every case")
+    parser.add_argument("--case", action="append", dest="cases", help="run only given case (repeatable)")
+    parser.add_argument("--output", help="file the results are written to, standard output by default")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline the results are compared with")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative slowdown of the median duration")
+    parser.add_argument("--min-delta", type=float, default=0.5,
+                        help="slowdowns smaller than this (in milliseconds) are never reported")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    options = GeneratorOptions(args.environments, args.profiles, args.properties, args.overlap, args.references,
+                               args.seed)
+    # Logs go to standard error, standard output is reserved for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        document = run_suite(options, args.repeat, args.warmup, args.cases)
+
+    rendered = json.dumps(document, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(rendered + "\n")
+        print("Baseline saved to {}".format(args.baseline), file=sys.stderr)
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print("Baseline {} doesn't exist, nothing to compare".format(args.baseline), file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("parameters") != document["parameters"]:
+        print("Baseline was measured with different parameters, results aren't compared", file=sys.stderr)
+        return 0
+    if baseline.get("platform") != document["platform"]:
+        print("Baseline was measured on a different machine or Python version, results aren't compared",
+              file=sys.stderr)
+        return 0
+
+    regressions = compare(document, baseline, args.threshold, args.min_delta)
+    for regression in regressions:
+        print("Regression: {}".format(regression), file=sys.stderr)
+    if len(regressions) > 0:
+        return 1
+    print("No regressions against {}".format(args.baseline), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import os
+import random
+
+from toolkit.core.sqlite.db_manager import DBManager, DB_FILE_NAME
+from toolkit.core.sqlite.migration_manager import MigrationManager
+
+SHARED_NAME_PREFIX = "shared_"
+
+
+class GeneratorOptions:
+    environments: int
+    profiles: int
+    properties: int
+    overlap: float
+    references: float
+    seed: int
+
+    def __init__(self, environments=1, profiles=20, properties=2000, overlap=0.5, references=0.05, seed=1):
+        """
+        :param environments: number of environments
+        :param profiles: number of profiles in every environment
+        :param properties: number of properties in every profile
+        :param overlap: ratio (0 - 1) of property names every profile shares with the other profiles,
+        i.e. names overriding each other
+        :param references: ratio (0 - 1) of property values containing a {{name}} reference
+        :param seed: seed of the random generator, the same options always produce the same database
+        """
+        if not 0 <= overlap <= 1 or not 0 <= references <= 1:
+            raise Exception("Overlap and references have to be ratios between 0 and 1")
+
+        self.environments = environments
+        self.profiles = profiles
+        self.properties = properties
+        self.overlap = overlap
+        self.references = references
+        self.seed = seed
+
+    def to_dict(self):
+        return {
+            "environments": self.environments,
+            "profiles": self.profiles,
+            "properties": self.properties,
+            "overlap": self.overlap,
+            "references": self.references,
+            "seed": self.seed
+        }
+
+
+def generate_database(directory, options: GeneratorOptions):
+    """
+    Creates database with synthetic environments in given directory. Rows are inserted directly, bypassing
+    the model, so that generation of large databases takes seconds.
+    """
+    path = os.path.join(directory, DB_FILE_NAME)
+    if os.path.exists(path):
+        raise Exception("Database {} already exists".format(path))
+
+    rng = random.Random(options.seed)
+    shared_count = round(options.properties * options.overlap)
+
+    DBManager.initialize(directory)
+    with DBManager.connection() as db:
+        MigrationManager.migrate()
+
+        profile_id = 0
+        for env_id in range(1, options.environments + 1):
+            name = "default" if env_id == 1 else "environment-{}".format(env_id)
+            db.execute("insert into environment (id, name) values (?, ?)", (env_id, name))
+
+            for priority in range(1, options.profiles + 1):
+                profile_id += 1
+                db.execute("insert into profile (id, name, priority, enabled, environment_id) values (?, ?, ?, 1, ?)",
+                           (profile_id, "profile-{}".format(priority), priority, env_id))
+
+                names = [SHARED_NAME_PREFIX + str(i) for i in range(shared_count)]
+                names += ["p{}_{}".format(profile_id, i) for i in range(options.properties - shared_count)]
+                rows = [(name, _generate_value(rng, options, shared_count), profile_id) for name in names]
+                db.executemany("insert into property (name, value, type, enabled, profile_id) values (?, ?, 'S', 1, ?)",
+                               rows)
+        db.commit()
+    DBManager.destroy()
+
+
+def _generate_value(rng: random.Random, options: GeneratorOptions, shared_count) -> str:
+    if shared_count > 0 and rng.random() < options.references:
+        return "{{" + SHARED_NAME_PREFIX + str(rng.randrange(shared_count)) + "}}/" + str(rng.randrange(10000))
+    return "value-{}".format(rng.randrange(1000000))
@@ -0,0 +1,91 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+# Front-end resources aren't needed (and usually aren't built) when benchmarking the model
+os.environ["DEBUG"] = "1"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.generator import GeneratorOptions, generate_database
+
+
+def measure(options: GeneratorOptions):
+    """
+    Loads the model from a generated database and measures memory allocated by Python for the loaded entities
+    (including the resolved views) and then for the snapshots of all environments
+    :return: results document, see README
+    """
+    from toolkit.core.log import Log
+    from toolkit.core.sqlite.db_manager import DBManager
+    from toolkit.core.service.persistence_manager import PersistenceManager
+
+    Log.configure("WARNING")
+    with tempfile.TemporaryDirectory(prefix="postman-toolkit-memory-") as directory:
+        generate_database(directory, options)
+        DBManager.initialize(directory)
+        try:
+            with DBManager.connection():
+                gc.collect()
+                tracemalloc.start()
+                start = tracemalloc.get_traced_memory()[0]
+                environments = PersistenceManager.load_environments()
+                gc.collect()
+                model = tracemalloc.get_traced_memory()[0] - start
+
+                snapshots = [env.get_snapshot() for env in environments]
+                gc.collect()
+                snapshot = tracemalloc.get_traced_memory()[0] - start - model
+                tracemalloc.stop()
+        finally:
+            DBManager.destroy()
+
+    properties = sum(len(profile.properties) for env in environments for profile in env.profiles)
+    del snapshots
+    return {
+        "parameters": options.to_dict(),
+        "python": sys.version.split()[0],
+        "property_count": properties,
+        "model_bytes": model,
+        "model_bytes_per_property": round(model / properties, 1),
+        "snapshot_bytes": snapshot,
+        "snapshot_bytes_per_property": round(snapshot / properties, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.memory",
+                                     description="Measures memory used by the loaded model on a synthetic database")
+    parser.add_argument("--environments", type=int, default=1)
+    parser.add_argument("--profiles", type=int, default=50, help="profiles per environment")
+    parser.add_argument("--properties", type=int, default=2000, help="properties per profile")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="ratio of property names shared by all profiles")
+    parser.add_argument("--references", type=float, default=0.05,
+                        help="ratio of values containing a {{name}} reference")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="earlier results the current ones are compared with")
+    args = parser.parse_args()
+
+    options = GeneratorOptions(args.environments, args.profiles, args.properties, args.overlap, args.references,
+                               args.seed)
+    document = measure(options)
+    print(json.dumps(document, indent=2))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        if earlier.get("parameters") != document["parameters"]:
+            print("Results were measured with different parameters, they aren't compared", file=sys.stderr)
+            return 0
+        for key in ("model_bytes_per_property", "snapshot_bytes_per_property"):
+            print("{}: {} -> {} ({:+.1f}%)".format(key, earlier[key], document[key],
+                                                  (document[key] / earlier[key] - 1) * 100), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
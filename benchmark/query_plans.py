@@ -0,0 +1,205 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+
+# Front-end resources aren't needed (and usually aren't built) when checking the database
+os.environ["DEBUG"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.generator import GeneratorOptions, generate_database
+
+LITERAL_PATTERN = re.compile("'(?:[^']|'')*'|\\b\\d+(?:\\.\\d+)?\\b")
+PARAMETER_LIST_PATTERN = re.compile("\\?(?:, \\?)+")
+WHERE_PATTERN = re.compile("\\bwhere\\b", re.IGNORECASE)
+# Full scan of a table, scans of an index (SCAN t USING INDEX i) are reported as well
+SCAN_PATTERN = re.compile("^SCAN (\\w+)")
+# Rows sorted once they're selected (ORDER BY, GROUP BY or DISTINCT), instead of being read in the order of an index
+SORT_PATTERN = re.compile("^USE TEMP B-TREE")
+EXPLAINED_STATEMENTS = ("select", "insert", "update", "delete")
+
+
+class StatementCollector:
+    """
+    Trace callback of all database connections (see DBManager.set_trace_callback), collects every statement
+    executed by the application. Statements are grouped by their shape, i.e. with literals replaced with parameters.
+    """
+    statements: Dict[str, str]
+
+    def __init__(self):
+        # Expanded statement by shape, the first one of every shape is kept
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, statement):
+        if not statement.lstrip().lower().startswith(EXPLAINED_STATEMENTS):
+            return
+        with self._lock:
+            self.statements.setdefault(statement_shape(statement), statement)
+
+
+def statement_shape(statement) -> str:
+    shape = LITERAL_PATTERN.sub("?", " ".join(statement.split()))
+    return PARAMETER_LIST_PATTERN.sub("?, ...", shape)
+
+
+def check(options: GeneratorOptions, verbose=False) -> List[Tuple[str, str]]:
+    """
+    Runs the application on a generated database and explains every statement it executes: startup, all API routes,
+    lazy loading of properties, synchronization of two processes sharing the database and shutdown. A statement
+    filtering rows (with a where clause) mustn't scan a whole table nor sort the rows it selects. Statements without
+    a where clause read whole tables on purpose (loads of the model), internal tables of SQLite aren't checked.
+    :return: pairs (statement shape, plan step) of the scans and sorts that were found
+    """
+    from toolkit.core.sqlite.db_manager import DBManager, DB_FILE_NAME
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="postman-toolkit-query-plans-") as directory:
+        generate_database(directory, options)
+        # Application keeps its database in the working directory
+        os.chdir(directory)
+        collector = StatementCollector()
+        DBManager.set_trace_callback(collector)
+        try:
+            _run_application()
+        finally:
+            DBManager.set_trace_callback(None)
+            os.chdir(working_directory)
+
+        violations = []
+        db = sqlite3.connect(os.path.join(directory, DB_FILE_NAME))
+        try:
+            for (shape, statement) in sorted(collector.statements.items()):
+                plan = [row[3] for row in db.execute("explain query plan " + statement)]
+                scans = [step for step in plan if SORT_PATTERN.match(step) or
+                         SCAN_PATTERN.match(step) and not SCAN_PATTERN.match(step).group(1).startswith("sqlite_")]
+                failed = len(scans) > 0 and WHERE_PATTERN.search(statement) is not None
+                violations += [(shape, step) for step in scans] if failed else []
+                if verbose or failed:
+                    print("{} {}".format("SCAN" if failed else "ok  ", shape))
+                    for step in plan:
+                        print("       {}".format(step))
+        finally:
+            db.close()
+    print("{} statements explained, {} of them scan a whole table or sort the selected rows".format(
+        len(collector.statements), len(set(shape for (shape, _) in violations))), file=sys.stderr)
+    return violations
+
+
+def _run_application():
+    from toolkit.core.config import ConfigProperty
+    from toolkit.core.toolkit import PostmanToolkit
+    from toolkit.web import web
+
+    app = web.create_app()
+    toolkit = web.toolkit
+    toolkit.enable_synchronization()
+    client = app.test_client()
+    _call_routes(client)
+
+    # Another process sharing the database, with properties loaded on demand. Its commits are picked up
+    # by the first process on its next request.
+    ConfigProperty.PROFILE_CACHE_SIZE = 1
+    other = PostmanToolkit()
+    env = other.context.find_environment("default")
+    with env.lock:
+        profiles = env.get_prioritized_profiles()
+        profiles[0].properties[0].value = "modified"
+        # Environment-wide read selects properties of the profiles that aren't loaded, reads of a single profile
+        # look up the names it references
+        env.get_snapshot()
+        env.find_first_property(profiles[-1].properties[0].name)
+        profiles[-1].create_property("query-plans", "created")
+    other.persist_changes(env)
+    created = other.context.create_environment("query-plans-other")
+    with created.lock:
+        created.create_profile("query-plans").create_property("query-plans", "1")
+    other.persist_changes()
+    _get(client, "/api/environments")
+
+    other.context.delete_environment(created.name)
+    other.persist_changes()
+    _get(client, "/api/environments")
+
+    other.shutdown()
+    toolkit.shutdown()
+    PostmanToolkit.destroy()
+
+
+def _call_routes(client):
+    _get(client, "/api/environments")
+    _get(client, "/api/config")
+    _get(client, "/api/config?limit=10&fields=id,name")
+    _get(client, "/api/profiles")
+    _get(client, "/api/search?q=value")
+
+    _call(client.post, "/api/environments", json={"name": "query-plans"})
+    prefix = "/api/environments/query-plans"
+    for name in ["base", "local"]:
+        _call(client.post, prefix + "/profiles", json={"name": name, "active": True})
+    (base, local) = [p["id"] for p in _get(client, prefix + "/profiles")["content"]]
+
+    for (profile_id, name, value) in [(base, "host", "example.com"), (base, "url", "https://{{host}}"),
+                                      (base, "port", "80"), (local, "host", "localhost")]:
+        _call(client.put, "{}/profiles/{}/config".format(prefix, profile_id), json={"name": name, "value": value})
+    properties = {p["name"]: p["id"] for p in _get(client, "{}/profiles/{}/config".format(prefix, base))["content"]}
+
+    _call(client.post, "{}/profiles/{}/config/{}".format(prefix, base, properties["host"]), json={"value": "test.com"})
+    _call(client.post, "{}/profiles/{}/config/{}/rename".format(prefix, base, properties["port"]),
+          json={"new_name": "server_port"})
+    _call(client.post, "{}/profiles/{}/config/bulk".format(prefix, base),
+          json=[{"op": "create", "name": "user", "value": "admin"},
+                {"op": "update", "name": "url", "value": "http://{{host}}"},
+                {"op": "delete", "name": "server_port"}])
+    _call(client.post, "{}/profiles/{}/deactivate".format(prefix, local))
+    _call(client.post, "{}/profiles/{}/activate".format(prefix, local))
+    _call(client.post, "{}/profiles/{}/up".format(prefix, local))
+    _call(client.post, "{}/profiles/{}/down".format(prefix, local))
+
+    _get(client, prefix + "/config")
+    _get(client, "{}/profiles/{}/config?limit=1".format(prefix, base))
+    _call(client.post, prefix + "/config/details", json={"name": "host"})
+    _get(client, prefix + "/search?q=host")
+    _get(client, prefix + "/config/export")
+    _get(client, prefix + "/postman/environment")
+
+    _call(client.delete, "{}/profiles/{}/config/{}".format(prefix, base, properties["host"]))
+    _call(client.delete, "{}/profiles/{}".format(prefix, local))
+    _call(client.delete, prefix)
+
+
+def _get(client, path):
+    return _call(client.get, path)
+
+
+def _call(method, path, **kwargs):
+    response = method(path, **kwargs)
+    if response.status_code >= 400:
+        raise Exception("{} failed with status {}: {}".format(path, response.status_code, response.get_data(True)))
+    return response.get_json() if response.is_json else None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.query_plans",
+                                     description="Checks query plans of the statements executed by the application")
+    parser.add_argument("--environments", type=int, default=2)
+    parser.add_argument("--profiles", type=int, default=5, help="profiles per environment")
+    parser.add_argument("--properties", type=int, default=50, help="properties per profile")
+    parser.add_argument("--verbose", action="store_true", help="print plans of all statements")
+    args = parser.parse_args()
+
+    # Generator logs migrations of the new database
+    from toolkit.core.log import Log
+    Log.configure("WARNING")
+    options = GeneratorOptions(args.environments, args.profiles, args.properties, 0.5, 0.05, 1)
+    violations = check(options, args.verbose)
+    return 1 if len(violations) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.generator import GeneratorOptions, generate_database
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed by every measured process: boots the application the same way the server does (by importing
+# the web module and creating the application) and reports how long it took
+BOOT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repository!r})
+from toolkit.web import web
+web.create_app()
+boot = time.perf_counter() - start
+web.toolkit.shutdown()
+web.PostmanToolkit.destroy()
+print(json.dumps({{"boot_ms": boot * 1000}}))
+"""
+
+MODES = {
+    "database": {},
+    "lazy": {"PROFILE_CACHE_SIZE": "100"}
+}
+
+
+def measure(options: GeneratorOptions, repeat, modes):
+    """
+    Starts the application in fresh processes (cold imports) on a generated database
+    :return: results document, see README
+    """
+    results = {}
+    for mode in modes:
+        with tempfile.TemporaryDirectory(prefix="postman-toolkit-startup-") as directory:
+            generate_database(directory, options)
+            env = dict(os.environ, DEBUG="1", LOG_LEVEL="WARNING", **MODES[mode])
+            # First start migrates the database, it isn't measured
+            _boot(directory, env)
+
+            boot = []
+            process = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                boot.append(_boot(directory, env))
+                process.append((time.perf_counter() - start) * 1000)
+        results[mode] = {
+            "boot_median_ms": round(statistics.median(boot), 1),
+            "process_median_ms": round(statistics.median(process), 1)
+        }
+        print("{}: boot {:.0f} ms, process {:.0f} ms".format(mode, results[mode]["boot_median_ms"],
+                                                             results[mode]["process_median_ms"]), file=sys.stderr)
+    return {
+        "parameters": dict(options.to_dict(), repeat=repeat),
+        "python": sys.version.split()[0],
+        "results": results
+    }
+
+
+def _boot(directory, env) -> float:
+    completed = subprocess.run([sys.executable, "-c", BOOT_SCRIPT.format(repository=REPOSITORY)], cwd=directory,
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if completed.returncode != 0:
+        raise Exception("Application failed to start:\n{}".format(completed.stderr))
+    return json.loads(completed.stdout.strip().splitlines()[-1])["boot_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.startup",
+                                     description="Measures startup time of the application on a synthetic database")
+    parser.add_argument("--environments", type=int, default=1)
+    parser.add_argument("--profiles", type=int, default=50, help="profiles per environment")
+    parser.add_argument("--properties", type=int, default=2000, help="properties per profile")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="ratio of property names shared by all profiles")
+    parser.add_argument("--references", type=float, default=0.05,
+                        help="ratio of values containing a {{name}} reference")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5, help="measured starts in every mode")
+    parser.add_argument("--mode", action="append", dest="modes", choices=list(MODES.keys()),
+                        help="measure only given mode (repeatable)")
+    args = parser.parse_args()
+
+    options = GeneratorOptions(args.environments, args.profiles, args.properties, args.overlap, args.references,
+                               args.seed)
+    # Generator logs migrations of the new databases, standard output is reserved for the results
+    from toolkit.core.log import Log
+    Log.configure("WARNING")
+    document = measure(options, args.repeat, args.modes or list(MODES.keys()))
+    print(json.dumps(document, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
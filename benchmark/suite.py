@@ -0,0 +1,243 @@
+import gc
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from .generator import GeneratorOptions, generate_database
+
+# Number of names looked up by the property chain case
+CHAIN_LOOKUPS = 1000
+# Number of properties modified or created by the bulk persistence cases
+BULK_SIZE = 1000
+
+
+class Case:
+    """
+    Single benchmark. Only the run function is timed, setup and teardown are called before and after every run.
+    """
+    name: str
+    run: Callable[[], None]
+    setup: Optional[Callable[[], None]]
+    teardown: Optional[Callable[[], None]]
+
+    def __init__(self, name, run, setup=None, teardown=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+
+    def measure(self, repeat, warmup) -> List[float]:
+        """
+        :return: durations of the timed runs in milliseconds
+        """
+        durations = []
+        for i in range(warmup + repeat):
+            if self.setup is not None:
+                self.setup()
+            # Garbage left by previous runs would be collected at a random point of the timed run
+            gc.collect()
+            start = time.perf_counter()
+            self.run()
+            elapsed = (time.perf_counter() - start) * 1000
+            if self.teardown is not None:
+                self.teardown()
+            if i >= warmup:
+                durations.append(elapsed)
+        return durations
+
+
+class Regression:
+    name: str
+    baseline: float
+    current: float
+    threshold: float
+
+    def __init__(self, name, baseline, current, threshold):
+        self.name = name
+        self.baseline = baseline
+        self.current = current
+        self.threshold = threshold
+
+    def __str__(self):
+        return "{}: median {:.2f} ms, baseline {:.2f} ms (+{:.0f}%, allowed +{:.0f}%)".format(
+            self.name, self.current, self.baseline, (self.current / self.baseline - 1) * 100, self.threshold * 100)
+
+
+def run_suite(options: GeneratorOptions, repeat=10, warmup=1, selected: List[str] = None) -> Dict:
+    """
+    Generates a database in a temporary directory, starts the application on top of it and measures all cases
+    :param selected: names of the cases to run, all cases if not specified
+    :return: results document, see README
+    """
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="postman-toolkit-benchmark-") as directory:
+        generate_start = time.perf_counter()
+        generate_database(directory, options)
+        generate_time = (time.perf_counter() - generate_start) * 1000
+
+        # Application keeps its database in the working directory and opens it when it's created
+        os.chdir(directory)
+        try:
+            results = _run_cases(options, repeat, warmup, selected)
+        finally:
+            os.chdir(working_directory)
+    return {
+        "parameters": dict(options.to_dict(), repeat=repeat, warmup=warmup),
+        "platform": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "system": platform.platform(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count()
+        },
+        "generate_ms": round(generate_time, 3),
+        "results": results
+    }
+
+
+def _run_cases(options: GeneratorOptions, repeat, warmup, selected: Optional[List[str]]) -> Dict:
+    from toolkit.core.log import Log
+    from toolkit.web import web
+    web.create_app()
+    Log.configure("INFO")
+
+    cases = _create_cases(web, options)
+    results = {}
+    for case in cases:
+        if selected is not None and case.name not in selected:
+            continue
+        durations = case.measure(repeat, warmup)
+        results[case.name] = _summarize(durations)
+        Log.i("{}: median {:.2f} ms", case.name, results[case.name]["median_ms"])
+
+    web.toolkit.shutdown()
+    web.PostmanToolkit.destroy()
+    return results
+
+
+def compare(document: Dict, baseline: Dict, threshold, min_delta) -> List[Regression]:
+    """
+    Compares median durations with the baseline. A case regresses when it's slower by more than the threshold
+    (relative, baseline can override it per case) and by more than min_delta milliseconds, so that noise
+    of very fast cases isn't reported.
+    """
+    thresholds = baseline.get("thresholds", {})
+    regressions = []
+    for (name, result) in document["results"].items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+
+        allowed = thresholds.get(name, threshold)
+        current = result["median_ms"]
+        if current > expected["median_ms"] * (1 + allowed) and current - expected["median_ms"] > min_delta:
+            regressions.append(Regression(name, expected["median_ms"], current, allowed))
+    return regressions
+
+
+def _summarize(durations: List[float]) -> Dict:
+    ordered = sorted(durations)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+
+def _create_cases(web, options: GeneratorOptions) -> List[Case]:
+    from toolkit.core.sqlite.db_manager import DBManager
+    from toolkit.core.service.persistence_manager import PersistenceManager
+    from toolkit.web.facade import DEFAULT_ENVIRONMENT
+
+    toolkit = web.toolkit
+    facade = web.facade
+    client = web.app.test_client()
+    env = toolkit.context.find_environment(DEFAULT_ENVIRONMENT)
+    rng = random.Random(options.seed)
+
+    names = sorted({prop.name for profile in env.profiles for prop in profile.properties})
+    lookups = [rng.choice(names) for _ in range(CHAIN_LOOKUPS)]
+    properties = [prop for profile in env.profiles for prop in profile.properties]
+    top_profile = env.profiles[-1]
+    counter = [0]
+
+    def load_environments():
+        with DBManager.connection():
+            PersistenceManager.load_environments()
+
+    def get_property_chain():
+        for name in lookups:
+            env.get_property_chain(name)
+
+    def edit(count):
+        def _setup():
+            with env.lock:
+                for _ in range(count):
+                    counter[0] += 1
+                    properties[counter[0] % len(properties)].value = "edited-{}".format(counter[0])
+                env.bump_version()
+        return _setup
+
+    def persist():
+        toolkit.persist_changes(env)
+
+    def create_bulk():
+        with env.lock:
+            profile = env.create_profile("benchmark-bulk")
+            for i in range(BULK_SIZE):
+                profile.create_property("bulk_{}".format(i), "value-{}".format(i))
+            env.bump_version()
+
+    def delete_bulk():
+        with env.lock:
+            env.delete_profile(env.find_profile("benchmark-bulk").id)
+            env.bump_version()
+        toolkit.persist_changes(env)
+
+    def invalidate():
+        # New version, i.e. responses have to be rendered again
+        with env.lock:
+            env.bump_version()
+
+    def get(path):
+        def _run():
+            response = client.get(path)
+            response.get_data()
+            if response.status_code != 200:
+                raise Exception("GET {} returned {}".format(path, response.status_code))
+        return _run
+
+    def update_property():
+        counter[0] += 1
+        prop = top_profile.properties[counter[0] % len(top_profile.properties)]
+        path = "/api/profiles/{}/config/{}".format(top_profile.id, prop.id)
+        response = client.post(path, json={"value": "http-{}".format(counter[0])})
+        if response.status_code != 200:
+            raise Exception("POST {} returned {}".format(path, response.status_code))
+
+    profile_config = "/api/profiles/{}/config".format(top_profile.id)
+    return [
+        Case("load_environments", load_environments),
+        Case("get_property_chain_x{}".format(CHAIN_LOOKUPS), get_property_chain),
+        Case("facade_list_properties", lambda: facade.list_properties(DEFAULT_ENVIRONMENT, False)),
+        Case("persist_small_edit", persist, setup=edit(1)),
+        Case("persist_bulk_edit", persist, setup=edit(BULK_SIZE)),
+        Case("persist_bulk_insert", persist, setup=create_bulk, teardown=delete_bulk),
+        Case("http_get_config", get("/api/config")),
+        Case("http_get_config_uncached", get("/api/config"), setup=invalidate),
+        Case("http_get_config_page", get("/api/config?limit=50&fields=id,name"), setup=invalidate),
+        Case("http_get_profiles", get("/api/profiles"), setup=invalidate),
+        Case("http_get_profile_config", get(profile_config), setup=invalidate),
+        Case("http_export_config", get("/api/config/export")),
+        Case("http_postman_environment", get("/api/postman/environment"), setup=invalidate),
+        Case("http_update_property", update_property)
+    ]
@@ -0,0 +1,56 @@
+import gzip
+import unittest
+
+from flask import Flask, request
+
+from toolkit.web.assets import Asset, CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE
+
+
+class AssetTest(unittest.TestCase):
+    """
+    Assets are served compressed to clients accepting gzip and revalidated by their ETag
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.script = b"function f() { return 1; }\n" * 20
+
+    def respond(self, asset, headers):
+        with self.app.test_request_context(headers=headers):
+            return asset.to_response(request)
+
+    def test_compressed_for_accepting_clients(self):
+        asset = Asset("app.3f2a1b9c.js", self.script)
+        self.assertEqual(CACHE_CONTROL_IMMUTABLE, asset.cache_control)
+
+        response = self.respond(asset, {"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual("application/javascript; charset=utf-8", response.headers["Content-Type"])
+        self.assertEqual(self.script, gzip.decompress(response.get_data()))
+
+        response = self.respond(asset, {})
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(self.script, response.get_data())
+
+    def test_not_modified(self):
+        asset = Asset("index.html", b"<html></html>")
+        self.assertIsNone(asset.gzip_content)
+        self.assertEqual(CACHE_CONTROL_REVALIDATE, asset.cache_control)
+
+        etag = self.respond(asset, {}).headers["ETag"]
+        response = self.respond(asset, {"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.get_data())
+
+        # Compressed and plain bodies have different ETags
+        asset = Asset("app.js", self.script)
+        etag = self.respond(asset, {}).headers["ETag"]
+        self.assertEqual(200, self.respond(asset, {"If-None-Match": etag, "Accept-Encoding": "gzip"}).status_code)
+        self.assertEqual(304, self.respond(asset, {"If-None-Match": etag}).status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
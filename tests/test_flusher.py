@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from toolkit.core.config import ConfigProperty
+from toolkit.core.service.flusher import MAX_FLUSH_ATTEMPTS, PersistenceFlusher
+
+
+class PersistenceFlusherTest(unittest.TestCase):
+    """
+    Failed flushes are retried with a growing delay, until they succeed or MAX_FLUSH_ATTEMPTS is reached
+    """
+
+    def setUp(self):
+        ConfigProperty.LOG_LEVEL = "WARNING"
+        self.calls = 0
+        self.done = threading.Event()
+
+    def create_flusher(self, failures) -> PersistenceFlusher:
+        def _flush():
+            self.calls += 1
+            if self.calls <= failures:
+                if self.calls == MAX_FLUSH_ATTEMPTS:
+                    self.done.set()
+                raise Exception("Simulated failure {}".format(self.calls))
+            self.done.set()
+
+        flusher = PersistenceFlusher(_flush, 10, 100)
+        flusher.start()
+        return flusher
+
+    def test_failed_flush_retried(self):
+        flusher = self.create_flusher(2)
+        flusher.request_flush()
+        self.assertTrue(self.done.wait(5))
+        flusher.stop()
+        self.assertEqual(3, self.calls)
+        self.assertIsNone(flusher.error)
+
+    def test_flush_given_up(self):
+        flusher = self.create_flusher(MAX_FLUSH_ATTEMPTS + 1)
+        flusher.request_flush()
+        self.assertTrue(self.done.wait(5))
+        # Changes stay pending until the next request, stop() reports the last error
+        with self.assertRaises(Exception) as context:
+            flusher.stop()
+        self.assertEqual(MAX_FLUSH_ATTEMPTS, self.calls)
+        self.assertIn("Simulated failure {}".format(MAX_FLUSH_ATTEMPTS), str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
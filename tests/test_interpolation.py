@@ -0,0 +1,201 @@
+import random
+import unittest
+
+from toolkit.core.model.context import Context
+from toolkit.core.model.interpolation import Interpolator, Template
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_compile(self):
+        template = Template.compile("{{scheme}}://{{ host }}:{{port}}/api")
+        self.assertEqual(frozenset(["scheme", "host", "port"]), template.references)
+        self.assertEqual(((True, "scheme"), (False, "://"), (True, "host"), (False, ":"), (True, "port"),
+                          (False, "/api")), template.segments)
+
+    def test_literal(self):
+        self.assertTrue(Template.compile("plain").is_literal())
+        self.assertTrue(Template.compile(None).is_literal())
+        self.assertTrue(Template.compile("{{ }}").is_literal())
+
+
+class InterpolationTest(unittest.TestCase):
+    """
+    Expanded values of an environment after changes of referenced properties
+    """
+
+    def setUp(self):
+        self.env = Context().create_environment("test")
+        self.base = self.env.create_profile("base")
+        self.local = self.env.create_profile("local")
+
+    def expand(self, name):
+        _, prop = self.env.get_first_property(name)
+        return self.env.get_expanded_value(prop)
+
+    def assert_matches_fresh(self):
+        """
+        Values expanded by the environment's interpolator have to match a new interpolator without cached values
+        """
+        fresh = Interpolator(self.env._get_resolved_value)
+        fresh.add_all(self.env.get_property_names())
+        for name in self.env.get_property_names():
+            if self.env.get_first_property(name) is not None:
+                self.assertEqual(fresh.expand(name), self.expand(name), name)
+
+    def test_expand(self):
+        self.base.create_property("scheme", "https")
+        self.base.create_property("host", "example.com")
+        self.base.create_property("url", "{{scheme}}://{{host}}/")
+        self.assertEqual("https://example.com/", self.expand("url"))
+
+    def test_unknown_reference(self):
+        self.base.create_property("url", "http://{{host}}/")
+        self.assertEqual("http://{{host}}/", self.expand("url"))
+
+    def test_self_reference(self):
+        self.base.create_property("path", "{{path}}/bin")
+        self.assertEqual("{{path}}/bin", self.expand("path"))
+
+    def test_cycle(self):
+        self.base.create_property("a", "a{{b}}")
+        self.base.create_property("b", "b{{c}}")
+        self.base.create_property("c", "c{{a}}")
+        self.base.create_property("d", "d{{a}}")
+        self.base.create_property("e", "e{{d}}")
+        # References to any name of the cycle are left unexpanded, whichever name the expansion starts from
+        self.assertEqual("ed{{a}}", self.expand("e"))
+        self.assertEqual("a{{b}}", self.expand("a"))
+        self.assertEqual("b{{c}}", self.expand("b"))
+        self.assertEqual("c{{a}}", self.expand("c"))
+        self.assert_matches_fresh()
+
+    def test_cycle_broken(self):
+        self.base.create_property("a", "a{{b}}")
+        b = self.base.create_property("b", "b{{a}}")
+        self.base.create_property("c", "c{{a}}")
+        self.assertEqual("c{{a}}", self.expand("c"))
+
+        b.value = "b"
+        self.assertEqual("ab", self.expand("a"))
+        self.assertEqual("cab", self.expand("c"))
+        self.assert_matches_fresh()
+
+    def test_cycle_created(self):
+        self.base.create_property("a", "a{{b}}")
+        b = self.base.create_property("b", "b")
+        self.assertEqual("ab", self.expand("a"))
+
+        b.value = "b{{a}}"
+        self.assertEqual("a{{b}}", self.expand("a"))
+        self.assertEqual("b{{a}}", self.expand("b"))
+
+    def test_transitive_invalidation(self):
+        host = self.base.create_property("host", "example.com")
+        self.base.create_property("origin", "https://{{host}}")
+        self.base.create_property("api", "{{origin}}/api")
+        self.base.create_property("users", "{{api}}/users")
+        self.assertEqual("https://example.com/api/users", self.expand("users"))
+
+        self.assertEqual({"origin"}, self.env._interpolator.get_dependents("host"))
+
+        host.value = "test.com"
+        self.assertEqual("https://test.com/api/users", self.expand("users"))
+        self.assertEqual("https://test.com/api", self.expand("api"))
+        self.assert_matches_fresh()
+
+    def test_invalidation_returns_dependents(self):
+        self.base.create_property("host", "example.com")
+        self.base.create_property("origin", "https://{{host}}")
+        self.base.create_property("api", "{{origin}}/api")
+        self.base.create_property("other", "other")
+        self.assertEqual({"host", "origin", "api"}, set(self.env._interpolator.update("host")))
+
+    def test_shadowed_reference(self):
+        self.base.create_property("host", "example.com")
+        self.base.create_property("url", "https://{{host}}")
+        local_host = self.local.create_property("host", "localhost")
+        self.assertEqual("https://example.com", self.expand("url"))
+
+        # Profile with lower priority doesn't affect the expanded value until it takes precedence
+        local_host.value = "127.0.0.1"
+        self.assertEqual("https://example.com", self.expand("url"))
+
+        self.env.decrease_profile_priority(self.base.id)
+        self.assertEqual("https://127.0.0.1", self.expand("url"))
+        self.assert_matches_fresh()
+
+    def test_reference_of_shadowed_property(self):
+        self.base.create_property("host", "example.com")
+        self.local.create_property("host", "localhost")
+        shadowed = self.local.create_property("url", "https://{{host}}")
+        self.base.create_property("url", "http://{{host}}")
+        # Value of a property that isn't in effect is expanded against the resolved values as well
+        self.assertEqual("http://example.com", self.expand("url"))
+        self.assertEqual("https://example.com", self.env.get_expanded_value(shadowed))
+
+    def test_disabled_reference(self):
+        host = self.base.create_property("host", "example.com")
+        self.base.create_property("url", "https://{{host}}")
+        self.assertEqual("https://example.com", self.expand("url"))
+
+        host.enabled = False
+        self.assertEqual("https://{{host}}", self.expand("url"))
+
+        local_host = self.local.create_property("host", "localhost")
+        self.assertEqual("https://localhost", self.expand("url"))
+
+        self.local.enabled = False
+        self.assertEqual("https://{{host}}", self.expand("url"))
+
+        host.enabled = True
+        self.assertEqual("https://example.com", self.expand("url"))
+        self.assertEqual("localhost", self.env.get_expanded_value(local_host))
+        self.assert_matches_fresh()
+
+    def test_renamed_reference(self):
+        host = self.base.create_property("host", "example.com")
+        self.base.create_property("url", "https://{{host}}")
+        self.assertEqual("https://example.com", self.expand("url"))
+
+        host.name = "hostname"
+        self.assertEqual("https://{{host}}", self.expand("url"))
+
+        host.name = "host"
+        self.assertEqual("https://example.com", self.expand("url"))
+
+    def test_deleted_reference(self):
+        host = self.base.create_property("host", "example.com")
+        self.base.create_property("url", "https://{{host}}")
+        self.assertEqual("https://example.com", self.expand("url"))
+
+        self.base.delete_property(host.id)
+        self.assertEqual("https://{{host}}", self.expand("url"))
+
+    def test_random_changes(self):
+        rnd = random.Random(1)
+        names = ["n{}".format(i) for i in range(8)]
+
+        def random_value():
+            return "".join(rnd.choice(["x", "{{" + rnd.choice(names) + "}}"]) for _ in range(rnd.randint(0, 3)))
+
+        for _ in range(300):
+            profile = rnd.choice([self.base, self.local])
+            name = rnd.choice(names)
+            prop = profile.find_property(name)
+            operation = rnd.randrange(4)
+            if prop is None:
+                profile.create_property(name, random_value())
+            elif operation == 0:
+                prop.value = random_value()
+            elif operation == 1:
+                prop.enabled = not prop.enabled
+            elif operation == 2:
+                profile.enabled = not profile.enabled
+            else:
+                profile.delete_property(prop.id)
+            self.assert_matches_fresh()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from toolkit.core.config import ConfigProperty
+from toolkit.core.sqlite import migration_manager
+from toolkit.core.sqlite.db_manager import DBManager
+from toolkit.core.sqlite.migration_manager import MigrationFile, MigrationManager
+
+# Doubles values of all items, fails on items following the id stored in the interruption table
+CHUNKED_MIGRATION = """
+CHUNK_SIZE = 3
+
+
+def count(db):
+    return db.execute("select count(*) from item").fetchone()[0]
+
+
+def migrate_chunk(db, checkpoint, chunk_size):
+    rows = db.execute("select id from item where id > ? order by id limit ?", (checkpoint or 0, chunk_size)).fetchall()
+    if len(rows) == 0:
+        return None, 0
+    interruption = db.execute("select after_id from interruption").fetchone()
+    for (item_id,) in rows:
+        if interruption is not None and item_id > interruption[0]:
+            raise Exception("Interrupted")
+        db.execute("update item set value = value * 2 where id = ?", (item_id,))
+    return rows[-1][0], len(rows)
+"""
+
+
+class MigrationTest(unittest.TestCase):
+    """
+    Migrations executed on a new database with the schema version table only
+    """
+
+    def setUp(self):
+        ConfigProperty.LOG_LEVEL = "WARNING"
+        self._directory = tempfile.TemporaryDirectory(prefix="postman-toolkit-test-")
+        DBManager.initialize(self._directory.name)
+        self.db = DBManager.db()
+        MigrationManager._execute_migration(self.db, MigrationFile("0. Versions.sql"))
+        MigrationManager._upgrade_migration_table(self.db)
+
+    def tearDown(self):
+        DBManager.destroy()
+        self._directory.cleanup()
+
+    @staticmethod
+    def create_migration(file_name, content) -> MigrationFile:
+        with mock.patch.object(migration_manager.pkg_resources, "read_text", return_value=content):
+            return MigrationFile(file_name)
+
+    def get_status(self, number):
+        return self.db.execute("select checkpoint, processed_rows, success from schema_versions where id = ?",
+                               (number,)).fetchone()
+
+    def test_chunked_migration_resumed(self):
+        self.db.execute("create table item (id int primary key, value int)")
+        self.db.executemany("insert into item values (?, ?)", [(i, i) for i in range(1, 11)])
+        self.db.execute("create table interruption (after_id int)")
+        self.db.execute("insert into interruption values (5)")
+        self.db.commit()
+        migration = self.create_migration("1. Double values.py", CHUNKED_MIGRATION)
+
+        with self.assertRaises(Exception):
+            MigrationManager._execute_migration(self.db, migration)
+        # First chunk is committed, the interrupted one is rolled back entirely
+        values = [row[0] for row in self.db.execute("select value from item order by id")]
+        self.assertEqual([2, 4, 6, 4, 5, 6, 7, 8, 9, 10], values)
+        self.assertEqual((json.dumps(3), 3, 0), self.get_status(1))
+
+        self.db.execute("delete from interruption")
+        self.db.commit()
+        MigrationManager._execute_migration(self.db, migration)
+        values = [row[0] for row in self.db.execute("select value from item order by id")]
+        self.assertEqual([i * 2 for i in range(1, 11)], values)
+        self.assertEqual((None, 10, 1), self.get_status(1))
+
+    def test_sql_migration_transactional(self):
+        migration = self.create_migration("1. Items.sql", "create table item (id int primary key);\n"
+                                                          "insert into item values (1);\n"
+                                                          "insert into missing values (1);\n")
+        with self.assertRaises(sqlite3.Error):
+            MigrationManager._execute_migration(self.db, migration)
+        # Nothing is left behind, the migration is executed again from the start
+        self.assertIsNone(self.db.execute("select 1 from sqlite_master where name = 'item'").fetchone())
+        self.assertIsNone(self.get_status(1))
+
+        migration = self.create_migration("1. Items.sql", "create table item (id int primary key);\n"
+                                                          "insert into item values (1);\n")
+        MigrationManager._execute_migration(self.db, migration)
+        self.assertEqual([(1,)], self.db.execute("select id from item").fetchall())
+        self.assertEqual((None, 0, 1), self.get_status(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
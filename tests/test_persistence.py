@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from toolkit.core.config import ConfigProperty
+from toolkit.core.service.persistence_manager import PersistenceManager
+from toolkit.core.sqlite.db_manager import DBManager
+from toolkit.core.toolkit import PostmanToolkit
+
+
+class PersistChangesTest(unittest.TestCase):
+    """
+    Entities rejected by the database don't block the rest of the journal
+    """
+
+    def setUp(self):
+        ConfigProperty.LOG_LEVEL = "WARNING"
+        self._directory = tempfile.TemporaryDirectory(prefix="postman-toolkit-test-")
+        self._working_directory = os.getcwd()
+        os.chdir(self._directory.name)
+        self.toolkit = PostmanToolkit()
+        self.env = self.toolkit.context.find_environment("default")
+        with self.env.lock:
+            profile = self.env.create_profile("base")
+            profile.create_property("a", "1")
+            profile.create_property("b", "2")
+        self.toolkit.persist_changes()
+        self.profile = profile
+
+    def tearDown(self):
+        PostmanToolkit.destroy()
+        os.chdir(self._working_directory)
+        self._directory.cleanup()
+
+    def load_values(self):
+        with DBManager.connection():
+            env = next(e for e in PersistenceManager.load_environments() if e.id == self.env.id)
+        return {p.name: p.value for p in env.find_profile("base").properties}
+
+    def test_rejected_entity_dropped(self):
+        with self.env.lock:
+            self.profile.find_property("a").value = "changed"
+            self.profile.create_property("invalid", [1, 2])
+            self.profile.create_property("c", "3")
+        self.toolkit.persist_changes()
+
+        self.assertTrue(self.env.journal.is_empty())
+        self.assertEqual({"a": "changed", "b": "2", "c": "3"}, self.load_values())
+
+        with self.env.lock:
+            self.profile.find_property("b").value = "next"
+        self.toolkit.persist_changes()
+        self.assertEqual({"a": "changed", "b": "next", "c": "3"}, self.load_values())
+
+    def test_swapped_names_persisted_with_rejected_entity(self):
+        with self.env.lock:
+            (a, b) = (self.profile.find_property("a"), self.profile.find_property("b"))
+            a.name = "tmp"
+            b.name = "a"
+            a.name = "b"
+            self.profile.create_property("invalid", {"x": 1})
+        self.toolkit.persist_changes()
+
+        self.assertTrue(self.env.journal.is_empty())
+        self.assertEqual({"a": "2", "b": "1"}, self.load_values())
+
+
+if __name__ == '__main__':
+    unittest.main()
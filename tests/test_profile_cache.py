@@ -0,0 +1,125 @@
+import unittest
+import weakref
+
+from tests.test_snapshot import snapshot_state
+from toolkit.core.model.context import Context
+from toolkit.core.model.profile_cache import ProfileCache
+from toolkit.core.model.property import Property
+from toolkit.core.model.snapshot import EnvironmentSnapshot
+
+
+class ProfileCacheTest(unittest.TestCase):
+    """
+    Profiles unloaded by the cache and loaded again, with rows of persisted properties kept in memory
+    instead of the database
+    """
+
+    def setUp(self):
+        self.rows = {}
+        self.cache = ProfileCache(2, self.load)
+        self.context = Context()
+        self.env = self.create_environment("test", ["base", "local", "extra"])
+        self.other = self.create_environment("other", ["a", "b"])
+
+    def create_environment(self, name, profile_names):
+        env = self.context.create_environment(name)
+        for profile_name in profile_names:
+            profile = env.create_profile(profile_name)
+            profile.create_property("host", "{}.com".format(profile_name))
+            profile.create_property("url", "https://{{host}}/" + profile_name)
+            profile.create_property("users", "{{url}}/users")
+        env._profile_cache = self.cache
+        self.persist(env)
+        self.cache.admit(env.profiles)
+        return env
+
+    def persist(self, env):
+        for entity in list(env.journal.new_entities) + list(env.journal.dirty_entities):
+            entity.mark_persisted()
+        env.journal.clear()
+        for profile in env.profiles:
+            if profile.is_loaded():
+                self.rows[profile.id] = [(p.id, p.name, p.value, p.type, 1 if p.enabled else 0, profile.id)
+                                         for p in profile.properties]
+
+    def load(self, profile_ids):
+        loaded = {}
+        for profile_id in profile_ids:
+            properties = []
+            for row in self.rows.get(profile_id, []):
+                prop = Property()
+                prop.deserialize_row(row)
+                properties.append(prop)
+            loaded[profile_id] = properties
+        return loaded
+
+    def test_snapshot_released_after_read(self):
+        snapshot = self.env.get_snapshot()
+        state = snapshot_state(snapshot)
+
+        # Reading the whole environment doesn't load its profiles
+        self.assertFalse(any(p.is_loaded() for p in self.env.profiles))
+        self.assertIs(snapshot, self.env.get_snapshot())
+        reference = weakref.ref(snapshot)
+        del snapshot
+        self.assertIsNone(reference())
+        self.assertEqual(state, snapshot_state(self.env.get_snapshot()))
+
+    def test_modification_after_unload(self):
+        self.env.get_snapshot()
+        self.assertFalse(any(p.is_loaded() for p in self.env.profiles))
+
+        with self.env.lock:
+            self.env.get_prioritized_profiles()[0].find_property("host").value = "changed.com"
+            self.env.bump_version()
+        # Modification loads the modified profile only
+        self.assertEqual([True, False, False], [p.is_loaded() for p in self.env.get_prioritized_profiles()])
+        snapshot = self.env.get_snapshot()
+        winner = snapshot.get_first_property("users")[1]
+        self.assertEqual("https://changed.com/base/users", snapshot.get_expanded_value(winner))
+        self.assertEqual(snapshot_state(EnvironmentSnapshot.build(self.env)), snapshot_state(snapshot))
+
+    def test_profile_read_alone(self):
+        local = self.env.find_profile("local")
+        partial = self.env.get_snapshot(local.id)
+        self.assertIsNone(partial.get_profile(self.env.find_profile("base").id))
+        profile = partial.get_profile(local.id)
+        expanded = {prop.name: partial.get_expanded_value(prop) for prop in profile.properties}
+
+        # Names referenced by the profile are looked up in the other profiles without loading them
+        self.assertEqual([False, True, False], [p.is_loaded() for p in self.env.get_prioritized_profiles()])
+        self.assertEqual({"host": "local.com", "url": "https://base.com/local", "users": "https://base.com/base/users"},
+                         expanded)
+        full = self.env.get_snapshot()
+        self.assertEqual({prop.name: full.get_expanded_value(prop) for prop in full.get_profile(local.id).properties},
+                         expanded)
+
+        with self.env.lock:
+            local.find_property("host").value = "changed.com"
+            self.env.bump_version()
+        self.assertEqual("local.com", next(p.value for p in profile.properties if p.name == "host"))
+        profile = self.env.get_snapshot(local.id).get_profile(local.id)
+        self.assertEqual("changed.com", next(p.value for p in profile.properties if p.name == "host"))
+
+    def test_capacity_restored(self):
+        with self.env.lock:
+            # Profiles loaded one by one in the middle of a modification unload each other
+            for profile in self.env.get_prioritized_profiles():
+                self.assertEqual(3, len(profile.properties))
+                self.assertEqual(2, len(self.cache))
+
+            # Modified profiles can't be unloaded until they're persisted
+            for profile in self.env.get_prioritized_profiles():
+                profile.find_property("host").value = "changed.com"
+            self.env.bump_version()
+        self.assertEqual(3, len(self.cache))
+
+        self.persist(self.env)
+        self.cache.shrink()
+        self.assertEqual(2, len(self.cache))
+        chain = self.env.get_snapshot().get_property_chain("host")
+        self.assertEqual(["changed.com"] * 3, [prop.value for (_, prop) in chain])
+
+
+if __name__ == '__main__':
+    unittest.main()
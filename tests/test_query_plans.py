@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryPlansTest(unittest.TestCase):
+    """
+    Statements executed by the application mustn't scan whole tables to find the rows they filter, nor sort
+    the filtered rows (see benchmark/query_plans.py, run in a separate process as it changes the working directory)
+    """
+
+    def test_no_table_scans(self):
+        result = subprocess.run([sys.executable, "-m", "benchmark.query_plans"], cwd=ROOT_DIRECTORY,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual(0, result.returncode, result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
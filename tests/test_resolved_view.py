@@ -0,0 +1,133 @@
+import random
+import unittest
+
+from toolkit.core.model.context import Context
+from toolkit.core.model.resolved_view import ResolvedView
+
+
+def view_state(view: ResolvedView):
+    """
+    Returns comparable state of a view: property ids of every chain and id of every winner
+    """
+    chains = {name: [p.id for p in view.chain(name)] for name in view.names()}
+    winners = {p.name: p.id for p in view.winners()}
+    return chains, winners
+
+
+class ResolvedViewTest(unittest.TestCase):
+    """
+    View maintained incrementally by the environment has to match a view built from scratch after every change
+    """
+
+    def setUp(self):
+        self.env = Context().create_environment("test")
+        self.base = self.env.create_profile("base")
+        self.override = self.env.create_profile("override")
+        self.local = self.env.create_profile("local")
+        for (profile, names) in [(self.base, ["host", "port", "user"]), (self.override, ["host", "token"]),
+                                 (self.local, ["host", "port"])]:
+            for name in names:
+                profile.create_property(name, "{}-{}".format(profile.name, name))
+
+    def assert_matches_build(self):
+        built = ResolvedView.build(self.env.profiles)
+        self.assertEqual(view_state(built), view_state(self.env._resolved))
+
+    def test_initial_view(self):
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.base)
+
+    def test_reorder_profiles(self):
+        self.env.decrease_profile_priority(self.base.id)
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.override)
+
+        self.env.decrease_profile_priority(self.base.id)
+        self.env.increase_profile_priority(self.local.id)
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.local)
+
+    def test_toggle_profile(self):
+        self.base.enabled = False
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.override)
+        self.assertIs(self.env.get_first_property("port")[0], self.local)
+        self.assertIsNone(self.env.get_first_property("user"))
+
+        self.base.enabled = True
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("user")[0], self.base)
+
+    def test_toggle_property(self):
+        self.base.find_property("host").enabled = False
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.override)
+
+        self.base.find_property("host").enabled = True
+        self.assert_matches_build()
+
+    def test_rename_property(self):
+        self.base.find_property("host").name = "hostname"
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.override)
+
+        # Renamed to a name that is defined by a profile with lower priority only
+        self.local.find_property("port").name = "token"
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("token")[0], self.override)
+
+    def test_delete_property(self):
+        self.base.delete_property(self.base.find_property("host").id)
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.override)
+
+        self.base.delete_property(self.base.find_property("user").id)
+        self.assert_matches_build()
+        self.assertNotIn("user", self.env.get_property_names())
+
+    def test_delete_profile(self):
+        self.env.delete_profile(self.override.id)
+        self.assert_matches_build()
+        self.assertIsNone(self.env.get_first_property("token"))
+
+        self.env.delete_profile(self.base.id)
+        self.assert_matches_build()
+        self.assertIs(self.env.get_first_property("host")[0], self.local)
+
+    def test_random_changes(self):
+        rng = random.Random(1)
+        names = ["host", "port", "user", "token", "url"]
+        for step in range(500):
+            profile = rng.choice(self.env.profiles)
+            properties = profile.properties
+            operation = rng.randrange(8)
+            if operation == 0 and len(self.env.profiles) < 6:
+                self.env.create_profile("profile-{}".format(step), rng.random() < 0.7)
+            elif operation == 1 and len(self.env.profiles) > 1:
+                self.env.delete_profile(profile.id)
+            elif operation == 2:
+                if rng.random() < 0.5:
+                    self.env.increase_profile_priority(profile.id)
+                else:
+                    self.env.decrease_profile_priority(profile.id)
+            elif operation == 3:
+                profile.enabled = not profile.enabled
+            elif operation == 4:
+                name = rng.choice(names)
+                if profile.find_property(name) is None:
+                    profile.create_property(name, str(step))
+            elif len(properties) > 0:
+                prop = rng.choice(properties)
+                if operation == 5:
+                    profile.delete_property(prop.id)
+                elif operation == 6:
+                    prop.enabled = not prop.enabled
+                else:
+                    name = rng.choice(names)
+                    if profile.find_property(name) is None:
+                        prop.name = name
+            self.assert_matches_build()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+import random
+import unittest
+
+from toolkit.core.model.context import Context
+from toolkit.core.model.snapshot import EnvironmentSnapshot, ShardedMap, SortedNames, NAME_BLOCK_SIZE
+
+
+def snapshot_state(snapshot: EnvironmentSnapshot):
+    """
+    Returns comparable state of a snapshot: profiles with their properties, chains, winners and expanded values
+    """
+    profiles = []
+    expanded = {}
+    for profile in snapshot.get_prioritized_profiles():
+        properties = {}
+        for prop in profile.properties:
+            properties[prop.id] = (prop.name, prop.value, prop.type, prop.enabled, prop.profile_id)
+            expanded[prop.id] = snapshot.get_expanded_value(prop)
+        profile_page = [prop.id for prop in profile.get_properties_page()]
+        profiles.append((profile.id, profile.name, profile.priority, profile.enabled, properties,
+                         profile.property_count, profile_page))
+
+    names = sorted(snapshot.get_property_names())
+    chains = {name: [prop.id for (_, prop) in snapshot.get_property_chain(name, False)] for name in names}
+    winners = {}
+    for name in names:
+        winner = snapshot.get_first_property(name)
+        winners[name] = winner[1].id if winner is not None else None
+    page = [(profile.id, prop.id) for (profile, prop) in snapshot.get_resolved_page(enabled_only=False)]
+    return profiles, chains, winners, expanded, page
+
+
+def search_state(snapshot: EnvironmentSnapshot, queries):
+    """
+    Returns comparable results of searching given queries in all modes
+    """
+    results = []
+    for query in queries:
+        for prefix in (False, True):
+            for (names, values) in ((True, True), (True, False), (False, True)):
+                found = snapshot.search_properties(query, prefix, names, values)
+                results.append([(profile.id, prop.id, match, winner) for (profile, prop, match, winner) in found])
+    return results
+
+
+class SnapshotTest(unittest.TestCase):
+    """
+    Snapshot patched after every change has to match a snapshot built from scratch
+    """
+
+    def setUp(self):
+        self.env = Context().create_environment("test")
+        self.base = self.env.create_profile("base")
+        self.local = self.env.create_profile("local")
+        self.base.create_property("host", "example.com")
+        self.base.create_property("url", "https://{{host}}/{{path}}")
+        self.local.create_property("host", "localhost")
+        self.local.create_property("path", "api")
+        # Snapshot is patched once it's been published, sorted names once a page has been requested, search index
+        # is shared with the following snapshots once it's been searched
+        self.env.get_snapshot().get_resolved_page(limit=1)
+        self.env.get_snapshot().search_properties("host")
+        for profile in self.env.get_snapshot().get_prioritized_profiles():
+            profile.get_properties_page(limit=1)
+
+    def assert_matches_build(self):
+        self.env.bump_version()
+        patched = self.env.get_snapshot()
+        self.assertEqual(self.env.version, patched.version)
+        built = EnvironmentSnapshot.build(self.env)
+        self.assertEqual(snapshot_state(built), snapshot_state(patched))
+        queries = ["n1", "n", "x", "{{n", "host", "LOCAL", "api"]
+        self.assertEqual(search_state(built, queries), search_state(patched, queries))
+
+    def test_property_changes(self):
+        prop = self.local.create_property("port", "8080")
+        self.assert_matches_build()
+
+        prop.value = "{{host}}:80"
+        self.assert_matches_build()
+
+        prop.name = "address"
+        self.assert_matches_build()
+
+        prop.enabled = False
+        self.assert_matches_build()
+
+        self.local.delete_property(prop.id)
+        self.assert_matches_build()
+
+    def test_referenced_value_changes(self):
+        url = self.env.get_snapshot().get_first_property("url")[1]
+        self.assertEqual("https://example.com/api", self.env.get_snapshot().get_expanded_value(url))
+
+        self.base.find_property("host").value = "test.com"
+        self.assert_matches_build()
+        url = self.env.get_snapshot().get_first_property("url")[1]
+        self.assertEqual("https://test.com/api", self.env.get_snapshot().get_expanded_value(url))
+
+        self.local.find_property("path").name = "prefix"
+        self.assert_matches_build()
+
+    def test_profile_changes(self):
+        self.local.enabled = False
+        self.assert_matches_build()
+
+        self.env.increase_profile_priority(self.local.id)
+        self.assert_matches_build()
+
+        self.local.enabled = True
+        self.assert_matches_build()
+
+        self.local.name = "remote"
+        self.assert_matches_build()
+
+        extra = self.env.create_profile("extra")
+        extra.create_property("host", "extra")
+        extra.create_property("user", "{{host}}")
+        self.assert_matches_build()
+
+        self.env.delete_profile(self.base.id)
+        self.assert_matches_build()
+
+    def test_several_changes_per_version(self):
+        self.base.find_property("host").value = "{{path}}"
+        self.local.find_property("path").value = "v2"
+        self.env.decrease_profile_priority(self.base.id)
+        self.local.create_property("url", "{{host}}")
+        self.assert_matches_build()
+
+    def test_random_changes(self):
+        rnd = random.Random(1)
+        names = ["n{}".format(i) for i in range(10)]
+        profile_count = 2
+
+        def random_value():
+            return "".join(rnd.choice(["x", "{{" + rnd.choice(names) + "}}"]) for _ in range(rnd.randint(0, 2)))
+
+        for _ in range(300):
+            for _ in range(rnd.randint(1, 3)):
+                profiles = self.env.profiles
+                profile = rnd.choice(profiles)
+                name = rnd.choice(names)
+                prop = profile.find_property(name)
+                operation = rnd.randrange(9)
+                if operation == 0:
+                    profile_count += 1
+                    self.env.create_profile("p{}".format(profile_count))
+                elif operation == 1 and len(profiles) > 1:
+                    self.env.delete_profile(profile.id)
+                elif operation == 2:
+                    self.env.increase_profile_priority(profile.id)
+                elif operation == 3:
+                    profile.enabled = not profile.enabled
+                elif prop is None:
+                    profile.create_property(name, random_value())
+                elif operation == 4:
+                    prop.value = random_value()
+                elif operation == 5:
+                    prop.enabled = not prop.enabled
+                elif operation == 6:
+                    new_name = rnd.choice(names)
+                    if profile.find_property(new_name) is None:
+                        prop.name = new_name
+                else:
+                    profile.delete_property(prop.id)
+            self.assert_matches_build()
+
+
+class PersistentStructuresTest(unittest.TestCase):
+    """
+    Updated copies of the structures snapshots are made of have to match structures created from scratch,
+    while the originals stay unchanged
+    """
+
+    def test_sharded_map(self):
+        rnd = random.Random(1)
+        expected = {}
+        current = ShardedMap()
+        for _ in range(200):
+            changes = {rnd.randrange(3000): rnd.choice([None, "a", "b"]) for _ in range(rnd.randint(1, 50))}
+            previous = (current, dict(current.items()))
+            current = current.updated(changes)
+            for (key, value) in changes.items():
+                if value is None:
+                    expected.pop(key, None)
+                else:
+                    expected[key] = value
+            self.assertEqual(expected, dict(current.items()))
+            self.assertEqual(len(expected), len(current))
+            self.assertTrue(all(current.get(key) == value for (key, value) in expected.items()))
+            self.assertEqual(previous[1], dict(previous[0].items()))
+
+    def test_sorted_names(self):
+        rnd = random.Random(1)
+        expected = set()
+        current = SortedNames()
+        for _ in range(100):
+            added = {"n{}".format(rnd.randrange(3000)) for _ in range(rnd.randint(0, 100))}
+            removed = {"n{}".format(rnd.randrange(3000)) for _ in range(rnd.randint(0, 30))} - added
+            previous = (current, list(current.after()))
+            current = current.updated(added, removed)
+            expected = (expected | added) - removed
+            self.assertEqual(sorted(expected), list(current.after()))
+            self.assertEqual(previous[1], list(previous[0].after()))
+            self.assertTrue(all(len(block) <= 2 * NAME_BLOCK_SIZE for block in current._blocks))
+
+        names = sorted(expected)
+        for after in ["", "n1", names[0], names[len(names) // 2], names[-1], "z"]:
+            self.assertEqual([name for name in names if name > after], list(current.after(after)), after)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,415 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from toolkit.core.config import ConfigProperty
+from toolkit.core.model.profile import Profile
+from toolkit.core.model.profile_cache import PROFILE_EVICTIONS, PROFILE_LOADS
+from toolkit.core.sqlite.db_manager import DBManager
+from toolkit.core.toolkit import PostmanToolkit
+from toolkit.web import web
+from toolkit.web.response_cache import ResponseCache
+
+FLUSH_MAX_DELAY = ConfigProperty.FLUSH_MAX_DELAY
+PROFILE_CACHE_SIZE = ConfigProperty.PROFILE_CACHE_SIZE
+
+
+class WebTestCase(unittest.TestCase):
+    """
+    Runs the application on a new database in a temporary working directory
+    """
+
+    def setUp(self):
+        ConfigProperty.LOG_LEVEL = "WARNING"
+        self._directory = tempfile.TemporaryDirectory(prefix="postman-toolkit-test-")
+        self._working_directory = os.getcwd()
+        os.chdir(self._directory.name)
+        # Environment ids and versions of every database start from the same values, cached bodies mustn't be shared
+        web.response_cache = ResponseCache()
+        self.client = web.create_app().test_client()
+        self.toolkit = web.toolkit
+
+    def tearDown(self):
+        self.stop()
+        os.chdir(self._working_directory)
+        self._directory.cleanup()
+
+    def stop(self):
+        self.toolkit.shutdown()
+        PostmanToolkit.destroy()
+        web.toolkit = None
+        web.facade = None
+
+    def create_profile(self, name) -> int:
+        self.assertEqual(201, self.client.post("/api/profiles", json={"name": name}).status_code)
+        return next(p["id"] for p in self.client.get("/api/profiles").get_json()["content"] if p["name"] == name)
+
+    def create_property(self, profile_id, name, value) -> int:
+        response = self.client.put("/api/profiles/{}/config".format(profile_id), json={"name": name, "value": value})
+        self.assertEqual(201, response.status_code)
+        properties = self.client.get("/api/profiles/{}/config".format(profile_id)).get_json()["content"]
+        return next(p["id"] for p in properties if p["name"] == name)
+
+
+class RequestValidationTest(WebTestCase):
+    """
+    Bodies of unexpected types are rejected before the model is modified
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.profile_id = self.create_profile("base")
+        self.property_id = self.create_property(self.profile_id, "host", "example.com")
+
+    def test_invalid_property_bodies_rejected(self):
+        path = "/api/profiles/{}/config".format(self.profile_id)
+        for body in [[1, 2], "host", {"name": 5, "value": "x"}, {"name": "port", "value": [1, 2]},
+                     {"name": "port", "value": {"a": 1}}]:
+            self.assertEqual(422, self.client.put(path, json=body).status_code, body)
+
+        path = "/api/profiles/{}/config/{}".format(self.profile_id, self.property_id)
+        for body in [[1, 2], {"value": [1, 2]}, {"value": {"a": 1}}]:
+            self.assertEqual(422, self.client.post(path, json=body).status_code, body)
+        self.assertEqual(422, self.client.post(path + "/rename", json={"new_name": 5}).status_code)
+
+        for body in [[1, 2], {"name": 5}]:
+            self.assertEqual(422, self.client.post("/api/config/details", json=body).status_code, body)
+            self.assertEqual(422, self.client.post("/api/profiles", json=body).status_code, body)
+            self.assertEqual(422, self.client.post("/api/environments", json=body).status_code, body)
+
+    def test_environment_usable_after_rejected_bodies(self):
+        self.client.put("/api/profiles/{}/config".format(self.profile_id), json={"name": "port", "value": [1, 2]})
+        self.client.post("/api/profiles/{}/config/{}".format(self.profile_id, self.property_id), json={"value": [1]})
+        self.toolkit.persist_changes()
+
+        properties = self.client.get("/api/config").get_json()["content"]
+        self.assertEqual([("host", "example.com")], [(p["name"], p["value"]) for p in properties])
+        self.assertEqual(200, self.client.get("/api/search?q=host").status_code)
+        details = self.client.post("/api/config/details", json={"name": "host"}).get_json()["content"]
+        self.assertEqual("example.com", details["value"])
+
+
+class VersionedResponseTest(WebTestCase):
+    """
+    Responses carry the version of the environment as their ETag, only modifications change it
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.profile_id = self.create_profile("base")
+        self.property_id = self.create_property(self.profile_id, "host", "example.com")
+
+    def get_etag(self, path="/api/config"):
+        response = self.client.get(path)
+        self.assertEqual(200, response.status_code)
+        return response.headers["ETag"]
+
+    def test_not_modified(self):
+        for path in ["/api/config", "/api/profiles", "/api/profiles/{}/config".format(self.profile_id),
+                     "/api/postman/environment"]:
+            etag = self.get_etag(path)
+            response = self.client.get(path, headers={"If-None-Match": etag})
+            self.assertEqual(304, response.status_code, path)
+            self.assertEqual(etag, response.headers["ETag"])
+            self.assertEqual(b"", response.get_data())
+
+    def test_rejected_requests_keep_etag(self):
+        etag = self.get_etag()
+        self.assertEqual(404, self.client.put("/api/profiles/999/config", json={"name": "a", "value": "b"})
+                         .status_code)
+        self.assertEqual(400, self.client.put("/api/profiles/{}/config".format(self.profile_id),
+                                              json={"name": "host", "value": "b"}).status_code)
+        self.assertEqual(404, self.client.post("/api/profiles/{}/config/999".format(self.profile_id),
+                                               json={"value": "b"}).status_code)
+        self.assertEqual(422, self.client.post("/api/profiles/{}/config/bulk".format(self.profile_id),
+                                               json=[{"op": "delete", "name": "missing"}]).status_code)
+        self.assertEqual(200, self.client.post("/api/profiles/{}/up".format(self.profile_id)).status_code)
+        self.assertEqual(etag, self.get_etag())
+        self.assertEqual(304, self.client.get("/api/config", headers={"If-None-Match": etag}).status_code)
+
+    def test_modification_changes_etag(self):
+        etag = self.get_etag()
+        response = self.client.post("/api/profiles/{}/config/{}".format(self.profile_id, self.property_id),
+                                    json={"value": "test.com"})
+        self.assertEqual(200, response.status_code)
+
+        response = self.client.get("/api/config", headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers["ETag"])
+        self.assertEqual("test.com", response.get_json()["content"][0]["value"])
+
+
+class ChangeEventsTest(WebTestCase):
+    """
+    Change events are published once the changes are committed
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.profile_id = self.create_profile("base")
+        self.subscription = web.broadcaster.subscribe(self.toolkit.context.find_environment("default").id)
+
+    def tearDown(self):
+        web.broadcaster.unsubscribe(self.subscription)
+        super().tearDown()
+
+    def count_rows(self):
+        with DBManager.connection() as db:
+            return db.execute("select count(*) from property").fetchone()[0]
+
+    def test_event_published_after_commit(self):
+        self.client.put("/api/profiles/{}/config".format(self.profile_id), json={"name": "host", "value": "a"})
+        event = self.subscription.next(0)
+        self.assertEqual(("property_created", ["host"]), (event["type"], event["names"]))
+        self.assertEqual(1, self.count_rows())
+
+    def test_event_published_by_flusher(self):
+        ConfigProperty.FLUSH_MAX_DELAY = 60000
+        try:
+            self.toolkit.start_write_behind()
+        finally:
+            ConfigProperty.FLUSH_MAX_DELAY = FLUSH_MAX_DELAY
+        self.client.put("/api/profiles/{}/config".format(self.profile_id), json={"name": "host", "value": "a"})
+        self.assertIsNone(self.subscription.next(0.1))
+        self.assertEqual(0, self.count_rows())
+
+        # Stopping the flusher persists the pending changes
+        self.toolkit.shutdown()
+        event = self.subscription.next(0)
+        self.assertEqual(("property_created", ["host"]), (event["type"], event["names"]))
+        self.assertEqual(1, self.count_rows())
+
+
+class BulkOperationsTest(WebTestCase):
+    """
+    Bulk operations are applied entirely or not at all
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.profile_id = self.create_profile("base")
+        self.create_property(self.profile_id, "host", "example.com")
+        self.create_property(self.profile_id, "port", "80")
+        self.path = "/api/profiles/{}/config/bulk".format(self.profile_id)
+
+    def get_properties(self):
+        properties = self.client.get("/api/profiles/{}/config".format(self.profile_id)).get_json()["content"]
+        return {p["name"]: p["value"] for p in properties}
+
+    def test_invalid_operations_rejected(self):
+        for operations in [[{"op": "create", "name": "ok1"}, {"op": "create", "name": 5}],
+                           [{"op": "create", "name": "ok1"}, {"op": "update", "name": "host", "value": [1, 2]}],
+                           [{"op": "create", "name": "ok1"}, {"op": "create", "name": "ok2", "value": {"a": 1}}],
+                           [{"op": "create", "name": "ok1"}, "delete"],
+                           [{"op": "create", "name": "ok1"}, {"op": "delete", "name": "missing"}]]:
+            response = self.client.post(self.path, json=operations)
+            self.assertEqual(422, response.status_code, operations)
+            results = response.get_json()["content"]["results"]
+            self.assertEqual("ok", results[0]["status"])
+            self.assertEqual("error", results[-1]["status"])
+        self.assertEqual({"host": "example.com", "port": "80"}, self.get_properties())
+        self.assertTrue(self.toolkit.context.find_environment("default").journal.is_empty())
+
+    def test_operations_applied(self):
+        response = self.client.post(self.path, json=[{"op": "create", "name": "user", "value": "admin"},
+                                                     {"op": "update", "name": "port", "value": 8080},
+                                                     {"op": "delete", "name": "host"},
+                                                     {"op": "create", "name": "host", "value": None}])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"user": "admin", "port": "8080", "host": ""}, self.get_properties())
+
+    def test_failed_operation_reverts_applied_ones(self):
+        create_property = Profile.create_property
+        calls = []
+
+        def failing_create_property(profile, name, value):
+            calls.append(name)
+            if len(calls) > 1:
+                raise Exception("Simulated failure")
+            return create_property(profile, name, value)
+
+        operations = [{"op": "create", "name": "user", "value": "admin"},
+                      {"op": "update", "name": "port", "value": "8080"},
+                      {"op": "delete", "name": "host"},
+                      {"op": "create", "name": "other", "value": "x"}]
+        with mock.patch.object(Profile, "create_property", failing_create_property):
+            try:
+                response = self.client.post(self.path, json=operations)
+                self.assertEqual(500, response.status_code)
+            except Exception as e:
+                self.assertEqual("Simulated failure", str(e))
+
+        self.assertEqual(["user", "other"], calls)
+        self.assertEqual({"host": "example.com", "port": "80"}, self.get_properties())
+        self.toolkit.persist_changes()
+        self.assertEqual({"host": "example.com", "port": "80"}, self.get_properties())
+
+
+class MetricsTest(WebTestCase):
+    """
+    Requests and the SQL statements they execute are counted on /metrics
+    """
+
+    def get_metric(self, series) -> float:
+        response = self.client.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        for line in response.get_data(as_text=True).splitlines():
+            if line.startswith(series + " "):
+                return float(line[len(series) + 1:])
+        return 0
+
+    def test_request_counted(self):
+        requests = 'toolkit_http_request_duration_seconds_count{endpoint="/api/profiles/<id>/config",method="PUT",' \
+                   'status="201"}'
+        inserts = 'toolkit_sql_queries_total{operation="insert",table="property"}'
+        queries = 'toolkit_http_request_queries_count{endpoint="/api/profiles/<id>/config"}'
+        profile_id = self.create_profile("base")
+        before = [self.get_metric(series) for series in (requests, inserts, queries)]
+
+        self.create_property(profile_id, "host", "example.com")
+        after = [self.get_metric(series) for series in (requests, inserts, queries)]
+        # Property is listed after it's created, i.e. two requests to the endpoint
+        self.assertEqual([1, 1, 2], [a - b for (a, b) in zip(after, before)])
+
+
+class SearchAfterWritesTest(WebTestCase):
+    """
+    Search results follow modifications of properties and profiles
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.base_id = self.create_profile("base")
+        self.host_id = self.create_property(self.base_id, "host", "example.com")
+        self.create_property(self.base_id, "port", "80")
+        self.local_id = self.create_profile("local")
+
+    def search(self, query, path="/api/search"):
+        response = self.client.get("{}?q={}".format(path, query))
+        self.assertEqual(200, response.status_code)
+        return [(p["name"], p["value"], p["profileName"], p["winner"]) for p in response.get_json()["content"]]
+
+    def test_property_modifications_found(self):
+        self.assertEqual([("host", "example.com", "base", True)], self.search("example"))
+
+        # Profiles created later have lower priority
+        self.create_property(self.local_id, "host", "localhost")
+        self.assertEqual([("host", "example.com", "base", True), ("host", "localhost", "local", False)],
+                         self.search("host"))
+
+        response = self.client.post("/api/profiles/{}/config/{}".format(self.base_id, self.host_id),
+                                    json={"value": "changed.org"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], self.search("example"))
+        self.assertEqual([("host", "changed.org", "base", True)], self.search("changed"))
+
+        response = self.client.post("/api/profiles/{}/config/{}/rename".format(self.base_id, self.host_id),
+                                    json={"new_name": "server"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([("server", "changed.org", "base", True)], self.search("serv"))
+        self.assertEqual([("host", "localhost", "local", True)], self.search("host"))
+
+        response = self.client.delete("/api/profiles/{}/config/{}".format(self.base_id, self.host_id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], self.search("serv"))
+        self.assertEqual([("port", "80", "base", True)], self.search("port"))
+
+    def test_profile_modifications_found(self):
+        self.create_property(self.local_id, "port", "8080")
+        self.assertEqual([("port", "8080", "local", False)], self.search("port", "/api/profiles/{}/search".format(
+            self.local_id)))
+
+        self.assertEqual(200, self.client.post("/api/profiles/{}/deactivate".format(self.base_id)).status_code)
+        self.assertEqual([("port", "8080", "local", True), ("port", "80", "base", False)], self.search("port"))
+
+        self.assertEqual(204, self.client.delete("/api/profiles/{}".format(self.local_id)).status_code)
+        self.assertEqual([("port", "80", "base", False)], self.search("port"))
+        self.assertEqual([], self.search("8080"))
+
+
+class LazySearchAfterWritesTest(SearchAfterWritesTest):
+    """
+    Search results follow modifications with PROFILE_CACHE_SIZE set, i.e. with profiles loaded on demand
+    """
+
+    def setUp(self):
+        ConfigProperty.PROFILE_CACHE_SIZE = 1
+        try:
+            super().setUp()
+        finally:
+            ConfigProperty.PROFILE_CACHE_SIZE = PROFILE_CACHE_SIZE
+        self.assertIsNotNone(self.toolkit.profile_cache)
+
+
+class LazyLoadingTest(WebTestCase):
+    """
+    With PROFILE_CACHE_SIZE set, requests scoped to a profile load that profile only and the cache stays
+    within its capacity
+    """
+
+    def setUp(self):
+        super().setUp()
+        env = self.toolkit.context.find_environment("default")
+        with env.lock:
+            for i in range(20):
+                profile = env.create_profile("profile{}".format(i))
+                profile.create_property("host", "{}.com".format(i))
+                profile.create_property("url", "https://{{host}}/" + str(i))
+                for j in range(5):
+                    profile.create_property("p{}".format(j), str(j))
+        self.toolkit.persist_changes()
+        self.profile_ids = [p.id for p in env.get_prioritized_profiles()]
+
+        self.stop()
+        ConfigProperty.PROFILE_CACHE_SIZE = 2
+        try:
+            self.client = web.create_app().test_client()
+        finally:
+            ConfigProperty.PROFILE_CACHE_SIZE = PROFILE_CACHE_SIZE
+        self.toolkit = web.toolkit
+        (self.loads, self.evictions) = (PROFILE_LOADS.get(), PROFILE_EVICTIONS.get())
+
+    def assert_counts(self, loads, evictions):
+        self.assertEqual(loads, PROFILE_LOADS.get() - self.loads)
+        self.assertEqual(evictions, PROFILE_EVICTIONS.get() - self.evictions)
+        self.assertLessEqual(len(self.toolkit.profile_cache), 2)
+
+    def get_properties(self, profile_id, query=""):
+        response = self.client.get("/api/profiles/{}/config{}".format(profile_id, query))
+        self.assertEqual(200, response.status_code)
+        return response.get_json()["content"]
+
+    def test_profile_read_loads_profile_only(self):
+        properties = self.get_properties(self.profile_ids[-1], "?limit=5")
+        self.assertEqual(["host", "p0", "p1", "p2", "p3"], [p["name"] for p in properties])
+        self.assert_counts(1, 0)
+
+        # Referenced host is resolved by the profile with the highest priority, which isn't loaded
+        properties = self.get_properties(self.profile_ids[-1], "?cursor=p4")
+        self.assertEqual([("url", "https://0.com/19")], [(p["name"], p["expandedValue"]) for p in properties])
+        self.assert_counts(1, 0)
+
+        for profile_id in self.profile_ids[:5]:
+            self.assertEqual(7, len(self.get_properties(profile_id)))
+        self.assert_counts(6, 4)
+
+    def test_profile_write_loads_profile_only(self):
+        for (i, profile_id) in enumerate(self.profile_ids[:5]):
+            response = self.client.put("/api/profiles/{}/config".format(profile_id), json={"name": "user",
+                                                                                          "value": str(i)})
+            self.assertEqual(201, response.status_code)
+        self.assert_counts(5, 3)
+
+        self.assertEqual([("user", "4")], [(p["name"], p["value"]) for p in self.get_properties(
+            self.profile_ids[4], "?cursor=url")])
+        self.assert_counts(5, 3)
+        resolved = {p["name"]: p["expandedValue"] for p in self.client.get("/api/config").get_json()["content"]}
+        self.assertEqual({"host": "0.com", "url": "https://0.com/0", "user": "0", "p0": "0", "p1": "1", "p2": "2",
+                          "p3": "3", "p4": "4"}, resolved)
+        # Reading the whole environment doesn't go through the cache
+        self.assert_counts(5, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
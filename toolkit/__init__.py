@@ -1,4 +1,4 @@
-from toolkit.web.web import run_web
-
 def run():
-    run_web()
\ No newline at end of file
+    # Importing the package (or the web module) has no side effects, the model is loaded by run_web
+    from toolkit.web.web import run_web
+    run_web()
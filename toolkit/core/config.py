@@ -11,6 +11,22 @@ class ConfigProperty:
     SERVER_HOST = os.environ["SERVER_HOST"] if "SERVER_HOST" in os.environ else "localhost"
     SERVER_PORT = os.environ["SERVER_PORT"] if "SERVER_PORT" in os.environ else "8881"
     DEBUG = True if "DEBUG" in os.environ else False
+    # DEBUG, INFO, WARNING or ERROR
+    LOG_LEVEL = os.environ["LOG_LEVEL"] if "LOG_LEVEL" in os.environ else ("DEBUG" if DEBUG else "INFO")
+    # Number of worker processes serving the API, 1 runs the development server in the current process
+    SERVER_WORKERS = int(os.environ["SERVER_WORKERS"]) if "SERVER_WORKERS" in os.environ else 1
+    # "sync" - changes are committed before the response is sent, "write-behind" - changes are committed in background
+    PERSISTENCE_MODE = os.environ["PERSISTENCE_MODE"] if "PERSISTENCE_MODE" in os.environ else "sync"
+    FLUSH_MAX_DELAY = int(os.environ["FLUSH_MAX_DELAY"]) if "FLUSH_MAX_DELAY" in os.environ else 200
+    FLUSH_MAX_BATCH = int(os.environ["FLUSH_MAX_BATCH"]) if "FLUSH_MAX_BATCH" in os.environ else 100
+    # Number of profiles whose properties are kept in memory, 0 loads all properties at startup
+    PROFILE_CACHE_SIZE = int(os.environ["PROFILE_CACHE_SIZE"]) if "PROFILE_CACHE_SIZE" in os.environ else 0
+    DB_POOL_SIZE = int(os.environ["DB_POOL_SIZE"]) if "DB_POOL_SIZE" in os.environ else 8
+    DB_STATEMENT_CACHE_SIZE = int(os.environ["DB_STATEMENT_CACHE_SIZE"]) if "DB_STATEMENT_CACHE_SIZE" in os.environ else 512
+    DB_SYNCHRONOUS = os.environ["DB_SYNCHRONOUS"] if "DB_SYNCHRONOUS" in os.environ else "NORMAL"
+    # Negative value is the cache size in KiB, positive - in pages
+    DB_CACHE_SIZE = int(os.environ["DB_CACHE_SIZE"]) if "DB_CACHE_SIZE" in os.environ else -32768
+    DB_MMAP_SIZE = int(os.environ["DB_MMAP_SIZE"]) if "DB_MMAP_SIZE" in os.environ else 268435456
 
     def get_value(self) -> str:
         return config_instance[self.name] if self.name in config_instance else None
@@ -54,7 +70,7 @@ class Configuration:
         for prop in ConfigProperty:
             if prop.name not in config:
                 missing.append(prop)
-                Log.i("adding missing property %s to config file" % prop.name)
+                Log.i("adding missing property {} to config file", prop.name)
 
         # Add missing properties to config file
         f = open(config_file, "a")
@@ -1,19 +1,87 @@
+import logging
+import sys
+
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR
+}
+_LEVEL_TAGS = {
+    logging.DEBUG: "d",
+    logging.INFO: "i",
+    logging.WARNING: "w",
+    logging.ERROR: "e"
+}
+
+
+class _Message:
+    """
+    Message formatted only when a handler actually emits it
+    """
+    __slots__ = ("_format", "_args")
+
+    def __init__(self, fmt, args):
+        self._format = fmt
+        self._args = args
+
+    def __str__(self):
+        return self._format.format(*self._args) if len(self._args) > 0 else self._format
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        return "[{}] {}".format(_LEVEL_TAGS.get(record.levelno, "?"), record.getMessage())
+
+
 class Log:
-    debug = False
+    """
+    Leveled logging of the toolkit. Messages use str.format placeholders and are formatted lazily,
+    calls below the current level cost only a comparison:
+        Log.d("Executing {} insert(s) for table {}", count, table)
+    """
+    level = logging.INFO
+    _logger = logging.getLogger("postman-toolkit")
+
+    @staticmethod
+    def configure(level_name):
+        """
+        :param level_name: one of LEVELS
+        """
+        level = LEVELS.get(level_name.upper())
+        if level is None:
+            raise Exception("Invalid log level {}".format(level_name))
+
+        if len(Log._logger.handlers) == 0:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(_Formatter())
+            Log._logger.addHandler(handler)
+            Log._logger.propagate = False
+        Log._logger.setLevel(level)
+        Log.level = level
 
     @staticmethod
-    def i(msg: str):
-        print("[i] %s" % msg)
+    def is_debug() -> bool:
+        return Log.level <= logging.DEBUG
 
     @staticmethod
-    def w(msg: str):
-        print("[w] %s" % msg)
+    def i(msg: str, *args):
+        if Log.level <= logging.INFO:
+            Log._logger.info(_Message(msg, args))
 
     @staticmethod
-    def e(msg: str):
-        print("[e] %s" % msg)
+    def w(msg: str, *args):
+        if Log.level <= logging.WARNING:
+            Log._logger.warning(_Message(msg, args))
 
     @staticmethod
-    def d(msg: str):
-        if Log.debug:
-            print("[d] %s" % msg)
+    def e(msg: str, *args):
+        Log._logger.error(_Message(msg, args))
+
+    @staticmethod
+    def d(msg: str, *args):
+        if Log.level <= logging.DEBUG:
+            Log._logger.debug(_Message(msg, args))
+
+
+Log.configure("INFO")
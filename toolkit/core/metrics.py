@@ -0,0 +1,222 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Dict, Tuple, List
+
+# Upper bounds (in seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of histogram buckets of counts, e.g. queries per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+
+
+class _Metric:
+    name: str
+    help: str
+    label_names: Tuple[str, ...]
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _format_labels(self, labels: Tuple, extra: str = None) -> str:
+        parts = ['{}="{}"'.format(name, _escape(value)) for (name, value) in zip(self.label_names, labels)]
+        if extra is not None:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if len(parts) > 0 else ""
+
+
+class Counter(_Metric):
+    _values: Dict[Tuple, float]
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self._values = {}
+
+    def inc(self, amount=1, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        with self._lock:
+            values = list(self._values.items())
+        for (labels, value) in values:
+            lines.append("{}{} {}".format(self.name, self._format_labels(labels), _format_number(value)))
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    Histogram with fixed buckets. Observation is a bisection and three increments under a lock,
+    cumulative counts are computed only when the histogram is rendered.
+    """
+    buckets: Tuple[float, ...]
+    # Per label values: counts of every bucket (the last one is +Inf), sum and count of observations
+    _series: Dict[Tuple, List]
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, labels: Tuple = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[labels] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get_count(self, labels: Tuple = ()) -> int:
+        series = self._series.get(labels)
+        return series[2] if series is not None else 0
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            series = [(labels, list(counts), total, count) for (labels, (counts, total, count)) in self._series.items()]
+        for (labels, counts, total, count) in series:
+            cumulative = 0
+            for (bound, bucket_count) in zip(self.buckets + (None,), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format(_format_number(bound) if bound is not None else "+Inf")
+                lines.append("{}_bucket{} {}".format(self.name, self._format_labels(labels, le), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, self._format_labels(labels), _format_number(total)))
+            lines.append("{}_count{} {}".format(self.name, self._format_labels(labels), count))
+        return lines
+
+
+class _RequestStats:
+    queries: int
+    rows_read: int
+    rows_written: int
+
+    def __init__(self):
+        self.queries = 0
+        self.rows_read = 0
+        self.rows_written = 0
+
+
+class Metrics:
+    """
+    Process-wide metrics of the toolkit, rendered in Prometheus text format. SQL statistics are additionally
+    accumulated per request of the current thread (see start_request).
+    """
+    _metrics: List[_Metric] = []
+    _local = threading.local()
+
+    @staticmethod
+    def counter(name, help_text, label_names=()) -> Counter:
+        counter = Counter(name, help_text, label_names)
+        Metrics._metrics.append(counter)
+        return counter
+
+    @staticmethod
+    def histogram(name, help_text, label_names=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, help_text, label_names, buckets)
+        Metrics._metrics.append(histogram)
+        return histogram
+
+    @staticmethod
+    def render() -> str:
+        lines = []
+        for metric in Metrics._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def start_request():
+        Metrics._local.stats = _RequestStats()
+
+    @staticmethod
+    def finish_request() -> _RequestStats:
+        """
+        :return: SQL statistics of the request started by the current thread
+        """
+        stats = getattr(Metrics._local, "stats", None)
+        Metrics._local.stats = None
+        return stats if stats is not None else _RequestStats()
+
+    @staticmethod
+    def record_query(operation, table, duration, rows_read=0, rows_written=0):
+        """
+        :param operation: select, insert, update or delete
+        :param duration: execution time in seconds
+        """
+        labels = (operation, table)
+        SQL_QUERIES.inc(1, labels)
+        SQL_QUERY_DURATION.observe(duration, labels)
+        if rows_read > 0:
+            SQL_ROWS_READ.inc(rows_read, (table,))
+        if rows_written > 0:
+            SQL_ROWS_WRITTEN.inc(rows_written, labels)
+
+        stats = getattr(Metrics._local, "stats", None)
+        if stats is not None:
+            stats.queries += 1
+            stats.rows_read += rows_read
+            stats.rows_written += rows_written
+
+
+def timed_methods(histogram: Histogram):
+    """
+    Class decorator observing duration of every public method in given histogram, labeled by method name
+    """
+    def _decorator(cls):
+        for (name, member) in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(member):
+                continue
+            setattr(cls, name, _timed(member, histogram, (name,)))
+        return cls
+    return _decorator
+
+
+def _timed(function, histogram: Histogram, labels: Tuple):
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, labels)
+    return _wrapper
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+HTTP_REQUEST_DURATION = Metrics.histogram(
+    "toolkit_http_request_duration_seconds", "Duration of HTTP requests, including streamed bodies (except event streams)",
+    ("endpoint", "method", "status"))
+HTTP_REQUEST_QUERIES = Metrics.histogram(
+    "toolkit_http_request_queries", "Number of SQL queries executed by a single HTTP request", ("endpoint",),
+    COUNT_BUCKETS)
+RESPONSE_SERIALIZATION_DURATION = Metrics.histogram(
+    "toolkit_response_serialization_duration_seconds", "Duration of JSON serialization of response bodies",
+    ("endpoint",))
+FACADE_CALL_DURATION = Metrics.histogram(
+    "toolkit_facade_call_duration_seconds", "Duration of WebFacade calls, i.e. resolution and modification",
+    ("method",))
+SQL_QUERIES = Metrics.counter("toolkit_sql_queries_total", "Number of executed SQL statements", ("operation", "table"))
+SQL_QUERY_DURATION = Metrics.histogram(
+    "toolkit_sql_query_duration_seconds", "Duration of SQL statements, reads include fetching of the rows",
+    ("operation", "table"))
+SQL_ROWS_READ = Metrics.counter("toolkit_sql_rows_read_total", "Number of rows read from the database", ("table",))
+SQL_ROWS_WRITTEN = Metrics.counter(
+    "toolkit_sql_rows_written_total", "Number of rows inserted, updated or deleted", ("operation", "table"))
+SQL_COMMIT_DURATION = Metrics.histogram("toolkit_sql_commit_duration_seconds", "Duration of transaction commits")
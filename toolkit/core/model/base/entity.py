@@ -1,27 +1,75 @@
 from abc import *
 from typing import *
 
-
-class PendingEntityBuffer:
-    deleted_entities: List = []
+from .unit_of_work import UnitOfWork
 
 
 class Entity:
+    """
+    Base of the model classes. Entities are slotted, databases with hundreds of thousands of properties
+    are kept in memory.
+    """
+    __slots__ = ("dirty", "new", "_journal")
+    # Columns that never change once the row is inserted, they're left out of update queries
+    IMMUTABLE_COLUMNS = ()
+
     dirty: bool
     new: bool
+    _journal: Optional[UnitOfWork]
 
     def __init__(self):
         self.dirty = False
         self.new = False
+        self._journal = None
 
     def mark_dirty(self):
+        if not self.dirty and self._journal is not None:
+            self._journal.register_dirty(self)
         self.dirty = True
 
     def mark_new(self):
         self.new = True
+        if self._journal is not None:
+            self._journal.register_new(self)
 
     def mark_deleted(self):
-        PendingEntityBuffer.deleted_entities.append(self)
+        if self._journal is not None:
+            self._journal.register_deleted(self)
+
+    def mark_persisted(self):
+        """
+        Called once changes of this entity are committed
+        """
+        self.new = False
+        self.dirty = False
+
+    def get_unchanged_columns(self) -> Tuple:
+        """
+        Returns columns that haven't changed since the entity was loaded or persisted, they may be left out
+        of the update query
+        """
+        return ()
+
+    def bind_journal(self, journal: UnitOfWork):
+        """
+        Attaches this entity to the journal of its context and registers changes made before attaching
+        """
+        self._journal = journal
+        if self.new:
+            journal.register_new(self)
+        elif self.dirty:
+            journal.register_dirty(self)
+
+    @abstractmethod
+    def is_attached(self) -> bool:
+        """
+        Returns whether this entity is still a part of the context (none of its parents were removed)
+        """
+        pass
+
+    @abstractmethod
+    def assign_id(self, _id):
+        pass
 
     @abstractmethod
     def serialize(self) -> Dict:
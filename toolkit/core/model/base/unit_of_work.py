@@ -0,0 +1,93 @@
+import threading
+from typing import Callable, Dict, Optional
+
+# Number of ids reserved at once by an allocator with a reservation function
+ID_BLOCK_SIZE = 100
+
+
+class IdAllocator:
+    """
+    Source of ids of new entities, one sequence per table. Allocator can be shared by journals used
+    from different threads. With a reservation function, ids are handed out from blocks reserved in the database,
+    so an id is final as soon as it's allocated, even if other processes insert rows into the same table.
+    """
+    _next_ids: Dict[str, int]
+    # First id following the reserved block of every table
+    _limits: Dict[str, int]
+    _reserve: Optional[Callable[[str, int], int]]
+
+    def __init__(self, reserve: Callable[[str, int], int] = None, block_size=ID_BLOCK_SIZE):
+        """
+        :param reserve: function reserving given number of ids of a table, returns the first of them
+        """
+        self._next_ids = {}
+        self._limits = {}
+        self._reserve = reserve
+        self._block_size = block_size
+        self._lock = threading.Lock()
+
+    def allocate(self, table) -> int:
+        with self._lock:
+            _id = self._next_ids.get(table, 1)
+            if self._reserve is not None and _id >= self._limits.get(table, 0):
+                _id = self._reserve(table, self._block_size)
+                self._limits[table] = _id + self._block_size
+            self._next_ids[table] = _id + 1
+            return _id
+
+
+class UnitOfWork:
+    """
+    Journal of entities that were created, modified or deleted since the last flush. Entities register themselves
+    when they're marked, every entity is registered at most once per flush.
+    New entities get their final ids from the journal as soon as they're registered, so they can be referenced
+    (and returned to clients) before they're persisted.
+    """
+    new_entities: Dict
+    dirty_entities: Dict
+    deleted_entities: Dict
+    ids: IdAllocator
+
+    def __init__(self, ids: IdAllocator = None):
+        """
+        :param ids: id allocator shared with other journals of the same database
+        """
+        # Dicts are used as insertion-ordered sets
+        self.new_entities = {}
+        self.dirty_entities = {}
+        self.deleted_entities = {}
+        self.ids = ids if ids is not None else IdAllocator()
+
+    def allocate_id(self, table) -> int:
+        return self.ids.allocate(table)
+
+    def register_new(self, entity):
+        if entity.id <= 0:
+            entity.assign_id(self.allocate_id(entity.TABLE))
+        self.new_entities[entity] = None
+
+    def register_dirty(self, entity):
+        if entity not in self.new_entities:
+            self.dirty_entities[entity] = None
+
+    def register_deleted(self, entity):
+        self.dirty_entities.pop(entity, None)
+        if entity in self.new_entities:
+            # Entity was never persisted, there's nothing to delete
+            del self.new_entities[entity]
+            return
+        self.deleted_entities[entity] = None
+
+    def unregister_deleted(self, entity):
+        """
+        Cancels deletion of an entity that has been added back, changes made before it was deleted are kept
+        """
+        self.deleted_entities.pop(entity, None)
+
+    def is_empty(self) -> bool:
+        return len(self.new_entities) == 0 and len(self.dirty_entities) == 0 and len(self.deleted_entities) == 0
+
+    def clear(self):
+        self.new_entities.clear()
+        self.dirty_entities.clear()
+        self.deleted_entities.clear()
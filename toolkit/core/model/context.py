@@ -1,20 +1,106 @@
 from .environment import *
+from .base.unit_of_work import UnitOfWork, IdAllocator
 
 
 class Context:
+    """
+    Registry of environments. Changes of the environments themselves are recorded in the journal of the context,
+    changes of their profiles and properties in the journal of every environment.
+    List of environments is replaced on every change, so it can be iterated without locking.
+    """
     environments: List[Environment]
+    _environments_by_id: Dict[int, Environment]
+    _environments_by_name: Dict[str, Environment]
+    ids: IdAllocator
+    journal: UnitOfWork
+
+    def __init__(self, ids: IdAllocator = None):
+        """
+        :param ids: allocator of ids of new entities, shared by the journals of all environments
+        """
+        self.ids = ids if ids is not None else IdAllocator()
+        self.journal = UnitOfWork(self.ids)
+        self.environments = []
+        self._environments_by_id = {}
+        self._environments_by_name = {}
 
     def create_environment(self, name) -> Environment:
-        existing = self.find_environment(name)
-        if existing is not None:
-            raise Exception("Environemnt {} already exists".format(name))
+        self.ensure_environment_name_available(name)
 
         env = Environment.create(name)
-        self.environments.append(env)
+        self.attach_environment(env)
         return env
 
-    def get_environment(self, _id):
-        return next((x for x in self.environments if x.id == _id), None)
+    def attach_environment(self, env: Environment):
+        """
+        Adds an already created (or loaded) environment to this context
+        """
+        if env.name in self._environments_by_name:
+            raise Exception("Inconsistency detected: there is more environments with name {}".format(env.name))
+
+        self._bind_environment(env)
+        self.environments = self.environments + [env]
+        self._environments_by_id[env.id] = env
+        self._environments_by_name[env.name] = env
+
+    def replace_environment(self, old: Environment, new: Environment):
+        """
+        Replaces an environment with its newer copy (e.g. reloaded after another process has modified it),
+        the old environment is detached without being deleted
+        """
+        if self._environments_by_name.get(new.name, old) is not old:
+            raise Exception("Inconsistency detected: there is more environments with name {}".format(new.name))
+
+        self._bind_environment(new)
+        self.environments = [new if e is old else e for e in self.environments]
+        self._unindex_environment(old)
+        self._environments_by_id[new.id] = new
+        self._environments_by_name[new.name] = new
+        old._context = None
+
+    def detach_environment(self, env: Environment):
+        """
+        Removes an environment from this context without deleting it
+        """
+        self.environments = [e for e in self.environments if e is not env]
+        self._unindex_environment(env)
+        env._context = None
+
+    def delete_environment(self, name) -> bool:
+        env = self._environments_by_name.get(name)
+        if env is None:
+            return False
+
+        self.detach_environment(env)
+        env.mark_deleted()
+        return True
+
+    def get_environment(self, _id) -> Optional[Environment]:
+        return self._environments_by_id.get(int(_id))
+
+    def find_environment(self, name) -> Optional[Environment]:
+        return self._environments_by_name.get(name)
+
+    def ensure_environment_name_available(self, name):
+        if name in self._environments_by_name:
+            raise Exception("Environemnt {} already exists".format(name))
+
+    def _bind_environment(self, env: Environment):
+        env._context = self
+        env.journal = UnitOfWork(self.ids)
+        env.bind_journal(self.journal)
+
+    def _unindex_environment(self, env: Environment):
+        if self._environments_by_id.get(env.id) is env:
+            del self._environments_by_id[env.id]
+        if self._environments_by_name.get(env.name) is env:
+            del self._environments_by_name[env.name]
+
+    def on_environment_id_assigned(self, env: Environment, old_id):
+        if self._environments_by_id.get(old_id) is env:
+            del self._environments_by_id[old_id]
+        self._environments_by_id[env.id] = env
 
-    def find_environment(self, name):
-        return next((x for x in self.environments if x.name == name), None)
+    def on_environment_renamed(self, env: Environment, old_name):
+        del self._environments_by_name[old_name]
+        self._environments_by_name[env.name] = env
@@ -1,40 +1,173 @@
-from typing import List, Dict, Tuple, Optional
+import threading
+import weakref
+from typing import List, Dict, Tuple, Optional, Set
 
 from .base.entity import Entity
+from .base.unit_of_work import UnitOfWork
+from .interpolation import Interpolator
 from .profile import Profile
+from .profile_cache import ProfileCache
 from .property import Property
+from .resolved_view import ResolvedView
+from .snapshot import EnvironmentSnapshot, PartialSnapshot, ProfileSnapshot
 
 
 START_PROFILE_PRIORITY = 1
 
 
 class Environment(Entity):
+    TABLE = "environment"
+    COLUMNS = ("id", "name")
+    __slots__ = ("_id", "_name", "profiles", "version", "lock", "journal", "_profiles_by_id", "_profiles_by_name",
+                 "_context", "_interpolator", "_resolved", "_indexed", "_indexing", "_profile_cache", "_modified",
+                 "_snapshot", "_snapshot_ref", "_changed_profiles", "_changed_properties", "_changed_names",
+                 "_changed_winners")
+
     _id: int
     _name: str
 
     profiles: List[Profile]
+    version: int
+    lock: threading.RLock
+    journal: Optional[UnitOfWork]
+    _profiles_by_id: Dict[int, Profile]
+    _profiles_by_name: Dict[str, Profile]
+
+    # Whether the resolved view covers all profiles. Environment whose profiles are loaded lazily isn't indexed,
+    # unless the resolved view is requested (see _ensure_indexed), reads are served without it.
+    _indexed: bool
+    _indexing: bool
+    _profile_cache: Optional[ProfileCache]
+
+    # Whether profiles or properties have changed since the version was last bumped
+    _modified: bool
+    _snapshot: Optional[EnvironmentSnapshot]
+    # Snapshot of an environment whose profiles are loaded lazily, it's kept only while it's being read
+    _snapshot_ref: Optional[weakref.ref]
+    # Changes made since the last snapshot was published, they're recorded only once there is a snapshot.
+    # Only the changed profiles are recorded in lazy loading mode, their snapshots are published one by one.
+    _changed_profiles: Set[int]
+    _changed_properties: Set[Tuple[int, int]]
+    _changed_names: Set[str]
+    _changed_winners: Set[str]
 
     def __init__(self):
         super().__init__()
         self.profiles = []
+        self.version = 0
+        self.lock = threading.RLock()
+        self.journal = None
+        self._profiles_by_id = {}
+        self._profiles_by_name = {}
+        self._name = None
+        self._context = None
+        self._interpolator = Interpolator(self._get_resolved_value)
+        self._resolved = ResolvedView(self._on_winner_changed)
+        self._indexed = True
+        self._indexing = False
+        self._profile_cache = None
+        self._modified = False
+        self._snapshot = None
+        self._snapshot_ref = None
+        self._changed_profiles = set()
+        self._changed_properties = set()
+        self._changed_names = set()
+        self._changed_winners = set()
 
     @property
     def id(self):
         return self._id
 
+    def is_attached(self) -> bool:
+        return self._context is not None
+
+    def bind_journal(self, journal):
+        """
+        Registers the environment itself in the journal of its context, profiles and properties are registered
+        in the journal of the environment
+        """
+        super().bind_journal(journal)
+        for profile in self.profiles:
+            profile.bind_journal(self.journal)
+
+    def assign_id(self, _id):
+        """
+        Sets id of newly inserted environment and propagates it to its profiles
+        """
+        old_id = self._id
+        self._id = _id
+        for profile in self.profiles:
+            profile._environment_id = _id
+        if self._context is not None:
+            self._context.on_environment_id_assigned(self, old_id)
+
     @property
     def name(self):
         return self._name
 
     @name.setter
     def name(self, name):
+        if self._context is not None and name != self._name:
+            self._context.ensure_environment_name_available(name)
+        old_name = self._name
         self._name = name
         self.mark_dirty()
+        if self._context is not None:
+            self._context.on_environment_renamed(self, old_name)
+
+    def bump_version(self):
+        """
+        Increases in-memory version of this environment and publishes its next snapshot, it has to be called
+        after every modification (under the environment lock)
+        """
+        if self._profile_cache is not None:
+            self._publish_profile_snapshots()
+            # Content is published first, so that a reader never gets an older content with the new version
+            self.version += 1
+        else:
+            self.version += 1
+            if self._snapshot is not None:
+                self._publish_snapshot()
+        self._modified = False
+
+    def is_modified(self) -> bool:
+        """
+        Returns whether profiles or properties of this environment have changed since the version was last bumped
+        """
+        return self._modified
+
+    def get_published_version(self) -> int:
+        """
+        Returns version of the last published snapshot, it can be read without locking
+        """
+        if self._profile_cache is not None:
+            return self.version
+        return self.get_snapshot().version
+
+    def get_snapshot(self, profile_id=None):
+        """
+        Returns immutable snapshot of the last published version of this environment, it can be read without locking.
+        Snapshot of an environment whose profiles are loaded lazily (see ProfileCache) isn't kept in memory: the whole
+        environment is read from the loaded profiles and from the database and it's kept only while it's being read,
+        reads of a single profile (profile_id) are served from a snapshot of that profile only (see PartialSnapshot).
+        :param profile_id: id of the only profile that is going to be read
+        :return: EnvironmentSnapshot, or PartialSnapshot if a single profile is requested in lazy loading mode
+        """
+        if self._profile_cache is not None:
+            if profile_id is not None:
+                return self._get_partial_snapshot(profile_id)
+            return self._get_transient_snapshot()
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock:
+                if self._snapshot is None:
+                    self._publish_snapshot()
+                snapshot = self._snapshot
+        return snapshot
 
     def create_profile(self, profile_name, is_enabled=True) -> Profile:
-        existing = self.find_profile(profile_name)
-        if existing is not None:
-            raise Exception("Profile with name {} already exists".format(profile_name))
+        self.ensure_profile_name_available(profile_name)
 
         priority_list = [p.priority for p in self.profiles]
         priority_list.append(START_PROFILE_PRIORITY)  # First priority if there are no profiles yet
@@ -42,20 +175,55 @@ class Environment(Entity):
         lowest_existing_priority = max(priority_list)
         profile = Profile.create(profile_name, lowest_existing_priority + 1, self.id)
         profile.enabled = is_enabled
-        self.profiles.append(profile)
+        self.attach_profile(profile)
+        if self._profile_cache is not None:
+            self._profile_cache.admit([profile])
         return profile
 
+    def attach_profile(self, profile: Profile):
+        """
+        Adds an already created (or loaded) profile, together with its properties, to this environment
+        """
+        if profile.name in self._profiles_by_name:
+            raise Exception("Inconsistency detected: there is more profiles with name {}".format(profile.name))
+
+        profile._environment = self
+        if self.journal is not None:
+            profile.bind_journal(self.journal)
+        self.profiles.append(profile)
+        self._profiles_by_id[profile.id] = profile
+        self._profiles_by_name[profile.name] = profile
+        if not profile.is_loaded():
+            self._profile_cache = profile._cache
+            if self._indexed:
+                self._drop_index()
+        elif self._indexed:
+            self._resolved.add_profile(profile)
+        self._record_profile_change(profile, True)
+
+    def attach_profiles(self, profiles: List[Profile]):
+        """
+        Adds loaded profiles. The resolved view is built once all profiles are added (or on first environment-wide
+        read, if their properties haven't been loaded yet), rather than updated property by property.
+        """
+        self._drop_index()
+        for profile in profiles:
+            self.attach_profile(profile)
+        # Loaded profiles make up the initial version, they aren't a modification of it
+        self._modified = False
+        self._changed_profiles = set()
+        if all(p.is_loaded() for p in self.profiles):
+            self._ensure_indexed()
+
     def get_profile(self, profile_id) -> Optional[Profile]:
-        for profile in self.profiles:
-            if profile.id == int(profile_id):
-                return profile
-        return None
+        return self._profiles_by_id.get(int(profile_id))
 
     def find_profile(self, profile_name):
-        for profile in self.profiles:
-            if profile.name == profile_name:
-                return profile
-        return None
+        return self._profiles_by_name.get(profile_name)
+
+    def ensure_profile_name_available(self, profile_name):
+        if profile_name in self._profiles_by_name:
+            raise Exception("Profile with name {} already exists".format(profile_name))
 
     def increase_profile_priority(self, profile_id) -> bool:
         return self._change_profile_priority(profile_id, -1)
@@ -77,7 +245,13 @@ class Environment(Entity):
 
         self.profiles.remove(profile_to_delete)
         profiles.remove(profile_to_delete)
+        del self._profiles_by_id[profile_to_delete.id]
+        del self._profiles_by_name[profile_to_delete.name]
         profile_to_delete.mark_deleted()
+        if self._indexed:
+            self._resolved.remove_profile(profile_to_delete)
+        self._record_profile_change(profile_to_delete, True)
+        profile_to_delete._environment = None
 
         for i in range(0, len(profiles)):
             profiles[i].priority = i + START_PROFILE_PRIORITY
@@ -90,16 +264,9 @@ class Environment(Entity):
         :param enabled_only: whether to return only lsit of active profiles AND active properties
         :return: property list ordered form highest to lowest priority
         """
-        chain = []
-        ordered_profiles = sorted(self.profiles, key=lambda p: p.priority)
-        for profile in ordered_profiles:
-            if not profile.enabled and enabled_only:
-                continue
-            prop = profile.find_property(property_name)
-            if prop is None or not prop.enabled:
-                continue
-            chain.append((profile, prop))
-        return chain
+        self._ensure_indexed()
+        return [(prop._profile, prop) for prop in self._resolved.chain(property_name)
+                if prop.enabled and (prop._profile.enabled or not enabled_only)]
 
     def get_first_property(self, property_name, enabled_only=True) -> (Profile, Property):
         """
@@ -108,25 +275,138 @@ class Environment(Entity):
         :param enabled_only: whether to look only for active properties in active profiles
         :return: property with highest priority
         """
-        chain = self.get_property_chain(property_name, enabled_only)
-        if len(chain) > 0:
-            return chain[0]
-        else:
-            return None
+        self._ensure_indexed()
+        if enabled_only:
+            prop = self._resolved.winner(property_name)
+            return (prop._profile, prop) if prop is not None else None
+
+        for prop in self._resolved.chain(property_name):
+            if prop.enabled:
+                return prop._profile, prop
+        return None
+
+    def get_resolved_properties(self, enabled_only=True) -> List[Tuple[Profile, Property]]:
+        """
+        Returns pairs (profile, property) with highest priority for every property name in this environment
+        :param enabled_only: whether to look only for active properties in active profiles
+        """
+        self._ensure_indexed()
+        if enabled_only:
+            return [(prop._profile, prop) for prop in self._resolved.winners()]
+
+        resolved = []
+        for name in self._resolved.names():
+            first = self.get_first_property(name, False)
+            if first is not None:
+                resolved.append(first)
+        return resolved
+
+    def get_expanded_value(self, prop: Property) -> Optional[str]:
+        """
+        Returns value of given property with {{name}} references replaced by resolved values of other properties
+        """
+        self._ensure_indexed()
+        if self._resolved.winner(prop.name) is prop:
+            return self._interpolator.expand(prop.name)
+        return self._interpolator.expand_value(prop.value)
 
     def get_property_names(self, profile_id=None) -> List[str]:
         if profile_id is not None:
             profile = self.get_profile(profile_id)
             if profile is None:
                 raise Exception("Profile {} wasn't found".format(profile_id))
-            profiles = [profile]
-        else:
-            profiles = self.profiles
+            return list(set(x.name for x in profile.properties))
+
+        self._ensure_indexed()
+        return list(self._resolved.names())
+
+    def has_property_name(self, property_name) -> bool:
+        self._ensure_indexed()
+        return len(self._resolved.chain(property_name)) > 0
 
-        _list = []
-        for p in profiles:
-            _list.extend([x.name for x in p.properties])
-        return list(set(_list))
+    def find_first_property(self, property_name) -> Optional[Property]:
+        """
+        Returns enabled property with highest priority among enabled profiles, like get_first_property, without
+        indexing the environment. Properties of profiles that aren't loaded are looked up in the database, they're
+        returned detached from the model. Has to be called under the environment lock.
+        """
+        if self._profile_cache is None:
+            first = self.get_first_property(property_name)
+            return first[1] if first is not None else None
+
+        profiles = [p for p in self.get_prioritized_profiles() if p.enabled]
+        unloaded = [p.id for p in profiles if not p.is_loaded()]
+        found = self._profile_cache.find_properties(unloaded, property_name) if len(unloaded) > 0 else {}
+        for profile in profiles:
+            prop = profile.find_property(property_name) if profile.is_loaded() else found.get(profile.id)
+            if prop is not None and prop.enabled:
+                return prop
+        return None
+
+    def on_profile_id_assigned(self, profile: Profile, old_id):
+        if self._profiles_by_id.get(old_id) is profile:
+            del self._profiles_by_id[old_id]
+        self._profiles_by_id[profile.id] = profile
+        self._record_profile_change(profile, True, old_id)
+        self._record_profile_change(profile, True)
+
+    def on_profile_renamed(self, profile: Profile, old_name):
+        del self._profiles_by_name[old_name]
+        self._profiles_by_name[profile.name] = profile
+        self._record_profile_change(profile, reordered=False)
+
+    def unload_profile(self, profile: Profile) -> bool:
+        """
+        Unloads properties of given profile (see ProfileCache), unless there are unsaved changes in this environment
+        or the environment is being indexed. Snapshot of the profile is released as well, it's created again
+        by the next read of the profile. Has to be called under the environment lock.
+        :return: whether the profile has been unloaded
+        """
+        if self._indexing or profile.new or profile.dirty or (self.journal is not None and not self.journal.is_empty()):
+            return False
+        if self._indexed:
+            self._unindex()
+        profile.unload_properties()
+        return True
+
+    def on_profile_state_changed(self, profile: Profile):
+        if self._indexed:
+            self._resolved.refresh_profile(profile)
+        self._record_profile_change(profile, reordered=False)
+
+    def on_profile_priority_changed(self, profile: Profile):
+        if self._indexed:
+            self._resolved.reposition_profile(profile)
+        self._record_profile_change(profile)
+
+    def on_property_added(self, profile: Profile, prop: Property):
+        if self._indexed:
+            self._resolved.add_property(profile, prop)
+        self._record_property_change(profile, prop)
+
+    def on_property_removed(self, profile: Profile, prop: Property):
+        if self._indexed:
+            self._resolved.remove_property(prop)
+        self._record_property_change(profile, prop)
+
+    def on_property_id_assigned(self, profile: Profile, prop: Property, old_id):
+        self._record_property_change(profile, prop, property_id=old_id)
+        self._record_property_change(profile, prop)
+
+    def on_property_renamed(self, profile: Profile, prop: Property, old_name):
+        if self._indexed:
+            self._resolved.rename_property(profile, prop, old_name)
+        self._record_property_change(profile, prop, old_name)
+
+    def on_property_state_changed(self, profile: Profile, prop: Property):
+        if self._indexed:
+            self._resolved.refresh_property(prop)
+        self._record_property_change(profile, prop)
+
+    def on_property_value_changed(self, profile: Profile, prop: Property):
+        if self._indexed and self._resolved.winner(prop.name) is prop:
+            self._on_winner_changed(prop.name)
+        self._record_property_change(profile, prop)
 
     def serialize(self) -> Dict:
         return {
@@ -138,6 +418,160 @@ class Environment(Entity):
         self._id = int(data["id"])
         self._name = data["name"]
 
+    def deserialize_row(self, row: Tuple):
+        """
+        Deserializes a row selected with columns in the order of COLUMNS
+        """
+        self._id, self._name = row
+
+    def _publish_profile_snapshots(self):
+        """
+        Replaces snapshots of the changed profiles (lazy loading mode), snapshot of the whole environment is released
+        """
+        changed = {}
+        for (profile_id, property_id) in self._changed_properties:
+            changed.setdefault(profile_id, []).append(property_id)
+        for profile_id in self._changed_profiles:
+            profile = self.get_profile(profile_id)
+            if profile is not None and profile._snapshot is not None:
+                profile._snapshot = profile._snapshot.evolve(profile, changed.get(profile_id, ()))
+        self._changed_profiles = set()
+        self._changed_properties = set()
+        self._snapshot_ref = None
+
+    def _get_partial_snapshot(self, profile_id) -> PartialSnapshot:
+        profile = self.get_profile(profile_id) if str(profile_id).isdigit() else None
+        if profile is None:
+            return PartialSnapshot(self, None)
+
+        snapshot = profile._snapshot
+        if snapshot is None:
+            with self.lock:
+                # Profile could have been deleted while waiting for the lock
+                if profile._environment is not self:
+                    return PartialSnapshot(self, None)
+                snapshot = profile._snapshot
+                if snapshot is None:
+                    snapshot = profile._snapshot = ProfileSnapshot.create(profile)
+        else:
+            self._profile_cache.touch(profile)
+        return PartialSnapshot(self, snapshot)
+
+    def _get_transient_snapshot(self) -> EnvironmentSnapshot:
+        snapshot = self._snapshot_ref() if self._snapshot_ref is not None else None
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._snapshot_ref() if self._snapshot_ref is not None else None
+                if snapshot is None:
+                    # Unloaded profiles don't have unsaved changes, the database has their current properties
+                    unloaded = [p.id for p in self.profiles if not p.is_loaded()]
+                    properties = self._profile_cache.fetch(unloaded) if len(unloaded) > 0 else {}
+                    snapshot = EnvironmentSnapshot.build(self, properties)
+                    self._snapshot_ref = weakref.ref(snapshot)
+        return snapshot
+
+    def _publish_snapshot(self):
+        self._ensure_indexed()
+        if self._snapshot is None:
+            snapshot = EnvironmentSnapshot.build(self)
+        else:
+            snapshot = self._snapshot.patch(self, self._changed_profiles, self._changed_properties, self._changed_names,
+                                            self._changed_winners)
+        self._changed_profiles = set()
+        self._changed_properties = set()
+        self._changed_names = set()
+        self._changed_winners = set()
+        self._snapshot = snapshot
+
+    def _ensure_indexed(self):
+        """
+        Loads all profiles that haven't been loaded yet and indexes all properties in the resolved view
+        """
+        if self._indexed:
+            return
+        with self.lock:
+            if self._indexed:
+                return
+            unloaded = [p for p in self.profiles if not p.is_loaded()]
+            if len(unloaded) > 0:
+                self._indexing = True
+                try:
+                    self._profile_cache.load(unloaded)
+                finally:
+                    self._indexing = False
+            self._resolved = ResolvedView.build(self.get_prioritized_profiles(), self._on_winner_changed)
+            self._interpolator = Interpolator(self._get_resolved_value)
+            self._interpolator.add_all(prop.name for prop in self._resolved.winners())
+            if self._snapshot is not None:
+                # Dependents of the names changed since the index was dropped haven't been invalidated yet
+                for name in self._changed_names | self._changed_winners:
+                    self._changed_winners.update(self._interpolator.update(name))
+            self._indexed = True
+
+    def _drop_index(self):
+        """
+        Discards the resolved view and the snapshot, they're rebuilt by the next environment-wide read
+        """
+        self._unindex()
+        self._snapshot = None
+        self._changed_profiles = set()
+        self._changed_properties = set()
+        self._changed_names = set()
+        self._changed_winners = set()
+
+    def _unindex(self):
+        """
+        Discards the resolved view and the interpolator, which refer to the loaded properties
+        """
+        self._indexed = False
+        self._resolved = ResolvedView(self._on_winner_changed)
+        self._interpolator = Interpolator(self._get_resolved_value)
+
+    def _record_profile_change(self, profile: Profile, with_properties=False, profile_id=None, reordered=True):
+        """
+        :param with_properties: whether all properties of the profile have changed as well (profile has been added,
+        removed or its id has changed)
+        :param profile_id: id under which the profile is known to the snapshot, if it differs from its current id
+        :param reordered: whether the change affects override chains, or only the winners (e.g. profile toggle)
+        """
+        self._modified = True
+        if self._profile_cache is not None:
+            if with_properties:
+                # Profile has been added, removed or its properties have new profile id, it's read again if needed
+                profile._snapshot = None
+            self._changed_profiles.add(profile.id)
+            return
+        if self._snapshot is None:
+            return
+        profile_id = profile.id if profile_id is None else profile_id
+        self._changed_profiles.add(profile_id)
+        names = self._changed_names if reordered else self._changed_winners
+        for prop in profile.properties:
+            names.add(prop.name)
+            if with_properties:
+                self._changed_properties.add((profile_id, prop.id))
+
+    def _record_property_change(self, profile: Profile, prop: Property, old_name=None, property_id=None):
+        self._modified = True
+        if self._snapshot is None and self._profile_cache is None:
+            return
+        self._changed_profiles.add(profile.id)
+        self._changed_properties.add((profile.id, prop.id if property_id is None else property_id))
+        if self._profile_cache is not None:
+            return
+        self._changed_names.add(prop.name)
+        if old_name is not None:
+            self._changed_names.add(old_name)
+
+    def _on_winner_changed(self, property_name):
+        invalidated = self._interpolator.update(property_name)
+        if self._snapshot is not None:
+            self._changed_winners.update(invalidated)
+
+    def _get_resolved_value(self, property_name) -> Optional[str]:
+        winner = self._resolved.winner(property_name)
+        return winner.value if winner is not None else None
+
     def _change_profile_priority(self, profile_id, direction) -> bool:
         profiles = self.get_prioritized_profiles()
         profile_pos = self._get_required_profile_index(profiles, profile_id)
@@ -0,0 +1,186 @@
+import re
+import threading
+from typing import Dict, Set, Tuple, Optional, FrozenSet, Callable, List, Iterable
+
+REFERENCE_PATTERN = re.compile("{{\\s*([^{}\\s]+)\\s*}}")
+
+
+class Template:
+    """
+    Compiled property value. Segments are pairs (is_reference, text), where text is either a literal
+    or a name of the referenced property.
+    """
+    __slots__ = ("segments", "references")
+    segments: Tuple[Tuple[bool, str], ...]
+    references: FrozenSet[str]
+
+    def __init__(self, segments, references):
+        self.segments = segments
+        self.references = references
+
+    def is_literal(self) -> bool:
+        return len(self.references) == 0
+
+    @staticmethod
+    def has_references(value: Optional[str]) -> bool:
+        return value is not None and "{{" in value
+
+    @staticmethod
+    def compile(value: Optional[str]) -> "Template":
+        if not Template.has_references(value):
+            return Template(((False, value or ""),), frozenset())
+
+        segments = []
+        position = 0
+        for match in REFERENCE_PATTERN.finditer(value):
+            if match.start() > position:
+                segments.append((False, value[position:match.start()]))
+            segments.append((True, match.group(1)))
+            position = match.end()
+        if position < len(value):
+            segments.append((False, value[position:]))
+
+        references = frozenset(text for (is_reference, text) in segments if is_reference)
+        return Template(tuple(segments), references)
+
+
+class Interpolator:
+    """
+    Expands {{name}} references in resolved property values. Templates are compiled once per value change
+    and form a name-level dependency graph. Expanded values are cached, a change of one name invalidates
+    only the name itself and its transitive dependents. Literal values (the vast majority) are neither kept
+    as templates nor cached, they're read through the resolve function.
+    References to unknown names and references to names forming a cycle are left unexpanded.
+    The interpolator is safe to read while another thread updates it.
+    """
+    _resolve: Callable[[str], Optional[str]]
+    # Templates of resolved values containing references only
+    _templates: Dict[str, Template]
+    _dependents: Dict[str, Set[str]]
+    _expanded: Dict[str, str]
+    _cyclic: Set[str]
+
+    def __init__(self, resolve: Callable[[str], Optional[str]]):
+        """
+        :param resolve: function returning raw value of given name (or None if there's no such name)
+        """
+        self._resolve = resolve
+        self._templates = {}
+        self._dependents = {}
+        self._expanded = {}
+        self._cyclic = set()
+        self._lock = threading.RLock()
+
+    def update(self, name) -> List[str]:
+        """
+        Recompiles template of given name after its resolved value has changed
+        :return: names whose expanded values have been invalidated
+        """
+        with self._lock:
+            return self._update(name)
+
+    def add_all(self, names: Iterable[str]):
+        """
+        Registers resolved values of given names at once. Meant for a new interpolator, nothing is invalidated.
+        """
+        with self._lock:
+            for name in names:
+                self._register(name)
+
+    def expand(self, name) -> Optional[str]:
+        """
+        Returns expanded value of given name
+        """
+        with self._lock:
+            return self._expand(name, [])
+
+    def expand_value(self, value: Optional[str]) -> Optional[str]:
+        """
+        Expands arbitrary value (e.g. of a property overridden by another profile) against resolved names
+        """
+        if value is None:
+            return None
+        template = Template.compile(value)
+        if template.is_literal():
+            return value
+        with self._lock:
+            return self._render(template, [])
+
+    def get_dependents(self, name) -> Set[str]:
+        with self._lock:
+            return set(self._dependents.get(name, ()))
+
+    def _update(self, name) -> List[str]:
+        old = self._templates.pop(name, None)
+        if old is not None:
+            for reference in old.references:
+                dependents = self._dependents.get(reference)
+                if dependents is not None:
+                    dependents.discard(name)
+                    if len(dependents) == 0:
+                        del self._dependents[reference]
+
+        self._register(name)
+        return self._invalidate(name)
+
+    def _register(self, name):
+        value = self._resolve(name)
+        if Template.has_references(value):
+            template = Template.compile(value)
+            self._templates[name] = template
+            for reference in template.references:
+                self._dependents.setdefault(reference, set()).add(name)
+
+    def _invalidate(self, name) -> List[str]:
+        invalidated = []
+        visited = {name}
+        pending = [name]
+        while len(pending) > 0:
+            current = pending.pop()
+            self._expanded.pop(current, None)
+            # A cycle through the changed name consists of its dependents only, so it's rediscovered on next expansion
+            self._cyclic.discard(current)
+            invalidated.append(current)
+            for dependent in self._dependents.get(current, ()):
+                if dependent not in visited:
+                    visited.add(dependent)
+                    pending.append(dependent)
+        return invalidated
+
+    def _expand(self, name, stack: List[str]) -> Optional[str]:
+        expanded = self._expanded.get(name)
+        if expanded is not None:
+            return expanded
+
+        template = self._templates.get(name)
+        if template is None:
+            return self._resolve(name)
+
+        if template.is_literal():
+            # Value contains "{{", but no valid reference
+            expanded = template.segments[0][1]
+        else:
+            stack.append(name)
+            expanded = self._render(template, stack)
+            stack.pop()
+
+        self._expanded[name] = expanded
+        return expanded
+
+    def _render(self, template: Template, stack: List[str]) -> str:
+        parts = []
+        for (is_reference, text) in template.segments:
+            if not is_reference:
+                parts.append(text)
+                continue
+
+            value = None
+            if text in stack:
+                # Every name on the stack from the referenced one up belongs to the cycle
+                self._cyclic.update(stack[stack.index(text):])
+            elif text not in self._cyclic:
+                value = self._expand(text, stack)
+                if text in self._cyclic:
+                    value = None
+            parts.append(value if value is not None else "{{" + text + "}}")
+        return "".join(parts)
@@ -1,34 +1,78 @@
-from typing import List, Dict, Optional
+import sys
+from typing import List, Dict, Optional, Tuple
 
 from .base.entity import Entity
 from .property import Property
 
 
 class Profile(Entity):
+    TABLE = "profile"
+    COLUMNS = ("id", "name", "priority", "enabled", "environment_id")
+    __slots__ = ("_id", "_name", "_priority", "_enabled", "_environment_id", "_properties", "_properties_by_id",
+                 "_properties_by_name", "_loaded", "_cache", "_environment", "_snapshot")
+
     _id: int
     _name: str
     _priority: int
     _enabled: bool
     _environment_id: int
 
-    properties: List[Property]
+    _properties: List[Property]
+    _properties_by_id: Dict[int, Property]
+    _properties_by_name: Dict[str, Property]
+    # Properties of a profile loaded lazily are fetched from the cache on first access (see ProfileCache)
+    _loaded: bool
+    _cache: Optional["ProfileCache"]
+    # Last published snapshot of the properties of a profile loaded lazily, see Environment.get_snapshot
+    _snapshot: Optional["ProfileSnapshot"]
 
     def __init__(self):
         super().__init__()
-        self.properties = []
+        self._properties = []
+        self._properties_by_id = {}
+        self._properties_by_name = {}
+        self._loaded = True
+        self._cache = None
+        self._name = None
+        self._environment = None
+        self._snapshot = None
 
     @property
     def id(self):
         return self._id
 
+    def is_attached(self) -> bool:
+        return self._environment is not None and self._environment.is_attached()
+
+    def bind_journal(self, journal):
+        super().bind_journal(journal)
+        for prop in self._properties:
+            prop.bind_journal(journal)
+
+    def assign_id(self, _id):
+        """
+        Sets id of newly inserted profile and propagates it to its properties
+        """
+        old_id = self._id
+        self._id = _id
+        for prop in self._properties:
+            prop._profile_id = _id
+        if self._environment is not None:
+            self._environment.on_profile_id_assigned(self, old_id)
+
     @property
     def name(self):
         return self._name
 
     @name.setter
     def name(self, name):
-        self._name = name
+        if self._environment is not None and name != self._name:
+            self._environment.ensure_profile_name_available(name)
+        old_name = self._name
+        self._name = sys.intern(name) if isinstance(name, str) else name
         self.mark_dirty()
+        if self._environment is not None:
+            self._environment.on_profile_renamed(self, old_name)
 
     @property
     def priority(self):
@@ -41,6 +85,8 @@ class Profile(Entity):
     def priority(self, priority):
         self._priority = priority
         self.mark_dirty()
+        if self._environment is not None:
+            self._environment.on_profile_priority_changed(self)
 
     @property
     def enabled(self):
@@ -50,6 +96,8 @@ class Profile(Entity):
     def enabled(self, enabled):
         self._enabled = enabled
         self.mark_dirty()
+        if self._environment is not None:
+            self._environment.on_profile_state_changed(self)
 
     @property
     def environment_id(self):
@@ -60,41 +108,139 @@ class Profile(Entity):
         self._environment_id = environment_id
         self.mark_dirty()
 
+    @property
+    def properties(self) -> List[Property]:
+        self._ensure_loaded()
+        return self._properties
+
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def defer_properties(self, cache):
+        """
+        Marks properties of this (just loaded) profile as not loaded yet, they're loaded from given cache
+        on first access
+        """
+        self._cache = cache
+        self._loaded = False
+
+    def attach_loaded_properties(self, properties: List[Property]):
+        """
+        Adds properties loaded from the database (on demand or when the model is built). Unlike attach_property,
+        the environment isn't notified, it indexes the properties once all of its profiles are loaded.
+        """
+        for prop in properties:
+            prop._profile = self
+            if self._journal is not None:
+                prop.bind_journal(self._journal)
+            self._properties.append(prop)
+            self._properties_by_id[prop.id] = prop
+            self._properties_by_name[prop.name] = prop
+        self._loaded = True
+
+    def unload_properties(self):
+        """
+        Releases properties of this profile, they're loaded again on next access. Properties mustn't have
+        unsaved changes.
+        """
+        for prop in self._properties:
+            prop._profile = None
+        self._properties = []
+        self._properties_by_id = {}
+        self._properties_by_name = {}
+        self._loaded = False
+        self._snapshot = None
+
     def get_property(self, property_id) -> Optional[Property]:
-        matched = list(filter(lambda p: p.id == property_id, self.properties))
-        if len(matched) == 1:
-            return matched[0]
-        else:
-            return None
+        self._ensure_loaded()
+        return self._properties_by_id.get(property_id)
 
     def find_property(self, property_name) -> Optional[Property]:
-        matched = list(filter(lambda p: p.name == property_name, self.properties))
-        if len(matched) > 1:
-            raise Exception("Inconsistency detected: there is more properties with name {}".format(property_name))
-        elif len(matched) == 1:
-            return matched[0]
-        else:
-            return None
+        self._ensure_loaded()
+        return self._properties_by_name.get(property_name)
+
+    def ensure_property_name_available(self, property_name):
+        self._ensure_loaded()
+        if property_name in self._properties_by_name:
+            raise Exception("Cannot use name {}: another property with the same name already exists"
+                            .format(property_name))
 
     def create_property(self, name, value) -> Property:
-        existing = self.find_property(name)
-        if existing is not None:
+        self._ensure_loaded()
+        if name in self._properties_by_name:
             raise Exception("Cannot create property {}: another property with the same name already exists".format(name))
 
         prop = Property.create(name, self.id)
         prop.value = value
-        self.properties.append(prop)
+        self.attach_property(prop)
         return prop
 
+    def attach_property(self, prop: Property):
+        """
+        Adds an already created (or loaded) property to this profile
+        """
+        self._ensure_loaded()
+        if prop.name in self._properties_by_name:
+            raise Exception("Inconsistency detected: there is more properties with name {}".format(prop.name))
+
+        prop._profile = self
+        if self._journal is not None:
+            prop.bind_journal(self._journal)
+        self._properties.append(prop)
+        self._properties_by_id[prop.id] = prop
+        self._properties_by_name[prop.name] = prop
+        if self._environment is not None:
+            self._environment.on_property_added(self, prop)
+
     def delete_property(self, property_id) -> bool:
         existing = self.get_property(property_id)
         if existing is None:
             return False
 
         existing.mark_deleted()
-        self.properties.remove(existing)
+        self._properties.remove(existing)
+        del self._properties_by_id[existing.id]
+        del self._properties_by_name[existing.name]
+        if self._environment is not None:
+            self._environment.on_property_removed(self, existing)
+        existing._profile = None
         return True
 
+    def restore_property(self, prop: Property):
+        """
+        Adds back a property deleted from this profile since the last flush, its deletion is cancelled
+        """
+        if self._journal is not None:
+            self._journal.unregister_deleted(prop)
+        self.attach_property(prop)
+
+    def on_property_id_assigned(self, prop: Property, old_id):
+        if self._properties_by_id.get(old_id) is prop:
+            del self._properties_by_id[old_id]
+        self._properties_by_id[prop.id] = prop
+        if self._environment is not None:
+            self._environment.on_property_id_assigned(self, prop, old_id)
+
+    def on_property_renamed(self, prop: Property, old_name):
+        del self._properties_by_name[old_name]
+        self._properties_by_name[prop.name] = prop
+        if self._environment is not None:
+            self._environment.on_property_renamed(self, prop, old_name)
+
+    def on_property_state_changed(self, prop: Property):
+        if self._environment is not None:
+            self._environment.on_property_state_changed(self, prop)
+
+    def on_property_value_changed(self, prop: Property):
+        if self._environment is not None:
+            self._environment.on_property_value_changed(self, prop)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._cache.load([self])
+        elif self._cache is not None:
+            self._cache.touch(self)
+
     def serialize(self) -> Dict:
         d = {
             "name": self.name,
@@ -110,11 +256,19 @@ class Profile(Entity):
 
     def deserialize(self, data: Dict):
         self._id = int(data["id"])
-        self._name = data["name"]
+        self._name = sys.intern(data["name"])
         self._priority = data["priority"]
         self._enabled = data["enabled"] == 1
         self._environment_id = data["environment_id"]
 
+    def deserialize_row(self, row: Tuple):
+        """
+        Deserializes a row selected with columns in the order of COLUMNS
+        """
+        self._id, name, self._priority, enabled, self._environment_id = row
+        self._name = sys.intern(name)
+        self._enabled = enabled == 1
+
     @staticmethod
     def create(name, priority, environment_id):
         profile = Profile()
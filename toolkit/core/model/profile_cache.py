@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Set
+
+from ..log import Log
+from ..metrics import Metrics
+
+PROFILE_LOADS = Metrics.counter("toolkit_profile_loads_total", "Number of profiles whose properties were loaded on demand")
+PROFILE_EVICTIONS = Metrics.counter("toolkit_profile_evictions_total",
+                                    "Number of profiles whose properties were unloaded from memory")
+
+
+class ProfileCache:
+    """
+    Bounded LRU of profiles whose properties are loaded in memory (lazy loading mode). Profiles are loaded
+    with their metadata only and their properties are loaded on first access. Once the cache is over
+    its capacity, least recently used profiles are unloaded. A profile isn't unloaded while its environment
+    has unsaved changes or is locked by another thread, such profiles are unloaded once the changes are persisted
+    (see shrink). Reads of the whole environment don't go through the cache, see Environment.get_snapshot.
+    """
+    capacity: int
+    # Used as an insertion-ordered set, the least recently used profile goes first
+    _profiles: "OrderedDict"
+
+    def __init__(self, capacity, loader: Callable[[List[int]], Dict[int, List]],
+                 finder: Callable[[List[int], str], Dict[int, object]] = None):
+        """
+        :param capacity: number of profiles whose properties are kept in memory
+        :param loader: function returning lists of properties of the profiles with given ids, by profile id
+        :param finder: function returning properties with given name of the profiles with given ids, by profile id.
+        Properties are looked up in the lists returned by the loader if not specified.
+        """
+        self.capacity = capacity
+        self._loader = loader
+        self._finder = finder if finder is not None else self._find_loaded
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, profiles: List):
+        """
+        Loads properties of given profiles with a single query and makes room for them.
+        Has to be called under the lock of their environment.
+        """
+        loaded = self._loader([p.id for p in profiles])
+        for profile in profiles:
+            profile.attach_loaded_properties(loaded.get(profile.id, []))
+        PROFILE_LOADS.inc(len(profiles))
+        self.admit(profiles)
+
+    def fetch(self, profile_ids: List[int]) -> Dict[int, List]:
+        """
+        Loads properties of given profiles without attaching them to the profiles, the cache isn't affected
+        :return: lists of properties by profile id
+        """
+        return self._loader(profile_ids)
+
+    def find_properties(self, profile_ids: List[int], property_name) -> Dict:
+        """
+        Looks up properties with given name of given profiles without loading the profiles
+        :return: properties by profile id
+        """
+        return self._finder(profile_ids, property_name)
+
+    def admit(self, profiles: List):
+        """
+        Starts tracking given profiles (loaded or newly created) and unloads profiles over the capacity,
+        except for the admitted ones
+        """
+        with self._lock:
+            for profile in profiles:
+                profile._cache = self
+                self._profiles[profile] = None
+                self._profiles.move_to_end(profile)
+        self._shrink(set(profiles))
+
+    def shrink(self):
+        """
+        Unloads least recently used profiles over the capacity, called once changes have been persisted
+        """
+        self._shrink(set())
+
+    def touch(self, profile):
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.move_to_end(profile)
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def _shrink(self, excluded: Set):
+        with self._lock:
+            overflow = len(self._profiles) - self.capacity
+            if overflow <= 0:
+                return
+            candidates = list(self._profiles)
+
+        for candidate in candidates:
+            if overflow <= 0:
+                break
+            if candidate not in excluded and self._evict(candidate):
+                overflow -= 1
+
+    def _evict(self, profile) -> bool:
+        env = profile._environment
+        if env is None or not env.is_attached():
+            # Profile or its environment has been deleted or replaced, there is nothing to unload
+            self._discard(profile)
+            return True
+
+        # Other environments are never waited for, the lock is reentrant, so the environment this thread is loading
+        # is acquired. A profile that can't be unloaded now stays in the cache.
+        if not env.lock.acquire(blocking=False):
+            return False
+        try:
+            if not env.unload_profile(profile):
+                return False
+        finally:
+            env.lock.release()
+
+        self._discard(profile)
+        PROFILE_EVICTIONS.inc()
+        Log.d("Unloaded properties of profile {} in environment {}", profile.name, env.name)
+        return True
+
+    def _discard(self, profile):
+        with self._lock:
+            self._profiles.pop(profile, None)
+
+    def _find_loaded(self, profile_ids: List[int], property_name) -> Dict:
+        found = {}
+        for (profile_id, properties) in self._loader(profile_ids).items():
+            prop = next((p for p in properties if p.name == property_name), None)
+            if prop is not None:
+                found[profile_id] = prop
+        return found
@@ -1,28 +1,62 @@
-from typing import Dict
+import sys
+from typing import Dict, Optional, Tuple
 
 from .base.entity import Entity
 
 
 class Property(Entity):
+    TABLE = "property"
+    COLUMNS = ("id", "name", "value", "type", "enabled", "profile_id")
+    # Properties never move between profiles, updates don't have to maintain the profile_id index
+    IMMUTABLE_COLUMNS = ("profile_id",)
+    __slots__ = ("_id", "_name", "_value", "_type", "_enabled", "_profile_id", "_profile", "_persisted_name")
+
     _id: int
     _name: str
     _value: str
     _type: str
     _enabled: bool
     _profile_id: int
+    # Name stored in the database, name is a part of a unique index and isn't rewritten unless it has changed
+    _persisted_name: Optional[str]
+
+    def __init__(self):
+        super().__init__()
+        self._name = None
+        self._profile = None
+        self._persisted_name = None
 
     @property
     def id(self):
         return self._id
 
+    def is_attached(self) -> bool:
+        return self._profile is not None and self._profile.is_attached()
+
+    def assign_id(self, _id):
+        """
+        Sets id of newly inserted property
+        """
+        old_id = self._id
+        self._id = _id
+        if self._profile is not None:
+            self._profile.on_property_id_assigned(self, old_id)
+
     @property
     def name(self):
         return self._name
 
     @name.setter
     def name(self, name):
-        self._name = name
+        if self._profile is not None and name != self._name:
+            self._profile.ensure_property_name_available(name)
+        old_name = self._name
+        # Names repeat across profiles and environments, every occurrence shares one string. Only strings can be
+        # interned, names of other types are left to the validation of the caller.
+        self._name = sys.intern(name) if isinstance(name, str) else name
         self.mark_dirty()
+        if self._profile is not None:
+            self._profile.on_property_renamed(self, old_name)
 
     @property
     def value(self):
@@ -32,6 +66,8 @@ class Property(Entity):
     def value(self, value):
         self._value = value
         self.mark_dirty()
+        if self._profile is not None:
+            self._profile.on_property_value_changed(self)
 
     @property
     def type(self):
@@ -50,6 +86,15 @@ class Property(Entity):
     def enabled(self, enabled):
         self._enabled = enabled
         self.mark_dirty()
+        if self._profile is not None:
+            self._profile.on_property_state_changed(self)
+
+    def mark_persisted(self):
+        super().mark_persisted()
+        self._persisted_name = self._name
+
+    def get_unchanged_columns(self) -> Tuple:
+        return ("name",) if self._name == self._persisted_name else ()
 
     def serialize(self) -> Dict:
         return {
@@ -63,12 +108,21 @@ class Property(Entity):
 
     def deserialize(self, data: Dict):
         self._id = int(data["id"])
-        self._name = data["name"]
+        self._name = sys.intern(data["name"])
+        self._persisted_name = self._name
         self._value = data["value"]
         self._type = data["type"]
         self._enabled = data["enabled"] == 1
         self._profile_id = data["profile_id"]
 
+    def deserialize_row(self, row: Tuple):
+        """
+        Deserializes a row selected with columns in the order of COLUMNS
+        """
+        self._id, name, self._value, self._type, enabled, self._profile_id = row
+        self._name = self._persisted_name = sys.intern(name)
+        self._enabled = enabled == 1
+
     @staticmethod
     def create(name, profile_id):
         prop = Property()
@@ -0,0 +1,164 @@
+from typing import List, Dict, Optional, Iterable, Callable, Sequence
+
+from .profile import Profile
+from .property import Property
+
+
+class ResolvedView:
+    """
+    Name-keyed view of all properties in an environment. For every property name it keeps the override chain
+    (ordered from highest to lowest profile priority) and the winner, i.e. the first enabled property
+    in an enabled profile. Once built, the view is updated in place by the environment.
+    Only properties are stored, their profiles are reached through their back-references.
+    """
+    _chains: Dict[str, List[Property]]
+    _winners: Dict[str, Property]
+    _winner_listener: Optional[Callable[[str], None]]
+
+    def __init__(self, winner_listener: Callable[[str], None] = None):
+        """
+        :param winner_listener: function called with property name whenever the winner of that name changes
+        """
+        self._chains = {}
+        self._winners = {}
+        self._winner_listener = winner_listener
+
+    @staticmethod
+    def build(profiles: Iterable[Profile], winner_listener: Callable[[str], None] = None) -> "ResolvedView":
+        """
+        Creates view of given profiles (preferably ordered by priority), the listener isn't notified
+        of the initial winners
+        """
+        view = ResolvedView(winner_listener)
+        chains = view._chains
+        winners = view._winners
+        # Properties are appended in priority order, so the first enabled one of every chain is its winner
+        for profile in sorted(profiles, key=lambda p: p.priority):
+            enabled = profile.enabled
+            for prop in profile.properties:
+                name = prop.name
+                chain = chains.get(name)
+                if chain is None:
+                    chains[name] = [prop]
+                else:
+                    chain.append(prop)
+                if enabled and prop.enabled and name not in winners:
+                    winners[name] = prop
+        return view
+
+    def names(self) -> Iterable[str]:
+        return self._chains.keys()
+
+    def chain(self, property_name) -> Sequence[Property]:
+        """
+        Returns full override chain for given name, including disabled profiles and disabled properties.
+        The chain mustn't be modified.
+        """
+        return self._chains.get(property_name, ())
+
+    def winner(self, property_name) -> Optional[Property]:
+        return self._winners.get(property_name)
+
+    def winners(self) -> Iterable[Property]:
+        return self._winners.values()
+
+    def add_property(self, profile: Profile, prop: Property):
+        """
+        :param profile: profile of the property, it has to be set as the property's profile already
+        """
+        name = prop.name
+        chain = self._chains.get(name)
+        if chain is None:
+            self._chains[name] = [prop]
+            if profile.enabled and prop.enabled:
+                self._set_winner(name, prop)
+            return
+
+        if chain[-1]._profile.priority <= profile.priority:
+            # Fast path, profiles are usually added in priority order. Appended property can only win
+            # if there was no winner before.
+            chain.append(prop)
+            if name not in self._winners and profile.enabled and prop.enabled:
+                self._set_winner(name, prop)
+            return
+
+        position = len(chain)
+        for i in range(len(chain)):
+            if chain[i]._profile.priority > profile.priority:
+                position = i
+                break
+        chain.insert(position, prop)
+        self._update_winner(name)
+
+    def remove_property(self, prop: Property, property_name=None):
+        """
+        Removes property from the view
+        :param prop: property to remove
+        :param property_name: name under which the property is stored, if it differs from its current name
+        """
+        name = property_name if property_name is not None else prop.name
+        chain = self._chains.get(name)
+        if chain is None:
+            return
+
+        for i in range(len(chain)):
+            if chain[i] is prop:
+                del chain[i]
+                break
+
+        if len(chain) == 0:
+            del self._chains[name]
+        self._update_winner(name)
+
+    def rename_property(self, profile: Profile, prop: Property, old_name):
+        self.remove_property(prop, old_name)
+        self.add_property(profile, prop)
+
+    def add_profile(self, profile: Profile):
+        for prop in profile.properties:
+            self.add_property(profile, prop)
+
+    def remove_profile(self, profile: Profile):
+        for prop in profile.properties:
+            self.remove_property(prop)
+
+    def reposition_profile(self, profile: Profile):
+        """
+        Moves all properties of given profile to the chain positions matching its current priority
+        """
+        for prop in profile.properties:
+            self.remove_property(prop)
+            self.add_property(profile, prop)
+
+    def refresh_profile(self, profile: Profile):
+        """
+        Recalculates winners of all property names defined by given profile
+        """
+        for prop in profile.properties:
+            self._update_winner(prop.name)
+
+    def refresh_property(self, prop: Property):
+        self._update_winner(prop.name)
+
+    def _update_winner(self, property_name):
+        winner = None
+        for prop in self._chains.get(property_name, ()):
+            if prop._profile.enabled and prop.enabled:
+                winner = prop
+                break
+
+        old_winner = self._winners.get(property_name)
+        if old_winner is winner:
+            return
+
+        if winner is not None:
+            self._set_winner(property_name, winner)
+        else:
+            del self._winners[property_name]
+            if self._winner_listener is not None:
+                self._winner_listener(property_name)
+
+    def _set_winner(self, property_name, winner: Property):
+        self._winners[property_name] = winner
+        if self._winner_listener is not None:
+            self._winner_listener(property_name)
@@ -0,0 +1,143 @@
+import bisect
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Length of the n-grams names and values are indexed by, shorter queries are matched by a scan
+NGRAM_LENGTH = 3
+
+MATCH_NAME = "name"
+MATCH_VALUE = "value"
+
+
+class SearchIndex:
+    """
+    Case-insensitive index of property names and values of an environment snapshot (see PropertySnapshot).
+    Distinct names are kept in a sorted array (prefix search by bisection), names and values are indexed
+    by their n-grams (substring search). The index isn't modified once it's built, so it can be searched
+    without locking.
+    """
+    # Sorted distinct names, lowercase
+    _names: List[str]
+    _properties_by_name: Dict[str, Set]
+    _name_grams: Dict[str, Set[str]]
+    _value_grams: Dict[str, Set]
+    # Value every property is indexed with
+    _values: Dict[object, str]
+
+    def __init__(self):
+        self._names = []
+        self._properties_by_name = {}
+        self._name_grams = {}
+        self._value_grams = {}
+        self._values = {}
+
+    @staticmethod
+    def build(properties: Iterable) -> "SearchIndex":
+        index = SearchIndex()
+        values = index._values
+        value_grams = index._value_grams
+        for prop in properties:
+            index._add_name(prop, prop.name)
+            # Values are the bulk of the index
+            value = prop.value if prop.value is not None else ""
+            values[prop] = value
+            lower = value.lower()
+            for gram in {lower[i:i + NGRAM_LENGTH] for i in range(len(lower) - NGRAM_LENGTH + 1)}:
+                posting = value_grams.get(gram)
+                if posting is None:
+                    value_grams[gram] = {prop}
+                else:
+                    posting.add(prop)
+        index._names.sort()
+        return index
+
+    def search(self, query, prefix=False, names=True, values=True) -> List[Tuple[object, str, int]]:
+        """
+        Finds properties whose name or value starts with (prefix) or contains the query, ignoring case
+        :return: triples (property, MATCH_NAME or MATCH_VALUE, match rank), rank is 0 for names equal to the query,
+        1 for other name prefixes, 2 for other name matches and 3 for value matches. Every property is returned once,
+        with its best match.
+        """
+        query = query.lower()
+        hits = {}
+        if names:
+            for name in self._find_names(query, prefix):
+                rank = 0 if name == query else 1 if name.startswith(query) else 2
+                for prop in self._properties_by_name[name]:
+                    hits[prop] = (prop, MATCH_NAME, rank)
+        if values:
+            for prop in self._find_values(query, prefix):
+                if prop not in hits:
+                    hits[prop] = (prop, MATCH_VALUE, 3)
+        return list(hits.values())
+
+    def contains(self, prop) -> bool:
+        return prop in self._values
+
+    @staticmethod
+    def match(prop, query, prefix=False, names=True, values=True) -> Optional[Tuple[str, int]]:
+        """
+        Matches a single property without an index, see search
+        :return: pair (MATCH_NAME or MATCH_VALUE, match rank) or None if the property doesn't match
+        """
+        query = query.lower()
+        if names:
+            name = prop.name.lower()
+            if name == query:
+                return MATCH_NAME, 0
+            if name.startswith(query):
+                return MATCH_NAME, 1
+            if not prefix and query in name:
+                return MATCH_NAME, 2
+        if values:
+            value = prop.value.lower() if prop.value is not None else ""
+            if value.startswith(query) if prefix else query in value:
+                return MATCH_VALUE, 3
+        return None
+
+    def _find_names(self, query, prefix) -> List[str]:
+        if prefix:
+            start = bisect.bisect_left(self._names, query)
+            end = start
+            while end < len(self._names) and self._names[end].startswith(query):
+                end += 1
+            return self._names[start:end]
+
+        candidates = self._names
+        if len(query) >= NGRAM_LENGTH:
+            candidates = self._intersect(self._name_grams, query)
+        return [name for name in candidates if query in name]
+
+    def _find_values(self, query, prefix) -> List:
+        candidates = self._values.keys()
+        if len(query) >= NGRAM_LENGTH:
+            candidates = self._intersect(self._value_grams, query)
+        if prefix:
+            return [prop for prop in candidates if self._values[prop].lower().startswith(query)]
+        return [prop for prop in candidates if query in self._values[prop].lower()]
+
+    @staticmethod
+    def _intersect(grams: Dict[str, Set], query) -> Set:
+        # Rarest n-grams go first, so that the intersection shrinks as soon as possible
+        postings = sorted((grams.get(gram, ()) for gram in SearchIndex._grams(query)), key=len)
+        if len(postings[0]) == 0:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if len(result) == 0:
+                break
+        return result
+
+    def _add_name(self, prop, name):
+        key = name.lower()
+        properties = self._properties_by_name.get(key)
+        if properties is None:
+            properties = self._properties_by_name[key] = set()
+            self._names.append(key)
+            for gram in self._grams(key):
+                self._name_grams.setdefault(gram, set()).add(key)
+        properties.add(prop)
+
+    @staticmethod
+    def _grams(text) -> Set[str]:
+        return set(text[i:i + NGRAM_LENGTH] for i in range(len(text) - NGRAM_LENGTH + 1))
@@ -0,0 +1,653 @@
+import bisect
+from typing import Dict, Tuple, Optional, List, FrozenSet, Iterator, Set, Iterable
+
+from .interpolation import Interpolator, Template
+from .search_index import SearchIndex
+
+# Maximum number of names in a block of SortedNames, bigger blocks are split
+NAME_BLOCK_SIZE = 256
+# Number of properties changed since the search index was built, after which the index is built again
+SEARCH_INDEX_MAX_CHANGES = 1000
+
+
+class ShardedMap:
+    """
+    Immutable map split into shards. Updated copy shares all untouched shards with the original. The number
+    of shards follows the square root of the size, so an update copies about as many shard references as entries
+    of the changed shards, rather than the whole map.
+    """
+    __slots__ = ("_shards", "_size")
+
+    def __init__(self, shards: Tuple[Dict, ...] = None, size=0):
+        self._shards = shards if shards is not None else ({},)
+        self._size = size
+
+    def get(self, key, default=None):
+        return self._shards[hash(key) % len(self._shards)].get(key, default)
+
+    def __contains__(self, key):
+        return key in self._shards[hash(key) % len(self._shards)]
+
+    def __len__(self):
+        return self._size
+
+    def keys(self) -> Iterator:
+        for shard in self._shards:
+            yield from shard.keys()
+
+    def values(self) -> Iterator:
+        for shard in self._shards:
+            yield from shard.values()
+
+    def items(self) -> Iterator:
+        for shard in self._shards:
+            yield from shard.items()
+
+    def updated(self, changes: Dict) -> "ShardedMap":
+        """
+        Returns copy of this map with given changes applied
+        :param changes: new values by key, None removes the key
+        """
+        count = len(self._shards)
+        shards = list(self._shards)
+        copied = set()
+        size = self._size
+        for (key, value) in changes.items():
+            index = hash(key) % count
+            if index not in copied:
+                shards[index] = dict(shards[index])
+                copied.add(index)
+
+            shard = shards[index]
+            if value is None:
+                if key in shard:
+                    del shard[key]
+                    size -= 1
+            else:
+                if key not in shard:
+                    size += 1
+                shard[key] = value
+
+        if size > 4 * count * count:
+            # Shards have grown too big, the map is split again (the size has quadrupled since the last split)
+            return ShardedMap.of({key: value for shard in shards for (key, value) in shard.items()})
+        return ShardedMap(tuple(shards), size)
+
+    @staticmethod
+    def of(items: Dict) -> "ShardedMap":
+        count = 1
+        while count * count < len(items):
+            count *= 2
+        shards = tuple({} for _ in range(count))
+        for (key, value) in items.items():
+            shards[hash(key) % count][key] = value
+        return ShardedMap(shards, len(items))
+
+
+class SortedNames:
+    """
+    Immutable sorted sequence of distinct names split into blocks. Updated copy shares untouched blocks with
+    the original, so an update copies the blocks of the changed names and the block boundaries only.
+    """
+    __slots__ = ("_blocks", "_firsts")
+
+    # First name of every block
+    _firsts: List[str]
+
+    def __init__(self, blocks: Tuple[List[str], ...] = (), firsts: List[str] = None):
+        self._blocks = blocks
+        self._firsts = firsts if firsts is not None else [block[0] for block in blocks]
+
+    def after(self, name=None) -> Iterator[str]:
+        """
+        Iterates names following given name in order, all names if the name isn't specified
+        """
+        if len(self._blocks) == 0:
+            return
+        (block_index, start) = (0, 0)
+        if name is not None:
+            block_index = max(bisect.bisect_right(self._firsts, name) - 1, 0)
+            start = bisect.bisect_right(self._blocks[block_index], name)
+        for index in range(block_index, len(self._blocks)):
+            block = self._blocks[index]
+            for position in range(start if index == block_index else 0, len(block)):
+                yield block[position]
+
+    def updated(self, added: Iterable[str], removed: Iterable[str]) -> "SortedNames":
+        """
+        Returns copy of this sequence with given names added and removed
+        """
+        blocks = list(self._blocks)
+        firsts = list(self._firsts)
+        # Identities of the blocks created by this update, they can be modified in place
+        owned = set()
+
+        def locate(_name) -> int:
+            index = max(bisect.bisect_right(firsts, _name) - 1, 0)
+            if id(blocks[index]) not in owned:
+                blocks[index] = list(blocks[index])
+                owned.add(id(blocks[index]))
+            return index
+
+        for name in removed:
+            if len(blocks) == 0:
+                break
+            index = locate(name)
+            block = blocks[index]
+            position = bisect.bisect_left(block, name)
+            if position < len(block) and block[position] == name:
+                del block[position]
+                if len(block) == 0:
+                    del blocks[index]
+                    del firsts[index]
+                else:
+                    firsts[index] = block[0]
+
+        for name in added:
+            if len(blocks) == 0:
+                blocks.append([name])
+                firsts.append(name)
+                owned.add(id(blocks[0]))
+                continue
+            index = locate(name)
+            block = blocks[index]
+            position = bisect.bisect_left(block, name)
+            if position < len(block) and block[position] == name:
+                continue
+            block.insert(position, name)
+            firsts[index] = block[0]
+            if len(block) > 2 * NAME_BLOCK_SIZE:
+                tail = block[NAME_BLOCK_SIZE:]
+                del block[NAME_BLOCK_SIZE:]
+                blocks.insert(index + 1, tail)
+                firsts.insert(index + 1, tail[0])
+                owned.add(id(tail))
+        return SortedNames(tuple(blocks), firsts)
+
+    @staticmethod
+    def of(names: Iterable[str]) -> "SortedNames":
+        names = sorted(names)
+        return SortedNames(tuple(names[i:i + NAME_BLOCK_SIZE] for i in range(0, len(names), NAME_BLOCK_SIZE)))
+
+
+class PropertySnapshot:
+    __slots__ = ("id", "name", "value", "type", "enabled", "profile_id")
+
+    def __init__(self, prop, profile_id):
+        self.id = prop.id
+        self.name = prop.name
+        self.value = prop.value
+        self.type = prop.type
+        self.enabled = prop.enabled
+        self.profile_id = profile_id
+
+
+class ProfileSnapshot:
+    __slots__ = ("id", "name", "priority", "enabled", "_properties_by_id", "_properties_by_name", "_sorted_names")
+
+    _properties_by_id: ShardedMap
+    # Properties by name and their names in order, created on first page request and then patched with every change
+    _properties_by_name: Optional[ShardedMap]
+    _sorted_names: Optional[SortedNames]
+
+    def __init__(self, profile, properties_by_id: ShardedMap, properties_by_name: ShardedMap = None,
+                 sorted_names: SortedNames = None):
+        self.id = profile.id
+        self.name = profile.name
+        self.priority = profile.priority
+        self.enabled = profile.enabled
+        self._properties_by_id = properties_by_id
+        self._properties_by_name = properties_by_name
+        self._sorted_names = sorted_names
+
+    @property
+    def properties(self) -> Tuple[PropertySnapshot, ...]:
+        return tuple(self._properties_by_id.values())
+
+    @property
+    def property_count(self) -> int:
+        return len(self._properties_by_id)
+
+    def get_property(self, property_id) -> Optional[PropertySnapshot]:
+        return self._properties_by_id.get(int(property_id))
+
+    def get_properties_page(self, after=None, limit=None) -> List[PropertySnapshot]:
+        """
+        Returns properties ordered by name
+        :param after: name of the last property of the previous page
+        :param limit: maximum number of returned properties
+        """
+        properties_by_name = self._properties_by_name
+        names = self._sorted_names
+        if properties_by_name is None or names is None:
+            properties_by_name = ShardedMap.of({prop.name: prop for prop in self._properties_by_id.values()})
+            names = SortedNames.of(properties_by_name.keys())
+            (self._properties_by_name, self._sorted_names) = (properties_by_name, names)
+
+        page = []
+        for name in names.after(after):
+            if limit is not None and len(page) == limit:
+                break
+            page.append(properties_by_name.get(name))
+        return page
+
+    def evolve(self, profile, changed_property_ids: Iterable[int]) -> "ProfileSnapshot":
+        """
+        Creates snapshot of given profile sharing snapshots of its unchanged properties with this one
+        """
+        by_id = {}
+        by_name = {}
+        for property_id in changed_property_ids:
+            previous = self._properties_by_id.get(property_id)
+            prop = profile.get_property(property_id)
+            snapshot = PropertySnapshot(prop, profile.id) if prop is not None else None
+            by_id[property_id] = snapshot
+            if previous is not None:
+                # Name is released, unless another changed property takes it
+                by_name.setdefault(previous.name, None)
+            if snapshot is not None:
+                by_name[snapshot.name] = snapshot
+
+        properties_by_name = self._properties_by_name
+        names = self._sorted_names
+        if properties_by_name is not None and names is not None:
+            added = [name for (name, prop) in by_name.items() if prop is not None and name not in properties_by_name]
+            removed = [name for (name, prop) in by_name.items() if prop is None and name in properties_by_name]
+            names = names.updated(added, removed)
+            properties_by_name = properties_by_name.updated(by_name)
+        return ProfileSnapshot(profile, self._properties_by_id.updated(by_id), properties_by_name, names)
+
+    @staticmethod
+    def create(profile, properties: List = None) -> "ProfileSnapshot":
+        """
+        :param properties: properties of the profile, if they aren't loaded (see ProfileCache.fetch)
+        """
+        properties = properties if properties is not None else profile.properties
+        return ProfileSnapshot(profile, ShardedMap.of({prop.id: PropertySnapshot(prop, profile.id)
+                                                       for prop in properties}))
+
+
+ChainEntry = Tuple[ProfileSnapshot, PropertySnapshot]
+
+
+class EnvironmentSnapshot:
+    """
+    Immutable resolved state of an environment at given version. Snapshots are created by the writer holding
+    the environment lock and published with a single assignment, readers use them without any locking.
+    Next snapshot is created by patching the previous one with changed profiles, properties and names only,
+    all unchanged structures are shared with it.
+    """
+    __slots__ = ("id", "name", "version", "_order", "_profiles", "_priorities", "_profiles_by_id", "_chains",
+                 "_winners", "_sorted_names", "_templated", "_dependents", "_expanded", "_search", "_search_changes",
+                 "__weakref__")
+
+    id: int
+    name: str
+    version: int
+    # Profile ids ordered by priority, profiles themselves (and their priorities) are listed on first request
+    _order: Tuple[int, ...]
+    _profiles: Optional[Tuple[ProfileSnapshot, ...]]
+    _priorities: Optional[List[int]]
+    _profiles_by_id: ShardedMap
+    # Chains contain only enabled properties, ordered from highest to lowest profile priority. Chains and winners
+    # don't refer to profile snapshots, so that they don't have to be recreated when a profile is toggled or renamed.
+    _chains: ShardedMap
+    _winners: ShardedMap
+    # Property names (keys of chains) in order, created on first page request and then patched with every change
+    _sorted_names: Optional[SortedNames]
+    # Properties whose values contain references, with the referenced names, by property id
+    _templated: ShardedMap
+    # Ids of templated properties by the names they reference or are named, expanded values of these properties
+    # depend on the winners of the names
+    _dependents: ShardedMap
+    _expanded: ShardedMap
+    # Search index of an earlier snapshot, created on first search and shared by the following snapshots together
+    # with pairs (profile id, property id) of the properties changed since then
+    _search: Optional[SearchIndex]
+    _search_changes: FrozenSet[Tuple[int, int]]
+
+    def get_profile(self, profile_id) -> Optional[ProfileSnapshot]:
+        return self._profiles_by_id.get(int(profile_id))
+
+    def get_prioritized_profiles(self) -> Tuple[ProfileSnapshot, ...]:
+        profiles = self._profiles
+        if profiles is None:
+            profiles = self._profiles = tuple(self._profiles_by_id.get(profile_id) for profile_id in self._order)
+        return profiles
+
+    def get_profiles_after(self, priority) -> Tuple[ProfileSnapshot, ...]:
+        """
+        Returns profiles following the profile with given priority, in the order of get_prioritized_profiles
+        """
+        profiles = self.get_prioritized_profiles()
+        priorities = self._priorities
+        if priorities is None:
+            priorities = self._priorities = [p.priority for p in profiles]
+        return profiles[bisect.bisect_right(priorities, priority):]
+
+    def get_property_chain(self, property_name, enabled_only=True) -> List[ChainEntry]:
+        """
+        Returns list of pairs (profile, property) for given property name, see Environment.get_property_chain
+        """
+        entries = [self._to_entry(prop) for prop in self._chains.get(property_name, ())]
+        if not enabled_only:
+            return entries
+        return [(profile, prop) for (profile, prop) in entries if profile.enabled]
+
+    def get_first_property(self, property_name, enabled_only=True) -> Optional[ChainEntry]:
+        if enabled_only:
+            prop = self._winners.get(property_name)
+        else:
+            chain = self._chains.get(property_name, ())
+            prop = chain[0] if len(chain) > 0 else None
+        return self._to_entry(prop) if prop is not None else None
+
+    def get_resolved_properties(self, enabled_only=True) -> List[ChainEntry]:
+        if enabled_only:
+            return [self._to_entry(prop) for prop in self._winners.values()]
+        return [self._to_entry(chain[0]) for chain in self._chains.values() if len(chain) > 0]
+
+    def get_resolved_page(self, after=None, limit=None, enabled_only=True) -> List[ChainEntry]:
+        """
+        Returns resolved properties ordered by name, cost depends on the size of the page rather than
+        on the number of properties
+        :param after: name of the last property of the previous page
+        :param limit: maximum number of returned properties
+        """
+        names = self._sorted_names
+        if names is None:
+            names = self._sorted_names = SortedNames.of(self._chains.keys())
+
+        entries = []
+        for name in names.after(after):
+            if limit is not None and len(entries) == limit:
+                break
+            entry = self.get_first_property(name, enabled_only)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def get_property_names(self) -> List[str]:
+        return list(self._chains.keys())
+
+    def get_expanded_value(self, prop: PropertySnapshot) -> Optional[str]:
+        return self._expanded.get(prop.id, prop.value)
+
+    def search_properties(self, query, prefix=False, names=True, values=True,
+                          profile_id=None) -> List[Tuple[ProfileSnapshot, PropertySnapshot, str, bool]]:
+        """
+        Finds properties whose name or value starts with (prefix) or contains given query, ignoring case.
+        Properties found by the search index are checked against this snapshot, properties changed since the index
+        was built are matched one by one.
+        :param profile_id: id of the only profile to search, all profiles if not specified
+        :return: quadruples (profile, property, match, winner), where match is the field that has matched (MATCH_NAME
+        or MATCH_VALUE) and winner tells whether the property is the resolved one. Resolved properties go first,
+        then name matches (exact name, name prefix, other name matches) and value matches, ordered by name
+        and profile priority.
+        """
+        index = self._search
+        if index is None:
+            index = self._search = SearchIndex.build(prop for profile in self.get_prioritized_profiles()
+                                                     for prop in profile.properties)
+
+        hits = {}
+        for (prop, match, rank) in index.search(query, prefix, names, values):
+            profile = self._profiles_by_id.get(prop.profile_id)
+            if profile is not None and profile.get_property(prop.id) is prop:
+                hits[prop.profile_id, prop.id] = (prop, match, rank)
+        for (changed_profile_id, property_id) in self._search_changes:
+            profile = self._profiles_by_id.get(changed_profile_id)
+            prop = profile.get_property(property_id) if profile is not None else None
+            if prop is None or index.contains(prop):
+                continue
+            matched = SearchIndex.match(prop, query, prefix, names, values)
+            if matched is not None:
+                hits[changed_profile_id, property_id] = (prop, matched[0], matched[1])
+
+        results = []
+        for (prop, match, rank) in hits.values():
+            if profile_id is not None and prop.profile_id != profile_id:
+                continue
+            profile = self._profiles_by_id.get(prop.profile_id)
+            winner = self._winners.get(prop.name) is prop
+            results.append((0 if winner else 1, rank, prop.name.lower(), profile.priority, profile, prop, match,
+                            winner))
+        results.sort(key=lambda r: r[:4])
+        return [r[4:] for r in results]
+
+    def patch(self, env, changed_profiles: Set[int], changed_properties: Set[Tuple[int, int]],
+              changed_names: Set[str], changed_winners: Set[str]) -> "EnvironmentSnapshot":
+        """
+        Creates snapshot of the current state of given environment from this snapshot, cost depends on the number
+        of changes rather than on the size of the environment
+        :param env: environment this snapshot was created from
+        :param changed_profiles: ids of profiles that were added, removed or modified
+        :param changed_properties: pairs (profile id, property id) of properties that were added, removed or modified
+        :param changed_names: property names whose chains might have changed
+        :param changed_winners: property names whose winners or expanded values might have changed
+        """
+        snapshot = EnvironmentSnapshot()
+        snapshot.id = env.id
+        snapshot.name = env.name
+        snapshot.version = env.version
+
+        changed_property_ids = {}
+        for (profile_id, property_id) in changed_properties:
+            changed_property_ids.setdefault(profile_id, []).append(property_id)
+
+        profiles = {}
+        reordered = False
+        for profile_id in changed_profiles:
+            profile = env.get_profile(profile_id)
+            previous = self._profiles_by_id.get(profile_id)
+            if profile is None:
+                profiles[profile_id] = None
+            elif previous is None:
+                profiles[profile_id] = ProfileSnapshot.create(profile)
+            else:
+                profiles[profile_id] = previous.evolve(profile, changed_property_ids.get(profile_id, ()))
+            reordered = reordered or profile is None or previous is None or profile.priority != previous.priority
+        snapshot._profiles_by_id = self._profiles_by_id.updated(profiles)
+        snapshot._set_order(self._order if not reordered else None)
+
+        chains = {}
+        for name in changed_names:
+            chains[name] = snapshot._create_chain(env, name) if env.has_property_name(name) else None
+        snapshot._chains = self._chains.updated(chains)
+        snapshot._sorted_names = None
+        if self._sorted_names is not None:
+            added = [name for (name, chain) in chains.items() if chain is not None and name not in self._chains]
+            removed = [name for (name, chain) in chains.items() if chain is None and name in self._chains]
+            snapshot._sorted_names = self._sorted_names.updated(added, removed)
+
+        winners = {}
+        changed_names = changed_names | changed_winners
+        for name in changed_names:
+            winner = env.get_first_property(name)
+            winners[name] = snapshot._to_property(winner[0].id, winner[1].id) if winner is not None else None
+        snapshot._winners = self._winners.updated(winners)
+
+        templated = {}
+        # Changed sets of dependents, by name
+        dependents = {}
+        expanded = {}
+
+        def _dependents_of(_name) -> Set[int]:
+            ids = dependents.get(_name)
+            if ids is None:
+                ids = dependents[_name] = set(self._dependents.get(_name, ()))
+            return ids
+
+        for (profile_id, property_id) in changed_properties:
+            previous = self._templated.get(property_id)
+            if previous is not None:
+                templated[property_id] = None
+                expanded[property_id] = None
+                for name in previous[1] | {previous[0].name}:
+                    _dependents_of(name).discard(property_id)
+            profile = snapshot._profiles_by_id.get(profile_id)
+            prop = profile.get_property(property_id) if profile is not None else None
+            if prop is not None and Template.has_references(prop.value):
+                references = Template.compile(prop.value).references
+                templated[property_id] = (prop, references)
+                for name in references | {prop.name}:
+                    _dependents_of(name).add(property_id)
+        snapshot._templated = self._templated.updated(templated)
+        snapshot._dependents = self._dependents.updated({name: frozenset(ids) if len(ids) > 0 else None
+                                                         for (name, ids) in dependents.items()})
+
+        expanded_ids = {property_id for (property_id, entry) in templated.items() if entry is not None}
+        for name in changed_names:
+            expanded_ids.update(snapshot._dependents.get(name, ()))
+        for property_id in expanded_ids:
+            expanded[property_id] = snapshot._expand(env, snapshot._templated.get(property_id)[0])
+        snapshot._expanded = self._expanded.updated(expanded)
+
+        # Index might be built by a reader in the meantime, it's read only once
+        index = self._search
+        search_changes = self._search_changes | changed_properties if index is not None else frozenset()
+        if len(search_changes) > SEARCH_INDEX_MAX_CHANGES:
+            # Matching the changed properties one by one would cost more than building the index again
+            index = None
+            search_changes = frozenset()
+        snapshot._search = index
+        snapshot._search_changes = search_changes
+        return snapshot
+
+    @staticmethod
+    def build(env, properties: Dict[int, List] = None) -> "EnvironmentSnapshot":
+        """
+        Creates snapshot of the whole environment
+        :param properties: properties of the profiles that aren't loaded, by profile id (lazy loading mode). If they're
+        specified, the environment doesn't have to be indexed, values are expanded against the snapshot itself.
+        """
+        snapshot = EnvironmentSnapshot()
+        snapshot.id = env.id
+        snapshot.name = env.name
+        snapshot.version = env.version
+        snapshot._profiles_by_id = ShardedMap.of({
+            profile.id: ProfileSnapshot.create(profile, properties.get(profile.id, [])
+                                               if properties is not None and not profile.is_loaded() else None)
+            for profile in env.profiles})
+        snapshot._set_order()
+
+        chains = {}
+        winners = {}
+        templated = {}
+        dependents = {}
+        expanded = {}
+        for profile in snapshot.get_prioritized_profiles():
+            for prop in profile.properties:
+                if Template.has_references(prop.value):
+                    references = Template.compile(prop.value).references
+                    templated[prop.id] = (prop, references)
+                    for name in references | {prop.name}:
+                        dependents.setdefault(name, set()).add(prop.id)
+
+                chain = chains.setdefault(prop.name, [])
+                if prop.enabled:
+                    chain.append(prop)
+                    if profile.enabled and prop.name not in winners:
+                        winners[prop.name] = prop
+
+        if properties is None:
+            for (prop, _) in templated.values():
+                expanded[prop.id] = snapshot._expand(env, prop)
+        else:
+            interpolator = Interpolator(lambda _name: winners[_name].value if _name in winners else None)
+            interpolator.add_all(winners.keys())
+            for (prop, _) in templated.values():
+                if winners.get(prop.name) is prop:
+                    expanded[prop.id] = interpolator.expand(prop.name)
+                else:
+                    expanded[prop.id] = interpolator.expand_value(prop.value)
+
+        snapshot._chains = ShardedMap.of({name: tuple(chain) for (name, chain) in chains.items()})
+        snapshot._winners = ShardedMap.of(winners)
+        snapshot._sorted_names = None
+        snapshot._templated = ShardedMap.of(templated)
+        snapshot._dependents = ShardedMap.of({name: frozenset(ids) for (name, ids) in dependents.items()})
+        snapshot._expanded = ShardedMap.of(expanded)
+        snapshot._search = None
+        snapshot._search_changes = frozenset()
+        return snapshot
+
+    def _set_order(self, order: Tuple[int, ...] = None):
+        """
+        :param order: profile ids ordered by priority, if they haven't changed, computed from the profiles otherwise
+        """
+        if order is None:
+            order = tuple(p.id for p in sorted(self._profiles_by_id.values(), key=lambda p: p.priority))
+        self._order = order
+        self._profiles = None
+        self._priorities = None
+
+    def _create_chain(self, env, name) -> Tuple[PropertySnapshot, ...]:
+        return tuple(self._to_property(profile.id, prop.id) for (profile, prop) in env.get_property_chain(name, False))
+
+    def _to_property(self, profile_id, property_id) -> PropertySnapshot:
+        return self._profiles_by_id.get(profile_id).get_property(property_id)
+
+    def _to_entry(self, prop: PropertySnapshot) -> ChainEntry:
+        return self._profiles_by_id.get(prop.profile_id), prop
+
+    @staticmethod
+    def _expand(env, prop: PropertySnapshot) -> Optional[str]:
+        profile = env.get_profile(prop.profile_id)
+        return env.get_expanded_value(profile.get_property(prop.id))
+
+
+class PartialSnapshot:
+    """
+    Snapshot of a single profile of an environment whose profiles are loaded lazily (see Environment.get_snapshot),
+    profile-scoped reads are served from it without loading the other profiles. Values are expanded on request,
+    under the environment lock, against the current state of the environment. Referenced names are looked up
+    in the loaded profiles and in the database (see Environment.find_first_property).
+    """
+    __slots__ = ("id", "name", "_env", "_profile", "_interpolator", "_winners")
+
+    id: int
+    name: str
+    _profile: Optional[ProfileSnapshot]
+    # Winners of the names registered in the interpolator so far
+    _winners: Dict[str, Optional[object]]
+
+    def __init__(self, env, profile: Optional[ProfileSnapshot]):
+        self.id = env.id
+        self.name = env.name
+        self._env = env
+        self._profile = profile
+        self._winners = {}
+        self._interpolator = Interpolator(self._get_resolved_value)
+
+    def get_profile(self, profile_id) -> Optional[ProfileSnapshot]:
+        profile = self._profile
+        return profile if profile is not None and profile.id == int(profile_id) else None
+
+    def get_expanded_value(self, prop: PropertySnapshot) -> Optional[str]:
+        if not Template.has_references(prop.value):
+            return prop.value
+        with self._env.lock:
+            self._register(prop.name, prop.value)
+            winner = self._winners.get(prop.name)
+            if winner is not None and winner.id == prop.id:
+                return self._interpolator.expand(prop.name)
+            return self._interpolator.expand_value(prop.value)
+
+    def _register(self, name, value):
+        """
+        Looks up winners of given name and of all names referenced by the value, transitively
+        """
+        pending = [name] + list(Template.compile(value).references)
+        while len(pending) > 0:
+            current = pending.pop()
+            if current in self._winners:
+                continue
+            winner = self._winners[current] = self._env.find_first_property(current)
+            self._interpolator.add_all([current])
+            if winner is not None and Template.has_references(winner.value):
+                pending.extend(Template.compile(winner.value).references)
+
+    def _get_resolved_value(self, property_name) -> Optional[str]:
+        winner = self._winners.get(property_name)
+        return winner.value if winner is not None else None
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from ..log import Log
+
+# Number of consecutive attempts to flush the same changes before the flusher gives up on them
+MAX_FLUSH_ATTEMPTS = 5
+# Upper bound (in seconds) of the delay between two attempts, the delay doubles with every failed attempt
+MAX_RETRY_DELAY = 30
+
+
+class PersistenceFlusher:
+    """
+    Background thread persisting changes in write-behind mode. Flush requests are coalesced: the flusher waits
+    up to max_delay milliseconds (or until max_batch requests are pending) and then persists all of them
+    with a single commit. A failed flush is retried with exponential backoff, after MAX_FLUSH_ATTEMPTS failures
+    the changes stay in memory until the next flush request and the error is raised by stop().
+    """
+    _flush: callable
+    _max_delay: float
+    _max_batch: int
+
+    def __init__(self, flush, max_delay, max_batch):
+        self._flush = flush
+        self._max_delay = max_delay / 1000
+        self._max_batch = max_batch
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._running = False
+        self._thread = None
+        # Error of the last flush, if it has failed
+        self.error = None
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(target=self._run, name="persistence-flusher", daemon=True)
+        self._thread.start()
+        Log.i("Write-behind persistence enabled (max delay: {} ms, max batch: {})",
+              int(self._max_delay * 1000), self._max_batch)
+
+    def request_flush(self):
+        with self._condition:
+            self._pending += 1
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Stops the flusher after all pending requests were persisted
+        :raises Exception: error of the last flush, if the pending changes couldn't be persisted
+        """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify()
+
+        self._thread.join()
+        self._thread = None
+        if self.error is not None:
+            raise Exception("Changes couldn't be persisted: {}".format(self.error))
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._condition:
+                while self._pending == 0 and self._running:
+                    self._condition.wait()
+                if self._pending == 0:
+                    break
+
+                deadline = time.monotonic() + self._max_delay
+                while self._running and self._pending < self._max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending
+                self._pending = 0
+
+            try:
+                self._flush()
+                self.error = None
+                failures = 0
+                Log.d("Flushed {} coalesced change request(s)", batch)
+            except Exception as e:
+                # Changes stay in the journal, they'll be persisted by the next successful flush
+                self.error = e
+                failures += 1
+                if failures >= MAX_FLUSH_ATTEMPTS or not self._running:
+                    Log.e("Error while flushing changes, giving up after {} attempt(s) until the next change: {}",
+                          failures, e)
+                    failures = 0
+                    continue
+
+                delay = min(self._max_delay * 2 ** failures, MAX_RETRY_DELAY)
+                Log.w("Error while flushing changes (attempt {}), retrying in {} ms: {}", failures, int(delay * 1000), e)
+                with self._condition:
+                    self._pending += batch
+                    # New requests don't cut the backoff short, stop() does
+                    deadline = time.monotonic() + delay
+                    while self._running and time.monotonic() < deadline:
+                        self._condition.wait(deadline - time.monotonic())
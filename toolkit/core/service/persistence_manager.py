@@ -1,175 +1,448 @@
-from typing import List, Dict
+import math
+import sqlite3
+import time
+from typing import List, Dict, Tuple, Optional
 
 from ..sqlite.db_manager import DBManager
 from ..model.environment import Environment
-from ..model.base.entity import PendingEntityBuffer
+from ..model.profile_cache import ProfileCache
+from ..model.base.unit_of_work import UnitOfWork
 from ..model.profile import Profile
 from ..model.property import Property
 from ..log import Log
+from ..metrics import Metrics, SQL_COMMIT_DURATION
+
+DELETE_CHUNK_SIZE = 500
+# Number of profiles whose properties are selected by a single query
+LOAD_CHUNK_SIZE = 500
+# Revision of the environment registry, environments themselves are keyed by their ids
+REGISTRY_REVISION_KEY = 0
 
 
 class PersistenceManager:
+    # Parents go first, so that their ids can be propagated to their children before they're inserted
+    _ENTITY_CLASSES = [Environment, Profile, Property]
+
+    @staticmethod
+    def load_environments(environment_id=None, cache: ProfileCache = None) -> List[Environment]:
+        """
+        Loads all environments together with their profiles and properties. Every table is read with a single
+        ordered scan and children are attached to their parents in one pass.
+        :param environment_id: id of the only environment to load, all environments if not specified
+        :param cache: cache the properties are loaded from on first access, if specified properties aren't loaded
+        """
+        start = time.time()
+        rows = PersistenceManager.select_rows(environment_id, cache is None)
+        environments = PersistenceManager.build_environments(rows, cache)
+
+        elapsed = math.floor((time.time() - start) * 1000)
+        (environment_rows, profile_rows, property_rows) = rows
+        if cache is not None:
+            Log.i("Loaded {} environments and {} profiles in {} ms, properties are loaded on demand",
+                  len(environment_rows), len(profile_rows), elapsed)
+        else:
+            Log.i("Loaded {} environments, {} profiles and {} properties in {} ms",
+                  len(environment_rows), len(profile_rows), len(property_rows), elapsed)
+        return environments
 
     @staticmethod
-    def load_environments():
+    def select_rows(environment_id=None, with_properties=True) -> Tuple[List[Tuple], List[Tuple], Optional[List[Tuple]]]:
+        """
+        Selects rows of environments, profiles and properties (in the order of their COLUMNS) the model is built from
+        :param environment_id: id of the only environment to select, all environments if not specified
+        :param with_properties: whether to select properties, None is returned in their place otherwise
+        :return: rows of environments, profiles and properties
+        """
+        if environment_id is not None:
+            environment_filter = " where id = ?"
+            profile_filter = " where environment_id = ?"
+            property_filter = " where profile_id in (select id from profile where environment_id = ?)"
+            parameters = (environment_id,)
+        else:
+            environment_filter = profile_filter = property_filter = ""
+            parameters = ()
+
         db = DBManager.db()
-        c = db.cursor()
-        c.execute("select * from environment")
-        rows = c.fetchall()
-        column_names = [d[0] for d in c.description]
-        c.close()
-
-        environments = []
-        for row in rows:
-            e = Environment()
-            data = {cname: value for (cname, value) in zip(column_names, row)}
-            e.deserialize(data)
-            PersistenceManager._populate_environment(db, e)
-            environments.append(e)
+        environment_rows = PersistenceManager._select_all(
+            db, Environment, "select {} from environment{} order by id", environment_filter, parameters)
+        profile_rows = PersistenceManager._select_all(
+            db, Profile, "select {} from profile{} order by environment_id, priority", profile_filter, parameters)
+        property_rows = None
+        if with_properties:
+            property_rows = PersistenceManager._select_all(
+                db, Property, "select {} from property{} order by profile_id, id", property_filter, parameters)
+        return environment_rows, profile_rows, property_rows
 
-        return environments
+    @staticmethod
+    def build_environments(rows: Tuple[List[Tuple], List[Tuple], Optional[List[Tuple]]],
+                           cache: ProfileCache = None) -> List[Environment]:
+        """
+        Creates environments from rows returned by select_rows
+        :param cache: cache the properties are loaded from on first access, properties have to be selected otherwise
+        """
+        (environment_rows, profile_rows, property_rows) = rows
+        environments = {}
+        for row in environment_rows:
+            env = Environment()
+            env.deserialize_row(row)
+            environments[env.id] = env
+
+        profiles = {}
+        for row in profile_rows:
+            profile = Profile()
+            profile.deserialize_row(row)
+            profiles[profile.id] = profile
+
+        if cache is not None:
+            for profile in profiles.values():
+                profile.defer_properties(cache)
+        else:
+            properties = {profile_id: [] for profile_id in profiles}
+            for row in property_rows:
+                profile_properties = properties.get(row[5])
+                if profile_properties is None:
+                    continue
+                prop = Property()
+                prop.deserialize_row(row)
+                profile_properties.append(prop)
+            for (profile_id, profile_properties) in properties.items():
+                profiles[profile_id].attach_loaded_properties(profile_properties)
+
+        # Profiles are attached after their properties so that every environment indexes them in a single pass
+        profiles_by_environment = {env_id: [] for env_id in environments}
+        for profile in profiles.values():
+            if profile.environment_id in profiles_by_environment:
+                profiles_by_environment[profile.environment_id].append(profile)
+        for (env_id, env_profiles) in profiles_by_environment.items():
+            environments[env_id].attach_profiles(env_profiles)
+        return list(environments.values())
+
+    @staticmethod
+    def load_properties(profile_ids: List[int]) -> Dict[int, List[Property]]:
+        """
+        Loads properties of given profiles (see ProfileCache), ordered by their ids
+        :return: lists of properties by profile id
+        """
+        db = DBManager.db()
+        properties = {}
+        for i in range(0, len(profile_ids), LOAD_CHUNK_SIZE):
+            chunk = profile_ids[i:i + LOAD_CHUNK_SIZE]
+            start = time.perf_counter()
+            rows = db.execute("select {} from property where profile_id in ({}) order by profile_id, id"
+                              .format(", ".join(Property.COLUMNS), ", ".join("?" * len(chunk))), chunk).fetchall()
+            Metrics.record_query("select", Property.TABLE, time.perf_counter() - start, len(rows))
+            for row in rows:
+                prop = Property()
+                prop.deserialize_row(row)
+                properties.setdefault(row[5], []).append(prop)
+        return properties
 
     @staticmethod
-    def persist_changes(environments: List[Environment]):
+    def find_properties(profile_ids: List[int], property_name) -> Dict[int, Property]:
+        """
+        Loads properties with given name of given profiles (see ProfileCache)
+        :return: properties by profile id
+        """
+        db = DBManager.db()
+        properties = {}
+        for i in range(0, len(profile_ids), LOAD_CHUNK_SIZE):
+            chunk = profile_ids[i:i + LOAD_CHUNK_SIZE]
+            start = time.perf_counter()
+            rows = db.execute("select {} from property where profile_id in ({}) and name = ?"
+                              .format(", ".join(Property.COLUMNS), ", ".join("?" * len(chunk))),
+                              chunk + [property_name]).fetchall()
+            Metrics.record_query("select", Property.TABLE, time.perf_counter() - start, len(rows))
+            for row in rows:
+                prop = Property()
+                prop.deserialize_row(row)
+                properties[row[5]] = prop
+        return properties
+
+    @staticmethod
+    def persist_changes(journal: UnitOfWork, revision_key=None) -> Optional[Tuple[int, int]]:
+        """
+        Flushes entities registered in the journal, cost of this operation depends only on the number of changes
+        :param revision_key: id of the environment the journal belongs to (REGISTRY_REVISION_KEY for the journal
+        of the context), its revision is increased in the same transaction
+        :return: pair (previous revision, new revision) or None if nothing was persisted
+        """
+        if journal.is_empty():
+            return None
+
         Log.d("Persisting changes to the database")
+        new_entities = [e for e in journal.new_entities if e.is_attached()]
+        dirty_entities = [e for e in journal.dirty_entities if e.is_attached()]
+        deleted_entities = list(journal.deleted_entities)
+
+        db = DBManager.db()
+        revisions = None
         try:
-            PersistenceManager._create_new_entities(environments)
-            PersistenceManager._modify_existing_entities(environments)
-            PersistenceManager._delete_entities()
-            DBManager.db().commit()
+            if revision_key is not None:
+                revisions = PersistenceManager._increase_revision(db, revision_key)
+            # Deleted rows go first and new rows last, a name released by a deleted or renamed property
+            # can be taken by another one in the same journal
+            PersistenceManager._delete_entities(db, deleted_entities)
+            PersistenceManager._modify_existing_entities(db, dirty_entities)
+            PersistenceManager._create_new_entities(db, new_entities)
+            commit_start = time.perf_counter()
+            db.commit()
+            SQL_COMMIT_DURATION.observe(time.perf_counter() - commit_start)
+        except sqlite3.OperationalError as e:
+            # Database is locked or can't be written, the journal is kept and flushed again later
+            db.rollback()
+            Log.e("Error while persisting changes")
+            raise e
         except Exception as e:
-            DBManager.db().rollback()
+            # Rows of some entity were rejected, the others mustn't be blocked by it
+            db.rollback()
+            Log.e("Error while persisting changes: {}, persisting entities one by one", e)
+            revisions = PersistenceManager._persist_one_by_one(db, revision_key, deleted_entities, dirty_entities,
+                                                               new_entities)
+
+        for entity in new_entities + dirty_entities:
+            entity.mark_persisted()
+        journal.clear()
+        return revisions
+
+    @staticmethod
+    def _persist_one_by_one(db, revision_key, deleted_entities: List, dirty_entities: List,
+                            new_entities: List) -> Optional[Tuple[int, int]]:
+        """
+        Persists entities in the order of persist_changes, every entity in its own savepoint. Changes of entities
+        rejected by the database are dropped and logged. Renamed properties are updated together first,
+        as their names can be swapped (see _modify_existing_entities).
+        :return: pair (previous revision, new revision) or None if there is no revision key
+        """
+        renamed = [e for e in dirty_entities if isinstance(e, Property) and "name" not in e.get_unchanged_columns()]
+        renamed_set = set(renamed)
+        units = [(PersistenceManager._delete_entities, [e]) for e in deleted_entities]
+        units += [(PersistenceManager._modify_existing_entities, renamed)] if len(renamed) > 0 else []
+        units += [(PersistenceManager._modify_existing_entities, [e]) for e in dirty_entities if e not in renamed_set]
+        units += [(PersistenceManager._create_new_entities, [e]) for e in new_entities]
+
+        revisions = None
+        try:
+            if revision_key is not None:
+                revisions = PersistenceManager._increase_revision(db, revision_key)
+            elif not db.in_transaction:
+                db.execute("begin immediate")
+            while len(units) > 0:
+                (execute, entities) = units.pop(0)
+                db.execute("savepoint entity_changes")
+                try:
+                    execute(db, entities)
+                except sqlite3.OperationalError:
+                    raise
+                except Exception as e:
+                    db.execute("rollback to entity_changes")
+                    if len(entities) > 1:
+                        units[0:0] = [(execute, [entity]) for entity in entities]
+                    else:
+                        Log.e("Changes of {} {} were rejected and dropped: {}", entities[0].TABLE, entities[0].id, e)
+                db.execute("release entity_changes")
+            db.commit()
+        except Exception as e:
+            db.rollback()
             Log.e("Error while persisting changes")
             raise e
+        return revisions
 
     @staticmethod
-    def _populate_environment(db, environment: Environment):
-        c = db.cursor()
-        c.execute("select * from profile where environment_id = ?", (environment.id,))
-        profile_columns = [d[0] for d in c.description]
-        rows = c.fetchall()
+    def load_environment_names() -> Dict[int, str]:
+        """
+        Returns names of all environments by their ids
+        """
+        start = time.perf_counter()
+        names = {row[0]: row[1] for row in DBManager.db().execute("select id, name from environment")}
+        Metrics.record_query("select", Environment.TABLE, time.perf_counter() - start, len(names))
+        return names
 
-        for row in rows:
-            profile = Profile()
-            data = {cname: value for (cname, value) in zip(profile_columns, row)}
-            profile.deserialize(data)
-
-            c.execute("select * from property where profile_id = ?", (profile.id,))
-            property_columns = [d[0] for d in c.description]
-            property_rows = c.fetchall()
-            for property_row in property_rows:
-                prop = Property()
-                data = {cname: value for (cname, value) in zip(property_columns, property_row)}
-                prop.deserialize(data)
-                profile.properties.append(prop)
-
-            environment.profiles.append(profile)
-        c.close()
-
-    @staticmethod
-    def _create_new_entities(environments: List[Environment]):
-        new_envs = filter(lambda e: e.new, environments)
-        for env in new_envs:
-            data = env.serialize()
-            if "id" in data:
-                del data["id"]
-            PersistenceManager._execute_insert_query("environment", data)
-            env.new = False
-            env.dirty = False
-
-        all_profiles = [p for env in environments for p in env.profiles]
-        new_profiles = [p for p in all_profiles if p.new]
-        for profile in new_profiles:
-            data = profile.serialize()
-            if "id" in data:
-                del data["id"]
-            PersistenceManager._execute_insert_query("profile", data)
-            profile.new = False
-            profile.dirty = False
-
-        new_props = [prop for profile in all_profiles for prop in profile.properties if prop.new]
-        for prop in new_props:
-            data = prop.serialize()
-            if "id" in data:
-                del data["id"]
-            PersistenceManager._execute_insert_query("property", data)
-            prop.new = False
-            prop.dirty = False
-
-    @staticmethod
-    def _modify_existing_entities(environments: List[Environment]):
-        for env in filter(lambda e: e.dirty, environments):
-            PersistenceManager._execute_update_query("environment", env.serialize())
-            env.dirty = False
-
-        all_profiles = [p for env in environments for p in env.profiles]
-        for profile in filter(lambda x: x.dirty, all_profiles):
-            PersistenceManager._execute_update_query("profile", profile.serialize())
-            profile.dirty = False
-
-        for prop in [prop for profile in all_profiles for prop in profile.properties if prop.dirty]:
-            PersistenceManager._execute_update_query("property", prop.serialize())
-            prop.dirty = False
-
-    @staticmethod
-    def _delete_entities():
-        props = list(filter(lambda e: isinstance(e, Property), PendingEntityBuffer.deleted_entities))
-        profiles = list(filter(lambda e: isinstance(e, Profile), PendingEntityBuffer.deleted_entities))
-        environments = list(filter(lambda e: isinstance(e, Environment), PendingEntityBuffer.deleted_entities))
-        PendingEntityBuffer.deleted_entities.clear()
-
-        profiles += [p for env in environments for p in env.profiles]
-        props += [p for profile in profiles for p in profile.properties]
-
-        PersistenceManager._execute_delete_query("environment", [x.id for x in environments])
-        PersistenceManager._execute_delete_query("profile", [x.id for x in profiles])
-        PersistenceManager._execute_delete_query("property", [x.id for x in props])
-
-    @staticmethod
-    def _execute_insert_query(table, values: Dict):
-        Log.d("Executing insert query for table {} with values: {}".format(table, str(values)))
-
-        keys = list(values.keys())
-        column_names = "({})".format(", ".join(keys))
-        placeholders = "(" + ", ".join(["?"] * len(values)) + ")"
-        query = "insert into {} {} values {}".format(table, column_names, placeholders)
-
-        c = DBManager.db().cursor()
-        c.execute(query, tuple([values[x] for x in keys]))
-        c.close()
-
-    @staticmethod
-    def _execute_update_query(table, values: Dict):
-        Log.d("Executing update query for table {} with values: {}".format(table, values))
-
-        if "id" not in values:
-            raise Exception("Id value wasn't found")
-
-        placeholders = []
-        replacement_values = []
-        for k in values.keys():
-            if k == "id":
-                continue
-            placeholders.append("{} = ?".format(k))
-            replacement_values.append(values[k])
-
-        replacement_values.append(values["id"])
-        query = "update {} set {} where id = ?".format(table, ", ".join(placeholders))
-
-        c = DBManager.db().cursor()
-        c.execute(query, tuple(replacement_values))
-        c.close()
+    @staticmethod
+    def load_revisions(db=None) -> Dict[int, int]:
+        """
+        Returns revisions of the environment registry and of all environments, increased with every commit
+        """
+        db = db if db is not None else DBManager.db()
+        start = time.perf_counter()
+        revisions = {row[0]: row[1] for row in db.execute("select environment_id, revision from environment_revision")}
+        Metrics.record_query("select", "environment_revision", time.perf_counter() - start, len(revisions))
+        return revisions
+
+    @staticmethod
+    def _select_all(db, entity_class, query, condition, parameters) -> List[Tuple]:
+        start = time.perf_counter()
+        rows = db.execute(query.format(", ".join(entity_class.COLUMNS), condition), parameters).fetchall()
+        Metrics.record_query("select", entity_class.TABLE, time.perf_counter() - start, len(rows))
+        return rows
+
+    @staticmethod
+    def _increase_revision(db, key) -> Tuple[int, int]:
+        if not db.in_transaction:
+            # Revision has to be read and written under the same write lock
+            db.execute("begin immediate")
+
+        start = time.perf_counter()
+        row = db.execute("select revision from environment_revision where environment_id = ?", (key,)).fetchone()
+        if row is None:
+            db.execute("insert into environment_revision (environment_id, revision) values (?, 1)", (key,))
+            revisions = (0, 1)
+        else:
+            db.execute("update environment_revision set revision = ? where environment_id = ?", (row[0] + 1, key))
+            revisions = (row[0], row[0] + 1)
+        Metrics.record_query("update", "environment_revision", time.perf_counter() - start,
+                             1 if row is not None else 0, 1)
+        return revisions
+
+    @staticmethod
+    def _create_new_entities(db, entities: List):
+        for entity_class in PersistenceManager._ENTITY_CLASSES:
+            batch = [e for e in entities if isinstance(e, entity_class)]
+            PersistenceManager._execute_insert_batch(db, entity_class.TABLE, batch)
+
+    @staticmethod
+    def _modify_existing_entities(db, entities: List):
+        for entity_class in PersistenceManager._ENTITY_CLASSES:
+            batch = [e for e in entities if isinstance(e, entity_class)]
+            try:
+                PersistenceManager._execute_update_batch(db, entity_class.TABLE, batch,
+                                                         entity_class.IMMUTABLE_COLUMNS)
+            except sqlite3.IntegrityError:
+                if entity_class is not Property:
+                    raise
+                # Property names are unique per profile, names swapped in one journal (a -> b, b -> a) collide
+                # until all rows are updated. Renamed rows are given temporary names first.
+                renamed = [p for p in batch if "name" not in p.get_unchanged_columns()]
+                Log.d("Property names collided, renaming {} properties in two steps", len(renamed))
+                PersistenceManager._release_property_names(db, renamed)
+                PersistenceManager._execute_update_batch(db, entity_class.TABLE, batch,
+                                                         entity_class.IMMUTABLE_COLUMNS)
+
+    @staticmethod
+    def _release_property_names(db, props: List[Property]):
+        start = time.perf_counter()
+        db.executemany("update property set name = char(0) || id where id = ?", [(p.id,) for p in props])
+        Metrics.record_query("update", Property.TABLE, time.perf_counter() - start, rows_written=len(props))
+
+    @staticmethod
+    def _delete_entities(db, entities: List):
+        environments = [e for e in entities if isinstance(e, Environment)]
+        profiles = [e for e in entities if isinstance(e, Profile)]
+        props = [e for e in entities if isinstance(e, Property)]
+
+        # Children of deleted parents are removed by their parent id
+        profile_ids = [p.id for p in profiles] + [p.id for env in environments for p in env.profiles]
+        PersistenceManager._execute_delete_batch(db, "property", [x.id for x in props])
+        PersistenceManager._execute_delete_batch(db, "property", profile_ids, "profile_id")
+        PersistenceManager._execute_delete_batch(db, "profile", profile_ids)
+        PersistenceManager._execute_delete_batch(db, "environment", [x.id for x in environments])
+
+    @staticmethod
+    def _execute_insert_batch(db, table, entities: List):
+        """
+        Inserts new entities with the ids allocated by their journal (see reserve_ids). Rows are grouped by their
+        column set and inserted with executemany.
+        """
+        if len(entities) == 0:
+            return
+
+        Log.d("Executing {} insert(s) for table {}", len(entities), table)
+
+        groups = PersistenceManager._group_by_columns(entities)
+        for (keys, rows) in groups.items():
+            query = "insert into {} ({}) values ({})".format(table, ", ".join(keys), ", ".join(["?"] * len(keys)))
+            start = time.perf_counter()
+            db.executemany(query, rows)
+            Metrics.record_query("insert", table, time.perf_counter() - start, rows_written=len(rows))
 
     @staticmethod
-    def _execute_delete_query(table, values: List):
-        if len(values) == 0:
+    def _execute_update_batch(db, table, entities: List, immutable_columns=()):
+        if len(entities) == 0:
             return
 
-        Log.d("Executing delete query for table {} with values: {}".format(table, values))
+        Log.d("Executing {} update(s) for table {}", len(entities), table)
 
-        ids = ", ".join(map(str, values))
-        query = "delete from {} where id in ({})".format(table, ids)
+        groups = PersistenceManager._group_by_columns(entities, id_last=True, skipped=immutable_columns)
+        for (keys, rows) in groups.items():
+            placeholders = ", ".join(["{} = ?".format(k) for k in keys[:-1]])
+            query = "update {} set {} where id = ?".format(table, placeholders)
+            start = time.perf_counter()
+            db.executemany(query, rows)
+            Metrics.record_query("update", table, time.perf_counter() - start, rows_written=len(rows))
 
-        c = DBManager.db().cursor()
-        c.execute(query)
-        c.close()
+    @staticmethod
+    def _execute_delete_batch(db, table, ids: List, column="id"):
+        ids = [x for x in ids if x > 0]
+        if len(ids) == 0:
+            return
+
+        Log.d("Executing delete query for table {} with {} value(s) of {}", table, len(ids), column)
+
+        for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[i:i + DELETE_CHUNK_SIZE]
+            query = "delete from {} where {} in ({})".format(table, column, ", ".join(["?"] * len(chunk)))
+            start = time.perf_counter()
+            cursor = db.execute(query, chunk)
+            Metrics.record_query("delete", table, time.perf_counter() - start, rows_written=cursor.rowcount)
+
+    @staticmethod
+    def _group_by_columns(entities: List, id_last=False, skipped=()) -> Dict[Tuple, List[Tuple]]:
+        """
+        Serializes entities and groups resulting rows by their column names
+        :param id_last: whether the id column should be moved to the end of every row and unchanged columns
+        left out (update queries)
+        :param skipped: columns left out of the rows
+        """
+        groups = {}
+        for entity in entities:
+            data = entity.serialize()
+            for column in skipped:
+                data.pop(column, None)
+            if id_last:
+                for column in entity.get_unchanged_columns():
+                    data.pop(column, None)
+            if id_last:
+                if "id" not in data:
+                    raise Exception("Id value wasn't found")
+                _id = data.pop("id")
+                data["id"] = _id
+
+            keys = tuple(data.keys())
+            groups.setdefault(keys, []).append(tuple(data.values()))
+        return groups
+
+    @staticmethod
+    def reserve_ids(table, count) -> int:
+        """
+        Reserves a block of ids of given table for rows inserted later. The block is recorded in sqlite_sequence,
+        so the ids are never handed out again, neither by other processes nor after a restart, and ids of new
+        entities don't have to be changed when they're inserted.
+        :return: first id of the block
+        """
+        db = DBManager.db()
+        if db.in_transaction:
+            raise Exception("Ids of table {} can't be reserved in the middle of a transaction".format(table))
+
+        db.execute("begin immediate")
+        try:
+            first_id = PersistenceManager._get_next_id(db, table)
+            last_id = first_id + count - 1
+            start = time.perf_counter()
+            cursor = db.execute("update sqlite_sequence set seq = ? where name = ?", (last_id, table))
+            if cursor.rowcount == 0:
+                db.execute("insert into sqlite_sequence (name, seq) values (?, ?)", (table, last_id))
+            Metrics.record_query("update", "sqlite_sequence", time.perf_counter() - start, rows_written=1)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        Log.d("Reserved ids {}-{} of table {}", first_id, last_id, table)
+        return first_id
+
+    @staticmethod
+    def _get_next_id(db, table) -> int:
+        # Autoincrement tables never reuse ids, so the sequence has to be taken into account as well
+        start = time.perf_counter()
+        max_id = db.execute("select coalesce(max(id), 0) from {}".format(table)).fetchone()[0]
+        sequence = db.execute("select coalesce(max(seq), 0) from sqlite_sequence where name = ?", (table,)).fetchone()[0]
+        Metrics.record_query("select", table, time.perf_counter() - start, 2)
+        return max(max_id, sequence) + 1
@@ -1,24 +1,133 @@
 import os
+import queue
 import sqlite3
-from flask import g
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from ..config import ConfigProperty
+from ..log import Log
+
+DB_FILE_NAME = "db.sqlite"
+SYNCHRONOUS_MODES = ["OFF", "NORMAL", "FULL", "EXTRA"]
 
 
 class DBManager:
+    """
+    Pool of tuned SQLite connections. A connection is leased to a thread on the first call to db() and stays
+    with that thread until it's released (end of a request, end of a connection() block), so that all queries
+    executed by a thread in the meantime share one transaction. Works with and without Flask.
+    """
     _base_dir: str
+    _db_path: str
+    _pool: queue.LifoQueue = None
+    _created = 0
+    _lock = threading.Lock()
+    _local = threading.local()
+    # Function called with every statement executed by connections opened since it was set, for diagnostics
+    _trace_callback: Optional[Callable[[str], None]] = None
 
     @staticmethod
     def initialize(base_directory):
-        print(base_directory)
+        Log.d("Database directory: {}", base_directory)
         DBManager._base_dir = base_directory
+        DBManager._db_path = os.path.normpath(base_directory + "/" + DB_FILE_NAME)
+        DBManager._pool = queue.LifoQueue()
+        DBManager._created = 0
 
     @staticmethod
-    def db():
-        db = getattr(g, "_database", None)
+    def db() -> sqlite3.Connection:
+        """
+        Returns connection leased to the current thread, leasing one from the pool if necessary
+        """
+        db = getattr(DBManager._local, "connection", None)
         if db is None:
-            db_path = os.path.normpath(DBManager._base_dir + "/" + "db.sqlite")
-            db = g._database = sqlite3.connect(db_path)
+            db = DBManager._acquire()
+            DBManager._local.connection = db
         return db
 
+    @staticmethod
+    @contextmanager
+    def connection():
+        """
+        Leases a connection to the current thread for the duration of the block. Nested blocks share
+        the outer connection.
+        """
+        owner = getattr(DBManager._local, "connection", None) is None
+        db = DBManager.db()
+        try:
+            yield db
+        finally:
+            if owner:
+                DBManager.release()
+
+    @staticmethod
+    def release():
+        """
+        Returns connection leased to the current thread back to the pool
+        """
+        db = getattr(DBManager._local, "connection", None)
+        if db is None:
+            return
+
+        DBManager._local.connection = None
+        if db.in_transaction:
+            db.rollback()
+        DBManager._pool.put(db)
+
     @staticmethod
     def destroy():
-        DBManager.db().close()
+        DBManager.release()
+        while True:
+            try:
+                DBManager._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        DBManager._created = 0
+
+    @staticmethod
+    def set_trace_callback(callback: Optional[Callable[[str], None]]):
+        """
+        Sets trace callback (see sqlite3.Connection.set_trace_callback) of connections opened from now on,
+        the pool should be destroyed first for the callback to see all statements
+        """
+        DBManager._trace_callback = callback
+
+    @staticmethod
+    def open_connection() -> sqlite3.Connection:
+        """
+        Opens a tuned connection that doesn't belong to the pool, it has to be closed by the caller
+        """
+        return DBManager._connect()
+
+    @staticmethod
+    def _acquire() -> sqlite3.Connection:
+        try:
+            return DBManager._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with DBManager._lock:
+            can_create = DBManager._created < ConfigProperty.DB_POOL_SIZE
+            if can_create:
+                DBManager._created += 1
+
+        if can_create:
+            return DBManager._connect()
+        return DBManager._pool.get()
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        synchronous = ConfigProperty.DB_SYNCHRONOUS.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise Exception("Invalid synchronous mode {}".format(synchronous))
+
+        db = sqlite3.connect(DBManager._db_path, check_same_thread=False,
+                             cached_statements=ConfigProperty.DB_STATEMENT_CACHE_SIZE)
+        if DBManager._trace_callback is not None:
+            db.set_trace_callback(DBManager._trace_callback)
+        db.execute("pragma journal_mode = wal")
+        db.execute("pragma synchronous = {}".format(synchronous))
+        db.execute("pragma cache_size = {}".format(int(ConfigProperty.DB_CACHE_SIZE)))
+        db.execute("pragma mmap_size = {}".format(int(ConfigProperty.DB_MMAP_SIZE)))
+        return db
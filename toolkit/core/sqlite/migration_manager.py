@@ -1,46 +1,116 @@
-import os
 import re
+import json
 import time
+import types
 import datetime
 import sqlite3
 import math
 import importlib.resources as pkg_resources
+from typing import List, Optional, Tuple
 
 from .db_manager import DBManager
 from ..log import Log
 from . import migrations
 
+MIGRATION_FILE_NAME_PATTERN = re.compile("^(\\d+)\\.\\s?(.*)\\.(sql|py)$")
+# Number of rows processed by a single transaction of a Python migration that doesn't define its CHUNK_SIZE
+DEFAULT_CHUNK_SIZE = 1000
+# Minimum interval (in seconds) between progress messages of a Python migration
+PROGRESS_LOG_INTERVAL = 5
+
 
 class MigrationFile:
+    """
+    Migration discovered in the migrations package. SQL migrations ("<number>. <name>.sql") contain statements
+    separated with semicolons. Python migrations ("<number>. <name>.py") migrate data in chunks and define:
+
+    - migrate_chunk(db, checkpoint, chunk_size) -> (checkpoint, processed_rows): processes at most chunk_size rows
+      following the checkpoint (None on the first call) and returns the checkpoint of the last processed row
+      (any JSON-serializable value) or None once there is nothing left, and the number of processed rows
+    - count(db) -> int (optional): number of rows to process, used in progress messages
+    - CHUNK_SIZE (optional): number of rows per chunk, DEFAULT_CHUNK_SIZE by default
+
+    Every chunk is committed in its own transaction together with the checkpoint, so a large migration doesn't
+    lock the database for its whole duration and an interrupted migration is resumed from the last checkpoint.
+    """
     number: int
     name: str
+    file_name: str
     content: str
 
     def __init__(self, migration_filename):
-        pattern = re.compile("^(\\d+)\\.\\s?(.*)\\.sql$")
-        result = re.match(pattern, migration_filename)
+        (self.number, self.name) = MigrationFile.parse_file_name(migration_filename)
+        self.file_name = migration_filename
+        self.content = pkg_resources.read_text(migrations, migration_filename)
+
+    @staticmethod
+    def parse_file_name(migration_filename) -> Tuple[int, str]:
+        """
+        :return: pair (number, name) of the migration
+        """
+        result = re.match(MIGRATION_FILE_NAME_PATTERN, migration_filename)
         if result is None:
             raise Exception("Migration file {} doesn't conform to the file name requirements".format(migration_filename))
+        return int(result.group(1)), result.group(2)
 
-        self.number = int(result.group(1))
-        self.name = result.group(2)
-        self.content = pkg_resources.read_text(migrations, migration_filename)
+    def is_chunked(self) -> bool:
+        return self.file_name.endswith(".py")
+
+    def load_module(self) -> types.ModuleType:
+        """
+        Executes Python migration in a new module, migration files aren't regular modules (their names contain
+        spaces and dots)
+        """
+        module = types.ModuleType("{}.migration_{}".format(migrations.__name__, self.number))
+        exec(compile(self.content, self.file_name, "exec"), module.__dict__)
+        if not callable(getattr(module, "migrate_chunk", None)):
+            raise Exception("Migration {}. {} doesn't define migrate_chunk".format(self.number, self.name))
+        return module
 
 
 class MigrationManager:
     _migrations: [MigrationFile]
-    _migration_file_names = [  # todo need a better mechanism for that shit
-        "0. Versions.sql",
-        "1. Model.sql"
-    ]
+    # Names of the migration files, discovered once
+    _migration_file_names: Optional[List[str]] = None
 
     @staticmethod
     def migrate():
+        """
+        Executes missing migrations and resumes interrupted Python migrations. Schema level (number of the last
+        migration + 1) is recorded in user_version once all migrations have succeeded, so an up-to-date database
+        is recognized by a single pragma query, without reading the migration files and schema_versions.
+        """
         db = DBManager.db()
+        level = MigrationManager.get_schema_level()
+        if MigrationManager.get_database_level(db) == level:
+            return
+
         MigrationManager._load_migration_files()
         MigrationManager._create_migration_table(db)
+        MigrationManager._upgrade_migration_table(db)
         MigrationManager._check_for_failed_migrations(db)
         MigrationManager._execute_missing_migrations(db)
+        db.execute("pragma user_version = {}".format(level))
+
+    @staticmethod
+    def get_schema_level() -> int:
+        """
+        Returns schema level of the application, i.e. the level of a fully migrated database
+        """
+        numbers = [MigrationFile.parse_file_name(name)[0] for name in MigrationManager._get_migration_file_names()]
+        return max(numbers) + 1
+
+    @staticmethod
+    def get_database_level(db) -> int:
+        return db.execute("pragma user_version").fetchone()[0]
+
+    @staticmethod
+    def _get_migration_file_names() -> List[str]:
+        if MigrationManager._migration_file_names is None:
+            MigrationManager._migration_file_names = sorted(
+                name for name in pkg_resources.contents(migrations)
+                if re.match(MIGRATION_FILE_NAME_PATTERN, name) is not None)
+        return MigrationManager._migration_file_names
 
     @staticmethod
     def _create_migration_table(db):
@@ -52,31 +122,49 @@ class MigrationManager:
             return
 
         Log.i("Schema version table doesn't exist, creating")
-        if len(MigrationManager._migrations) == 0:
+        if len(MigrationManager._migrations) == 0 or MigrationManager._migrations[0].number != 0:
             raise Exception("Base migration wasn't found")
         MigrationManager._execute_migration(db, MigrationManager._migrations[0])
 
+    @staticmethod
+    def _upgrade_migration_table(db):
+        """
+        Adds columns tracking progress of Python migrations to schema_versions created by an older version
+        """
+        columns = [row[1] for row in db.execute("pragma table_info(schema_versions)")]
+        if "checkpoint" in columns:
+            return
+
+        Log.i("Adding progress columns to the schema version table")
+        db.execute("begin immediate")
+        db.execute("alter table schema_versions add column checkpoint text")
+        db.execute("alter table schema_versions add column processed_rows int not null default 0")
+        db.commit()
+
     @staticmethod
     def _check_for_failed_migrations(db):
+        chunked = set(m.number for m in MigrationManager._migrations if m.is_chunked())
         c = db.cursor()
-        c.execute("select id, name from schema_versions where success = 0")
-        failed = c.fetchone()
+        c.execute("select id, name from schema_versions where success = 0 order by id")
+        failed = [row for row in c.fetchall() if row[0] not in chunked]
         c.close()
 
-        if failed is not None:
-            raise Exception("Database contains a failed migration: {}. {}".format(failed[0], failed[1]))
+        # Python migrations are resumed, other failed migrations were recorded by versions which didn't execute
+        # migrations in transactions and have to be repaired manually
+        if len(failed) > 0:
+            raise Exception("Database contains a failed migration: {}. {}".format(failed[0][0], failed[0][1]))
 
     @staticmethod
     def _execute_missing_migrations(db):
-        existing = [x[0] for x in db.execute("select id from schema_versions")]
+        completed = set(row[0] for row in db.execute("select id from schema_versions where success = 1"))
 
         for m in MigrationManager._migrations:
-            if m.number not in existing:
+            if m.number not in completed:
                 MigrationManager._execute_migration(db, m)
 
     @staticmethod
     def _load_migration_files():
-        migrations = map(lambda x: MigrationFile(x), MigrationManager._migration_file_names)
+        migrations = map(lambda x: MigrationFile(x), MigrationManager._get_migration_file_names())
         migrations = sorted(migrations, key=lambda x: x.number)
 
         numbers = []
@@ -85,55 +173,106 @@ class MigrationManager:
                 raise Exception(
                     "Error while loading migration {}: Migration with number {} already exists".format(m.name,
                                                                                                        m.number))
+            numbers.append(m.number)
 
         MigrationManager._migrations = migrations
 
     @staticmethod
     def _execute_migration(db, migration):
-        Log.i("Executing migration {}. {}".format(migration.number, migration.name))
+        if migration.is_chunked():
+            MigrationManager._execute_chunked_migration(db, migration)
+        else:
+            MigrationManager._execute_sql_migration(db, migration)
+
+    @staticmethod
+    def _execute_sql_migration(db, migration):
+        """
+        Executes all statements of the migration and records it in a single transaction, a failed migration
+        leaves no trace and is executed again on next start
+        """
+        Log.i("Executing migration {}. {}", migration.number, migration.name)
 
-        exc = None
-        statements = MigrationManager._split_statements(migration.content)
         start = time.time()
         try:
-            for statement in statements:
-                MigrationManager._execute_statement(db, statement)
-        except sqlite3.OperationalError as e:
-            Log.e("Error while executing migration {}. {}".format(migration.number, migration.name))
-            exc = e
-        finally:
-            end = time.time()
+            db.execute("begin immediate")
+            for statement in MigrationManager._split_statements(migration.content):
+                db.execute(statement)
+            execution_time = math.floor((time.time() - start) * 1000)
+            MigrationManager._save_migration_status(db, migration, execution_time, True)
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            Log.e("Error while executing migration {}. {}, it was rolled back", migration.number, migration.name)
+            raise e
 
-        execution_time = math.floor((end - start) * 1000)
-        MigrationManager._save_migration_status(db, migration, execution_time, exc is None)
+    @staticmethod
+    def _execute_chunked_migration(db, migration):
+        module = migration.load_module()
+        chunk_size = getattr(module, "CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
 
-        if exc is not None:
-            raise exc
+        status = db.execute("select checkpoint, processed_rows, execution_time from schema_versions where id = ?",
+                            (migration.number,)).fetchone()
+        if status is None:
+            Log.i("Executing migration {}. {}", migration.number, migration.name)
+            MigrationManager._save_migration_status(db, migration, 0, False)
+            db.commit()
+            (checkpoint, processed, execution_time) = (None, 0, 0)
+        else:
+            (checkpoint, processed, execution_time) = status
+            checkpoint = json.loads(checkpoint) if checkpoint is not None else None
+            Log.i("Resuming migration {}. {} after {} rows", migration.number, migration.name, processed)
 
-    @staticmethod
-    def _split_statements(content: str) -> [str]:
-        return list(filter(lambda x: not not x.strip(), content.split("\n\n")))
+        total = module.count(db) if callable(getattr(module, "count", None)) else None
+        chunks = 0
+        last_report = time.time()
+        while True:
+            start = time.time()
+            try:
+                db.execute("begin immediate")
+                (checkpoint, rows) = module.migrate_chunk(db, checkpoint, chunk_size)
+                processed += rows
+                execution_time += (time.time() - start) * 1000
+                db.execute("update schema_versions set checkpoint = ?, processed_rows = ?, execution_time = ?, "
+                           "success = ? where id = ?",
+                           (json.dumps(checkpoint) if checkpoint is not None else None, processed,
+                            math.floor(execution_time), 1 if checkpoint is None else 0, migration.number))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                Log.e("Error while executing migration {}. {}, it will be resumed after {} rows", migration.number,
+                      migration.name, processed)
+                raise e
 
-    @staticmethod
-    def _execute_statement(db, content):
-        c = db.cursor()
-        exc = None
+            chunks += 1
+            if checkpoint is None:
+                break
+            if time.time() - last_report >= PROGRESS_LOG_INTERVAL:
+                last_report = time.time()
+                Log.i("Migration {}. {}: {} of {} rows processed", migration.number, migration.name, processed,
+                      total if total is not None else "?")
 
-        try:
-            c.execute(content)
-        except sqlite3.OperationalError as e:
-            exc = e
-        finally:
-            c.close()
+        Log.i("Migration {}. {} processed {} rows in {} chunks, {} ms", migration.number, migration.name, processed,
+              chunks, math.floor(execution_time))
 
-        if exc is not None:
-            raise exc
+    @staticmethod
+    def _split_statements(content: str) -> List[str]:
+        """
+        Splits SQL script into complete statements (a statement may span several lines)
+        """
+        statements = []
+        current = ""
+        for line in content.splitlines(keepends=True):
+            current += line
+            if sqlite3.complete_statement(current):
+                statements.append(current.strip())
+                current = ""
+        if current.strip():
+            # Last statement doesn't have to be terminated with a semicolon
+            statements.append(current.strip())
+        return statements
 
     @staticmethod
     def _save_migration_status(db, migration, execution_time, result):
-        c = db.cursor()
         payload = (migration.number, migration.name, str(datetime.datetime.today()), execution_time, 1 if result else 0)
-        c.execute("insert into schema_versions (id, name, created_at, execution_time, success) values (?, ?, ?, ?, ?)",
-                  payload)
-        db.commit()
-        c.close()
+        db.execute("insert into schema_versions (id, name, created_at, execution_time, success) values (?, ?, ?, ?, ?)",
+                   payload)
@@ -0,0 +1,5 @@
+create table environment_revision
+(
+    environment_id integer not null primary key,
+    revision       int     not null
+);
\ No newline at end of file
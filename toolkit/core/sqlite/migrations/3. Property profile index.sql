@@ -0,0 +1 @@
+create index property_profile_id on property (profile_id);
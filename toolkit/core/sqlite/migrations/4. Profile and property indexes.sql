@@ -0,0 +1,15 @@
+create index profile_environment_priority on profile (environment_id, priority);
+
+-- Older versions didn't prevent duplicate property names within a profile, all duplicates except the first one
+-- are renamed (with their id appended), so that none of them is lost
+update property
+set name = name || '_' || id
+where id in (select p.id
+             from property p
+                      join (select profile_id, name, min(id) as first_id
+                            from property
+                            group by profile_id, name
+                            having count(*) > 1) d on p.profile_id = d.profile_id and p.name = d.name
+             where p.id > d.first_id);
+
+create unique index property_profile_name on property (profile_id, name);
@@ -1,33 +1,290 @@
+import threading
+from typing import Dict, Callable, List, Optional
+
 from .config import Configuration, ConfigProperty
 from .log import Log
 from .sqlite.db_manager import DBManager
 from .sqlite.migration_manager import MigrationManager
 from ..core.model.context import Context
-from ..core.service.persistence_manager import PersistenceManager
+from ..core.model.base.unit_of_work import IdAllocator
+from ..core.model.environment import Environment
+from ..core.model.profile_cache import ProfileCache
+from ..core.service.persistence_manager import PersistenceManager, REGISTRY_REVISION_KEY
+from ..core.service.flusher import PersistenceFlusher
 
 VERSION = "1.0"
 
+PERSISTENCE_MODE_SYNC = "sync"
+PERSISTENCE_MODE_WRITE_BEHIND = "write-behind"
+
 
 class PostmanToolkit:
+    """
+    Owns the context and its persistence. The toolkit lock guards the environment registry only,
+    every environment is guarded by its own lock. When several processes share the database,
+    every commit increases the revision of the committed environment (or of the registry) and other processes
+    reload just the environments whose revisions they haven't seen yet, see synchronize().
+    """
     context: Context = None
+    lock: threading.RLock
+    # Cache of lazily loaded profiles, None if all properties are loaded at startup
+    profile_cache: Optional[ProfileCache]
+    # Last known revision of the registry and of every environment
+    _revisions: Dict[int, int]
+    _reload_listeners: List[Callable[[Environment], None]]
+    # Functions to be called once the changes committed so far are persisted by the flusher (write-behind mode)
+    _commit_callbacks: List[Callable[[], None]]
 
     def __init__(self):
         Configuration.initialize()
-        Log.debug = ConfigProperty.DEBUG
+        Log.configure(ConfigProperty.LOG_LEVEL)
+
+        DBManager.initialize(Configuration.data_dir)
+
+        self.lock = threading.RLock()
+        self._flusher = None
+        self._watch = None
+        self._data_version = None
+        self._sync_lock = threading.Lock()
+        self._reload_listeners = []
+        self._commit_callbacks = []
+        self._commit_lock = threading.Lock()
+        self.context = Context(IdAllocator(self._reserve_ids))
+        self.profile_cache = None
+        if ConfigProperty.PROFILE_CACHE_SIZE > 0:
+            self.profile_cache = ProfileCache(ConfigProperty.PROFILE_CACHE_SIZE, self._load_properties,
+                                              self._find_properties)
+
+        with DBManager.connection():
+            MigrationManager.migrate()
+
+            self._revisions = PersistenceManager.load_revisions()
+
+            for env in PersistenceManager.load_environments(cache=self.profile_cache):
+                self.context.attach_environment(env)
+
+            # Temporary workaround before environment support is implemented in the frontend
+            if self.context.find_environment("default") is None:
+                self.context.create_environment("default")
+                self.persist_changes()
+
+    @staticmethod
+    def prepare_database():
+        """
+        Migrates the database and creates the default environment without loading the model. Used by the process
+        that only starts the workers, so that the workers don't migrate the same database concurrently.
+        """
+        Configuration.initialize()
+        Log.configure(ConfigProperty.LOG_LEVEL)
 
         DBManager.initialize(Configuration.data_dir)
-        MigrationManager.migrate()
+        with DBManager.connection():
+            MigrationManager.migrate()
+
+            if "default" not in PersistenceManager.load_environment_names().values():
+                context = Context(IdAllocator(PostmanToolkit._reserve_ids))
+                context.create_environment("default")
+                PersistenceManager.persist_changes(context.journal, REGISTRY_REVISION_KEY)
+
+    def start_write_behind(self):
+        """
+        Enables write-behind mode: changes are committed by a background flusher instead of the calling thread
+        """
+        self._flusher = PersistenceFlusher(self._flush, ConfigProperty.FLUSH_MAX_DELAY,
+                                           ConfigProperty.FLUSH_MAX_BATCH)
+        self._flusher.start()
+
+    def enable_synchronization(self):
+        """
+        Enables detection of changes committed by other processes sharing the database
+        """
+        if self._flusher is not None:
+            raise Exception("Synchronization can't be used in write-behind mode")
+        self._watch = DBManager.open_connection()
 
-        self.context = Context()
-        self.context.environments = PersistenceManager.load_environments()
+    def add_reload_listener(self, listener: Callable[[Environment], None]):
+        """
+        :param listener: function called with every environment that has been reloaded (or attached)
+        because of changes committed by another process
+        """
+        self._reload_listeners.append(listener)
 
-        # Temporary workaround before environment support is implemented in the frontend
-        if self.context.find_environment("default") is None:
-            self.context.create_environment("default")
+    def synchronize(self):
+        """
+        Reloads environments modified by other processes. Commits are detected with data_version of a dedicated
+        connection, so this is a single pragma query unless something has actually been committed.
+        """
+        if self._watch is None:
+            return
+
+        with self._sync_lock:
+            data_version = self._watch.execute("pragma data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            revisions = PersistenceManager.load_revisions(self._watch)
+
+            with DBManager.connection():
+                if revisions.get(REGISTRY_REVISION_KEY, 0) != self._revisions.get(REGISTRY_REVISION_KEY, 0):
+                    self._reload_registry(revisions)
+                for (env_id, revision) in revisions.items():
+                    if env_id != REGISTRY_REVISION_KEY and revision != self._revisions.get(env_id, 0):
+                        self._reload_environment(env_id, revision)
+
+    def commit_changes(self, env: Environment = None, on_committed: Callable[[], None] = None):
+        """
+        Persists changes made in memory, either immediately or in background (write-behind mode)
+        :param env: environment whose changes should be persisted, all environments if not specified
+        :param on_committed: function called once the changes are persisted, by the flusher in write-behind mode
+        """
+        if self._flusher is not None:
+            if on_committed is not None:
+                with self._commit_lock:
+                    self._commit_callbacks.append(on_committed)
+            self._flusher.request_flush()
+        else:
+            self.persist_changes(env)
+            if on_committed is not None:
+                on_committed()
+
+    def _flush(self):
+        """
+        Persists changes of all environments (write-behind mode) and then calls the callbacks of the commits
+        requested before the flush started, their changes have been persisted by it
+        """
+        with self._commit_lock:
+            callbacks = self._commit_callbacks
+            self._commit_callbacks = []
+        try:
             self.persist_changes()
+        except Exception:
+            with self._commit_lock:
+                self._commit_callbacks[0:0] = callbacks
+            raise
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                Log.e("Error in commit callback: {}", e)
 
-    def persist_changes(self):
-        PersistenceManager.persist_changes(self.context.environments)
+    def persist_changes(self, env: Environment = None):
+        """
+        Persists changes of the environment registry and then changes of given environment (or of all
+        environments). Every environment is persisted in its own transaction, under its own lock.
+        """
+        with DBManager.connection():
+            if not self.context.journal.is_empty():
+                with self.lock:
+                    revisions = PersistenceManager.persist_changes(self.context.journal, REGISTRY_REVISION_KEY)
+                    self._on_persisted(REGISTRY_REVISION_KEY, revisions)
+
+            if env is not None:
+                environments = [env]
+            else:
+                with self.lock:
+                    environments = list(self.context.environments)
+
+            for e in environments:
+                with e.lock:
+                    if e.is_attached():
+                        revisions = PersistenceManager.persist_changes(e.journal, e.id)
+                        self._on_persisted(e.id, revisions)
+
+        # Profiles with unsaved changes couldn't be unloaded when the cache was over its capacity
+        if self.profile_cache is not None:
+            self.profile_cache.shrink()
+
+    def _on_persisted(self, key, revisions):
+        if revisions is None:
+            return
+        (previous, current) = revisions
+        # If another process has committed in the meantime, its changes haven't been loaded yet
+        # and the next synchronization has to pick them up
+        self._revisions[key] = current if self._revisions.get(key, 0) == previous else previous
+
+    def _reload_registry(self, revisions: Dict[int, int]):
+        with self.lock:
+            names = PersistenceManager.load_environment_names()
+            renamed = []
+            for env in self.context.environments:
+                if env.id not in names:
+                    with env.lock:
+                        self.context.detach_environment(env)
+                    self._revisions.pop(env.id, None)
+                    Log.i("Detached environment {} deleted by another process", env.name)
+                elif env.name != names[env.id]:
+                    # Environments are renamed through the registry, their own revisions don't change
+                    renamed.append(env.id)
+
+            for env_id in names:
+                if self.context.get_environment(env_id) is None:
+                    for env in PersistenceManager.load_environments(env_id, self.profile_cache):
+                        self.context.attach_environment(env)
+                        self._revisions[env.id] = revisions.get(env.id, 0)
+                        Log.i("Attached environment {} created by another process", env.name)
+                        self._notify_reloaded(env)
+
+            for env_id in renamed:
+                self._reload_environment(env_id, revisions.get(env_id, 0), True)
+            self._revisions[REGISTRY_REVISION_KEY] = revisions.get(REGISTRY_REVISION_KEY, 0)
+
+    def _reload_environment(self, env_id, revision, force=False):
+        with self.lock:
+            env = self.context.get_environment(env_id)
+            if env is None:
+                return
+
+            with env.lock:
+                if self._revisions.get(env_id, 0) == revision and not force:
+                    return
+                loaded = PersistenceManager.load_environments(env_id, self.profile_cache)
+                if len(loaded) == 0:
+                    return
+
+                new_env = loaded[0]
+                # Version keeps growing, so that responses cached for the old copy are never reused
+                new_env.version = env.version + 1
+                self.context.replace_environment(env, new_env)
+                self._revisions[env_id] = revision
+                Log.i("Reloaded environment {} (revision {})", new_env.name, revision)
+        self._notify_reloaded(new_env)
+
+    def _notify_reloaded(self, env: Environment):
+        for listener in self._reload_listeners:
+            listener(env)
+
+    def shutdown(self):
+        """
+        Drains the background flusher, if there is one
+        """
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+
+    @staticmethod
+    def _reserve_ids(table, count) -> int:
+        # Ids are allocated from any thread, when a new entity is registered in its journal
+        with DBManager.connection():
+            return PersistenceManager.reserve_ids(table, count)
+
+    @staticmethod
+    def _load_properties(profile_ids) -> Dict[int, List]:
+        # Profiles are loaded from any thread, usually in the middle of a request
+        with DBManager.connection():
+            return PersistenceManager.load_properties(profile_ids)
+
+    @staticmethod
+    def _find_properties(profile_ids, property_name) -> Dict[int, object]:
+        with DBManager.connection():
+            return PersistenceManager.find_properties(profile_ids, property_name)
+
+    @staticmethod
+    def release_connection():
+        """
+        Returns database connection used by the current thread to the pool
+        """
+        DBManager.release()
 
     @staticmethod
     def destroy():
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import importlib
+import mimetypes
+import re
+import threading
+import importlib.resources as pkg_resources
+from typing import Dict, Optional, Tuple
+
+from flask import Request, Response, make_response
+
+from ..core.log import Log
+
+# Webpack appends content hash to the names of built files (e.g. app.3f2a1b9c.js, logo.82b9c7a.png)
+HASHED_FILE_NAME_PATTERN = re.compile("\\.[0-9a-f]{7,}\\.[^.]+$")
+COMPRESSIBLE_TYPES = ["text/", "application/javascript", "application/json", "image/svg+xml"]
+MIN_COMPRESSED_SIZE = 256
+
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("font/woff", ".woff")
+mimetypes.add_type("font/woff2", ".woff2")
+mimetypes.add_type("image/svg+xml", ".svg")
+
+
+class Asset:
+    content: bytes
+    gzip_content: Optional[bytes]
+    etag: str
+    content_type: str
+    cache_control: str
+
+    def __init__(self, name, content: bytes):
+        self.content = content
+        self.etag = hashlib.sha256(content).hexdigest()[:20]
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+
+        self.gzip_content = None
+        if len(content) >= MIN_COMPRESSED_SIZE and any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(content, 9)
+            if len(compressed) < len(content):
+                self.gzip_content = compressed
+
+        hashed = HASHED_FILE_NAME_PATTERN.search(name) is not None
+        self.cache_control = CACHE_CONTROL_IMMUTABLE if hashed else CACHE_CONTROL_REVALIDATE
+
+    def to_response(self, request: Request) -> Response:
+        use_gzip = self.gzip_content is not None and request.accept_encodings["gzip"] > 0
+        etag = self.etag + "-gz" if use_gzip else self.etag
+
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(self.gzip_content if use_gzip else self.content, 200)
+            response.headers["Content-Type"] = self.content_type
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = self.cache_control
+        if self.gzip_content is not None:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+class AssetTable:
+    """
+    In-memory table of front-end files, loaded once from the resource packages
+    """
+    _assets: Dict[Tuple[Optional[str], str], Asset]
+    # Names of the resource packages loaded on first access, see defer
+    _deferred: Optional[Dict[Optional[str], str]]
+
+    def __init__(self):
+        self._assets = {}
+        self._deferred = None
+        self._lock = threading.Lock()
+
+    def defer(self, package_names: Dict[Optional[str], str]):
+        """
+        Postpones importing and loading of given packages until the first asset is requested, so that
+        they don't slow down startup
+        :param package_names: names of resource packages by resource type (None for the root package)
+        """
+        self._deferred = package_names
+
+    def load(self, packages: Dict[Optional[str], object]):
+        """
+        Loads all files from given packages
+        :param packages: resource packages by resource type (None for the root package)
+        """
+        size = 0
+        for (resource_type, package) in packages.items():
+            for name in pkg_resources.contents(package):
+                if name.endswith(".py") or not pkg_resources.is_resource(package, name):
+                    continue
+                asset = Asset(name, pkg_resources.read_binary(package, name))
+                self._assets[(resource_type, name)] = asset
+                size += len(asset.content)
+
+        Log.i("Loaded {} front-end files ({} KiB)", len(self._assets), size // 1024)
+
+    def get(self, resource_type, name) -> Optional[Asset]:
+        if self._deferred is not None:
+            self._load_deferred()
+        return self._assets.get((resource_type, name))
+
+    def _load_deferred(self):
+        with self._lock:
+            if self._deferred is None:
+                return
+            self.load({resource_type: importlib.import_module(package_name)
+                       for (resource_type, package_name) in self._deferred.items()})
+            self._deferred = None
@@ -0,0 +1,85 @@
+import itertools
+import queue
+import threading
+from typing import Dict, Optional, List
+
+EVENT_RESYNC = "resync"
+
+
+class Subscription:
+    """
+    Bounded queue of events for a single consumer. When the queue is full, new events are dropped and
+    the consumer receives a resync event instead, telling it to reload the whole state.
+    """
+    _queue: queue.Queue
+    _overflowed: bool
+    environment_id: Optional[int]
+
+    def __init__(self, max_size, environment_id=None):
+        """
+        :param environment_id: id of the environment whose events should be received, all events if not specified
+        """
+        self._queue = queue.Queue(max_size)
+        self._overflowed = False
+        self.environment_id = environment_id
+
+    def offer(self, event: Dict):
+        if self.environment_id is not None and event.get("environment") != self.environment_id:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._overflowed = True
+
+    def next(self, timeout) -> Optional[Dict]:
+        """
+        Returns next event or None if there wasn't any within given time (in seconds)
+        """
+        if self._overflowed:
+            self._overflowed = False
+            self._drain()
+            return {"type": EVENT_RESYNC}
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class EventBroadcaster:
+    """
+    Fans out change events to all subscribers. Publishing never blocks, regardless of how slow the subscribers are.
+    """
+    _subscribers: List[Subscription]
+
+    def __init__(self, queue_size=256):
+        self._queue_size = queue_size
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, environment_id=None) -> Subscription:
+        subscription = Subscription(self._queue_size, environment_id)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event: Dict):
+        with self._lock:
+            event["id"] = next(self._sequence)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.offer(event)
@@ -1,39 +1,120 @@
+from typing import List, Dict, Optional, Union
+
 from ..core.toolkit import PostmanToolkit
 from ..core.model.context import Context
 from ..core.model.environment import Environment
+from ..core.model.profile import Profile
+from ..core.model.property import Property
+from ..core.model.snapshot import EnvironmentSnapshot, PartialSnapshot, ProfileSnapshot
+from ..core.metrics import timed_methods, FACADE_CALL_DURATION
+from .events import EventBroadcaster
 
+# Environment used by the routes without environment prefix
 # TODO: environment support in frontend
-ENVIRONMENT_NAME = "default"
+DEFAULT_ENVIRONMENT = "default"
+
+BULK_OPERATIONS = ["create", "update", "delete"]
+
+# Fields of serialized properties and profiles, list endpoints can return a subset of them
+PROPERTY_FIELDS = ["id", "name", "value", "expandedValue", "profile"]
+PROFILE_FIELDS = ["id", "name", "active", "properties_count"]
 
 
 def interceptor(function):
-    def _wrapper(*args, **kwargs):
-        ret = function(*args, **kwargs)
-        args[0].toolkit.persist_changes()
+    """
+    Wraps facade methods modifying an environment. Wrapped method is called with environment name, which
+    is replaced by the environment itself. Changes are applied under the lock of that environment only
+    and committed afterwards (synchronously or by the background flusher, depending on persistence mode).
+    Version of the environment is bumped only if the method succeeds and modifies the environment, rejected
+    requests don't change its ETag. Change events recorded by the method are published once the changes
+    are committed (by the flusher in write-behind mode).
+    """
+    def _wrapper(facade, environment, *args, **kwargs):
+        while True:
+            env = facade._find_env(environment)
+            with env.lock:
+                # Environment could have been deleted or reloaded (replaced) while waiting for the lock
+                if not env.is_attached():
+                    continue
+                try:
+                    ret = function(facade, env, *args, **kwargs)
+                    if env.is_modified():
+                        env.bump_version()
+                finally:
+                    events = facade._take_events(env)
+            break
+        facade.toolkit.commit_changes(env, lambda: facade._publish_events(events))
         return ret
     return _wrapper
 
 
+@timed_methods(FACADE_CALL_DURATION)
 class WebFacade:
+    """
+    Modifications are applied to the live model under the environment lock (see interceptor), reads are served
+    from the last published environment snapshot without locking. Reads of a single profile are served from
+    the snapshot of that profile when profiles are loaded lazily, see Environment.get_snapshot.
+    """
     context: Context
     toolkit: PostmanToolkit
 
-    def __init__(self, toolkit: PostmanToolkit):
+    broadcaster: Optional[EventBroadcaster]
+
+    def __init__(self, toolkit: PostmanToolkit, broadcaster: EventBroadcaster = None):
         self.context = toolkit.context
         self.toolkit = toolkit
+        self.broadcaster = broadcaster
+        # Events recorded by the modification currently running in every environment
+        self._pending_events = {}
+        toolkit.add_reload_listener(self._on_environment_reloaded)
 
-    @interceptor
-    def get_property_details(self, property_name):
-        env = self._find_env(ENVIRONMENT_NAME)
-        chain = env.get_property_chain(property_name, enabled_only=False)
+    def list_environments(self):
+        return {
+            "content": [{"id": env.id, "name": env.name} for env in self.context.environments]
+        }
+
+    def create_environment(self, environment_name):
+        with self.toolkit.lock:
+            if self.context.find_environment(environment_name) is not None:
+                raise FacadeException("Environment {} already exists".format(environment_name))
+            env = self.context.create_environment(environment_name)
+        events = [{"type": "environment_created", "names": [], "environment": env.id, "version": env.version}]
+        self.toolkit.commit_changes(env, lambda: self._publish_events(events))
+
+    def delete_environment(self, environment_name) -> bool:
+        if environment_name == DEFAULT_ENVIRONMENT:
+            raise FacadeException("Environment {} can't be deleted".format(environment_name))
+
+        with self.toolkit.lock:
+            env = self.context.find_environment(environment_name)
+            if env is None:
+                return False
+            with env.lock:
+                self.context.delete_environment(environment_name)
+        # Only the registry has to be persisted, profiles of the environment are removed together with it
+        events = [{"type": "environment_deleted", "names": [], "environment": env.id, "version": env.version}]
+        self.toolkit.commit_changes(env, lambda: self._publish_events(events))
+        return True
+
+    def get_environment_version(self, environment):
+        """
+        Returns pair (environment id, version), version changes after every modification of the environment
+        """
+        env = self._find_env(environment)
+        return env.id, env.get_published_version()
+
+    def get_property_details(self, environment, property_name):
+        snapshot = self._find_env(environment).get_snapshot()
+        chain = snapshot.get_property_chain(property_name, enabled_only=False)
         if len(chain) == 0:
-            raise Exception("Property {} wasn't found".format(property_name))
+            raise NotFoundException("Property {} wasn't found".format(property_name))
 
         first = chain[0]
         content = {
             "id": first[1].id,
             "name": first[1].name,
             "value": first[1].value,
+            "expandedValue": snapshot.get_expanded_value(first[1]),
             "profileName": first[0].name,
             "active": first[0].enabled and first[1].enabled
         }
@@ -45,6 +126,7 @@ class WebFacade:
                 "id": ancestor[1].id,
                 "name": ancestor[1].name,
                 "value": ancestor[1].value,
+                "expandedValue": snapshot.get_expanded_value(ancestor[1]),
                 "profileName": ancestor[0].name,
                 "active": ancestor[0].enabled and ancestor[1].enabled
             })
@@ -55,133 +137,408 @@ class WebFacade:
         }
 
     @interceptor
-    def set_property_value(self, profile_id, property_id, value):
-        env = self._find_env(ENVIRONMENT_NAME)
-
-        profile = env.get_profile(int(profile_id))
-        if profile is None:
-            raise Exception("Profile {} wasn't found".format(profile_id))
-
-        prop = profile.get_property(int(property_id))
-        if prop is None:
-            raise Exception("Profile {} doesn't have property {}".format(profile_id, property_id))
-
+    def set_property_value(self, env, profile_id, property_id, value):
+        profile = self._get_profile(env, profile_id)
+        prop = self._get_property(profile, property_id)
         prop.value = str(value)
+        self._emit(env, "property_changed", [prop.name], profile=profile.id)
 
     @interceptor
-    def create_property(self, profile_id, property_name, value):
-        env = self._find_env(ENVIRONMENT_NAME)
-        profile = env.get_profile(profile_id)
-        if profile is None:
-            raise Exception("Profile {} wasn't found".format(profile_id))
-
+    def create_property(self, env, profile_id, property_name, value):
+        profile = self._get_profile(env, profile_id)
+        self._ensure_property_name_available(profile, property_name)
         profile.create_property(property_name, value)
+        self._emit(env, "property_created", [property_name], profile=profile.id)
 
     @interceptor
-    def delete_property(self, profile_id, property_id):
-        env = self._find_env(ENVIRONMENT_NAME)
-        profile = env.get_profile(profile_id)
-        if profile is None:
-            raise Exception("Profile {} wasn't found".format(profile_id))
-
-        profile.delete_property(int(property_id))
+    def delete_property(self, env, profile_id, property_id):
+        profile = self._get_profile(env, profile_id)
+        prop = self._get_property(profile, property_id)
+        if profile.delete_property(prop.id):
+            self._emit(env, "property_deleted", [prop.name], profile=profile.id)
 
     @interceptor
-    def rename_property(self, profile_id, property_id, new_property_name):
-        env = self._find_env(ENVIRONMENT_NAME)
-        profile = env.get_profile(profile_id)
-        if profile is None:
-            raise Exception("Profile {} wasn't found".format(profile_id))
-
-        prop = profile.get_property(int(property_id))
-        if prop is None:
-            raise Exception("Property {} wasn't found in profile {}".format(property_id, profile.name))
+    def rename_property(self, env, profile_id, property_id, new_property_name):
+        profile = self._get_profile(env, profile_id)
+        prop = self._get_property(profile, property_id)
+        if new_property_name != prop.name:
+            self._ensure_property_name_available(profile, new_property_name)
 
+        old_name = prop.name
         prop.name = new_property_name
+        self._emit(env, "property_renamed", [old_name, new_property_name], profile=profile.id)
+
+    def list_properties(self, environment, active_only, profile_id=None, after=None, limit=None, fields=None):
+        """
+        Lists resolved properties of the environment or properties of a profile. Once a page is requested
+        (with a cursor or a limit), properties are ordered by name and only the properties of the page are serialized.
+        :param after: cursor, name of the last property of the previous page
+        :param limit: maximum number of properties on the page
+        :param fields: serialized fields (subset of PROPERTY_FIELDS), all of them by default
+        """
+        snapshot = self._find_env(environment).get_snapshot(profile_id)
+        if after is None and limit is None:
+            resolved = self._get_resolved_properties(snapshot, active_only, profile_id)
+            return {
+                "content": [self._serialize_property(snapshot, p, prop, fields) for (p, prop) in resolved]
+            }
+
+        # One more property tells whether there is a next page
+        fetched = limit + 1 if limit is not None else None
+        if profile_id is not None:
+            profile = self._get_profile_snapshot(snapshot, profile_id)
+            resolved = [(profile, prop) for prop in profile.get_properties_page(after, fetched)]
+        else:
+            resolved = snapshot.get_resolved_page(after, fetched, active_only)
+        has_next = limit is not None and len(resolved) > limit
+        resolved = resolved[:limit]
+        return {
+            "content": [self._serialize_property(snapshot, p, prop, fields) for (p, prop) in resolved],
+            "nextCursor": resolved[-1][1].name if has_next else None
+        }
 
-    @interceptor
-    def list_properties(self, active_only, profile_id=None):
-        env = self._find_env(ENVIRONMENT_NAME)
-        _id = int(profile_id) if profile_id is not None else None
-        names = env.get_property_names(_id)
-        profile = env.get_profile(_id) if _id is not None else None
-
-        _list = []
-        for name in names:
-            if profile is None:
-                result = env.get_first_property(name, active_only)
-            else:
-                result = profile, profile.find_property(name)
-
-            if result is None:
-                continue
-            (p, prop) = result
-
-            _list.append({
+    def iter_properties(self, environment, active_only, profile_id=None):
+        """
+        Returns iterator of serialized properties, used for streaming exports. Only references to the properties
+        are collected up front, every property is serialized when it's requested.
+        """
+        snapshot = self._find_env(environment).get_snapshot(profile_id)
+        resolved = self._get_resolved_properties(snapshot, active_only, profile_id)
+        return (self._serialize_property(snapshot, p, prop) for (p, prop) in resolved)
+
+    def get_resolved_values(self, environment):
+        """
+        Returns environment id, environment name and iterator of pairs (name, expanded value) of all properties
+        resolved across enabled profiles, ordered by name
+        """
+        snapshot = self._find_env(environment).get_snapshot()
+        resolved = sorted(snapshot.get_resolved_properties(True), key=lambda x: x[1].name)
+        return snapshot.id, snapshot.name, ((prop.name, snapshot.get_expanded_value(prop)) for (_, prop) in resolved)
+
+    def search_properties(self, environment, query, prefix, names, values, page, size, profile_id=None):
+        """
+        Returns one page of properties whose name or value matches the query, resolved properties go first
+        (see EnvironmentSnapshot.search_properties). Search runs on the environment snapshot, without locking.
+        :param page: number of the page, starting from 0
+        :param size: number of properties on a page
+        """
+        snapshot = self._find_env(environment).get_snapshot()
+        if profile_id is not None:
+            profile_id = self._get_profile_snapshot(snapshot, profile_id).id
+        results = snapshot.search_properties(query, prefix, names, values, profile_id)
+        content = []
+        for (profile, prop, match, winner) in results[page * size:(page + 1) * size]:
+            content.append({
                 "id": prop.id,
                 "name": prop.name,
                 "value": prop.value,
-                "profile": p.id
+                "expandedValue": snapshot.get_expanded_value(prop),
+                "profile": profile.id,
+                "profileName": profile.name,
+                "winner": winner,
+                "match": match
             })
 
         return {
-            "content": _list
+            "content": content,
+            "page": page,
+            "size": size,
+            "totalElements": len(results),
+            "totalPages": (len(results) + size - 1) // size
         }
 
     @interceptor
-    def create_profile(self, profile_name, active):
-        env = self._find_env(ENVIRONMENT_NAME)
-        env.create_profile(profile_name, active)
+    def apply_bulk_operations(self, env, profile_id, operations):
+        """
+        Atomically applies list of create, update and delete operations to the properties of a profile.
+        All operations are validated first, if any of them is invalid, none of them is applied.
+        Operation format:
+        - {"op": "create", "name": name, "value": value}
+        - {"op": "update", "id": id | "name": name, "value": value}
+        - {"op": "delete", "id": id | "name": name}
+        :return: (applied, list of per-operation results)
+        """
+        profile = self._get_profile(env, profile_id)
+
+        results = []
+        # Validated values of create and update operations
+        values = []
+        # Names created or deleted by operations validated so far
+        created = set()
+        deleted = set()
+
+        def exists(_name):
+            return _name in created or (profile.find_property(_name) is not None and _name not in deleted)
+
+        for (index, operation) in enumerate(operations):
+            result = {"index": index, "status": "ok"}
+            results.append(result)
+            values.append(None)
+            try:
+                if not isinstance(operation, dict):
+                    raise FacadeException("Operation has to be an object")
+                op = operation.get("op")
+                result["op"] = op
+                if op not in BULK_OPERATIONS:
+                    raise FacadeException("Unknown operation {}".format(op))
+                name = self._get_bulk_operation_target(profile, operation)
+                result["name"] = name
+
+                if op == "create":
+                    if exists(name):
+                        raise FacadeException("Property {} already exists".format(name))
+                    values[index] = self._get_bulk_operation_value(operation)
+                    created.add(name)
+                    deleted.discard(name)
+                elif op == "update":
+                    if not exists(name):
+                        raise FacadeException("Property {} wasn't found".format(name))
+                    if "value" not in operation or operation["value"] is None:
+                        raise FacadeException("New value not specified")
+                    values[index] = self._get_bulk_operation_value(operation)
+                else:
+                    if not exists(name):
+                        raise FacadeException("Property {} wasn't found".format(name))
+                    created.discard(name)
+                    deleted.add(name)
+            except Exception as e:
+                result["status"] = "error"
+                result["message"] = str(e)
+
+        if any(r["status"] != "ok" for r in results):
+            return False, results
+
+        # Functions reverting the operations applied so far
+        undo = []
+        try:
+            for (value, result) in zip(values, results):
+                name = result["name"]
+                if result["op"] == "create":
+                    prop = profile.create_property(name, value)
+                    undo.append(lambda p=prop: profile.delete_property(p.id))
+                elif result["op"] == "update":
+                    prop = profile.find_property(name)
+                    undo.append(lambda p=prop, v=prop.value: setattr(p, "value", v))
+                    prop.value = value
+                else:
+                    prop = profile.find_property(name)
+                    profile.delete_property(prop.id)
+                    undo.append(lambda p=prop: profile.restore_property(p))
+                result["id"] = prop.id
+        except Exception:
+            # Operations were validated, yet applying one of them failed. The batch is still applied entirely
+            # or not at all.
+            for revert in reversed(undo):
+                revert()
+            raise
+
+        self._emit(env, "properties_changed", list(set(r["name"] for r in results)), profile=profile.id)
+        return True, results
 
-    def list_profiles(self, active_only):
-        env = self._find_env(ENVIRONMENT_NAME)
-        profiles = env.get_prioritized_profiles()
+    @interceptor
+    def create_profile(self, env, profile_name, active):
+        if env.find_profile(profile_name) is not None:
+            raise FacadeException("Profile {} already exists".format(profile_name))
+        profile = env.create_profile(profile_name, active)
+        self._emit(env, "profile_created", [], profile=profile.id)
+
+    def list_profiles(self, environment, active_only, after=None, limit=None, fields=None):
+        """
+        Lists profiles ordered by priority
+        :param after: cursor, priority of the last profile of the previous page
+        :param limit: maximum number of profiles on the page
+        :param fields: serialized fields (subset of PROFILE_FIELDS), all of them by default
+        """
+        snapshot = self._find_env(environment).get_snapshot()
+        profiles = snapshot.get_profiles_after(after) if after is not None else snapshot.get_prioritized_profiles()
         if active_only:
-            profiles = filter(lambda x: x.enabled, profiles)
-
-        _list = []
-        for p in profiles:
-            _list.append({
-                "id": p.id,
-                "name": p.name,
-                "active": p.enabled,
-                "properties_count": len(p.properties)
-            })
+            profiles = [p for p in profiles if p.enabled]
 
-        return {
-            "content": _list
+        page = profiles[:limit] if limit is not None else profiles
+        content = {
+            "content": [self._serialize_profile(p, fields) for p in page]
         }
+        if after is not None or limit is not None:
+            has_next = limit is not None and len(profiles) > limit
+            content["nextCursor"] = page[-1].priority if has_next else None
+        return content
 
     @interceptor
-    def set_profile_enabled_state(self, profile_id, new_state):
-        env = self._find_env(ENVIRONMENT_NAME)
-        profile = env.get_profile(profile_id)
-        if profile is None:
-            raise Exception("Profile {} wasn't found".format(profile_id))
+    def set_profile_enabled_state(self, env, profile_id, new_state):
+        profile = self._get_profile(env, profile_id)
         profile.enabled = bool(new_state)
+        self._emit(env, "profile_toggled", self._get_property_names(profile), profile=profile.id)
 
     @interceptor
-    def change_profile_priority(self, profile_id, increase):
-        env = self._find_env(ENVIRONMENT_NAME)
+    def change_profile_priority(self, env, profile_id, increase):
+        profile = self._get_profile(env, profile_id)
         if increase:
-            return env.increase_profile_priority(profile_id)
+            changed = env.increase_profile_priority(profile.id)
         else:
-            return env.decrease_profile_priority(profile_id)
+            changed = env.decrease_profile_priority(profile.id)
+
+        if changed:
+            profiles = env.get_prioritized_profiles()
+            position = profiles.index(profile)
+            # Moved profile has been swapped with the profile it's just passed
+            swapped = profiles[position + 1] if increase else profiles[position - 1]
+            names = set(self._get_property_names(profile)) | set(self._get_property_names(swapped))
+            self._emit(env, "profile_reordered", list(names), profile=profile.id)
+        return changed
 
     @interceptor
-    def delete_profile(self, profile_name):
-        env = self._find_env(ENVIRONMENT_NAME)
-        env.delete_profile(profile_name)
+    def delete_profile(self, env, profile_id) -> bool:
+        profile = self._get_profile(env, profile_id)
+        names = self._get_property_names(profile)
+        env.delete_profile(profile.id)
+        self._emit(env, "profile_deleted", names, profile=profile.id)
+        return True
+
+    def _emit(self, env: Environment, event_type, names: List[str], **data):
+        """
+        Records change event, it's published once the change is committed
+        """
+        event = {
+            "type": event_type,
+            "names": names
+        }
+        event.update(data)
+        self._pending_events.setdefault(env.id, []).append(event)
+
+    def _take_events(self, env: Environment) -> List[Dict]:
+        events = self._pending_events.pop(env.id, [])
+        for event in events:
+            event["environment"] = env.id
+            event["version"] = env.version
+        return events
+
+    def _on_environment_reloaded(self, env: Environment):
+        # Changes made by another process aren't known one by one, subscribers have to reload the environment
+        self._publish_events([{"type": "environment_reloaded", "names": [], "environment": env.id,
+                               "version": env.version}])
+
+    def _publish_events(self, events: List[Dict]):
+        if self.broadcaster is None:
+            return
+        for event in events:
+            self.broadcaster.publish(event)
+
+    @staticmethod
+    def _get_profile(env: Environment, profile_id) -> Profile:
+        profile = env.get_profile(profile_id) if str(profile_id).isdigit() else None
+        if profile is None:
+            raise NotFoundException("Profile {} wasn't found".format(profile_id))
+        return profile
+
+    @staticmethod
+    def _get_property(profile: Profile, property_id) -> Property:
+        prop = profile.get_property(int(property_id)) if str(property_id).isdigit() else None
+        if prop is None:
+            raise NotFoundException("Property {} wasn't found in profile {}".format(property_id, profile.name))
+        return prop
+
+    @staticmethod
+    def _ensure_property_name_available(profile: Profile, property_name):
+        if profile.find_property(property_name) is not None:
+            raise FacadeException("Property {} already exists in profile {}".format(property_name, profile.name))
+
+    @staticmethod
+    def _get_property_names(profile) -> List[str]:
+        return [p.name for p in profile.properties]
+
+    @staticmethod
+    def _get_resolved_properties(snapshot: Union[EnvironmentSnapshot, PartialSnapshot], active_only, profile_id=None):
+        if profile_id is not None:
+            profile = WebFacade._get_profile_snapshot(snapshot, profile_id)
+            return [(profile, prop) for prop in profile.properties]
+        else:
+            return snapshot.get_resolved_properties(active_only)
+
+    @staticmethod
+    def _get_profile_snapshot(snapshot: Union[EnvironmentSnapshot, PartialSnapshot], profile_id) -> ProfileSnapshot:
+        profile = snapshot.get_profile(int(profile_id)) if str(profile_id).isdigit() else None
+        if profile is None:
+            raise NotFoundException("Profile {} wasn't found".format(profile_id))
+        return profile
+
+    @staticmethod
+    def _serialize_property(snapshot: Union[EnvironmentSnapshot, PartialSnapshot], profile, prop, fields=None):
+        """
+        :param fields: serialized fields, all of them by default. Expanded value is only looked up if it's requested.
+        """
+        content = {
+            "id": prop.id,
+            "name": prop.name,
+            "value": prop.value,
+            "profile": profile.id
+        }
+        if fields is None or "expandedValue" in fields:
+            content["expandedValue"] = snapshot.get_expanded_value(prop)
+        if fields is not None:
+            content = {field: content[field] for field in fields}
+        return content
+
+    @staticmethod
+    def _serialize_profile(profile: ProfileSnapshot, fields=None):
+        content = {
+            "id": profile.id,
+            "name": profile.name,
+            "active": profile.enabled
+        }
+        if fields is None or "properties_count" in fields:
+            content["properties_count"] = profile.property_count
+        if fields is not None:
+            content = {field: content[field] for field in fields}
+        return content
+
+    @staticmethod
+    def _get_bulk_operation_target(profile, operation):
+        """
+        Returns name of the property targeted by a bulk operation
+        """
+        if operation.get("op") == "create" or "id" not in operation:
+            if not operation.get("name"):
+                raise FacadeException("Name not specified")
+            if not isinstance(operation["name"], str):
+                raise FacadeException("Name has to be a string")
+            return operation["name"]
+
+        prop = profile.get_property(int(operation["id"])) if str(operation["id"]).isdigit() else None
+        if prop is None:
+            raise FacadeException("Property {} wasn't found".format(operation["id"]))
+        return prop.name
+
+    @staticmethod
+    def _get_bulk_operation_value(operation) -> str:
+        """
+        Returns value set by a create or update operation, scalar values are stored as strings
+        """
+        value = operation.get("value")
+        if value is None:
+            return ""
+        if not isinstance(value, (str, int, float)):
+            raise FacadeException("Value has to be a string")
+        return str(value)
 
     def _find_env(self, name) -> Environment:
-        env = self.context.find_environment(ENVIRONMENT_NAME)
+        env = self.context.find_environment(name)
         if env is None:
-            raise Exception("Environment {} wasn't found".format(ENVIRONMENT_NAME))
+            raise NotFoundException("Environment {} wasn't found".format(name))
         return env
 
 
 class FacadeException(Exception):
+    """
+    Request rejected by the facade, the message is returned to the client
+    """
     message = None
+    # HTTP status of the response
+    status = 400
 
     def __init__(self, message):
         super().__init__(message)
+        self.message = message
+
+
+class NotFoundException(FacadeException):
+    status = 404
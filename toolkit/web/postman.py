@@ -0,0 +1,41 @@
+import datetime
+import uuid
+from typing import Iterable, Iterator, Tuple
+
+from flask import json
+
+from ..core.toolkit import VERSION
+
+POSTMAN_SCOPES = ["environment", "globals"]
+
+
+def render_postman_document(env_id, env_name, scope, variables: Iterable[Tuple[str, str]]) -> Iterator[str]:
+    """
+    Renders Postman environment (or globals) document chunk by chunk, one chunk per variable
+    :param env_id: environment id, used to generate stable document id
+    :param env_name: environment name
+    :param scope: environment or globals
+    :param variables: pairs (name, value)
+    """
+    document_id = uuid.uuid5(uuid.NAMESPACE_URL, "postman-toolkit/{}/{}".format(scope, env_id))
+    header = {
+        "id": str(document_id),
+        "name": env_name if scope == "environment" else "Globals",
+        "_postman_variable_scope": scope,
+        "_postman_exported_at": datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+        "_postman_exported_using": "Postman Toolkit/{}".format(VERSION)
+    }
+
+    # Header is rendered as a complete object, its closing brace is replaced with the values array
+    yield json.dumps(header)[:-1] + ', "values": ['
+    separator = ""
+    for (name, value) in variables:
+        item = {
+            "key": name,
+            "value": value,
+            "type": "default",
+            "enabled": True
+        }
+        yield separator + json.dumps(item)
+        separator = ", "
+    yield "]}"
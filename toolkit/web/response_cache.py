@@ -0,0 +1,31 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Hashable
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized response bodies. Keys contain environment version, so entries of older
+    versions are never hit again and are eventually evicted.
+    """
+    _entries: OrderedDict
+    _max_entries: int
+
+    def __init__(self, max_entries=256):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Hashable, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
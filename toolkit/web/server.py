@@ -0,0 +1,93 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from werkzeug.serving import make_server, select_address_family, get_sockaddr
+
+from ..core.log import Log
+
+# Minimum time (in seconds) between two starts of the same worker, so that a worker failing on startup
+# isn't restarted in a tight loop
+WORKER_RESTART_DELAY = 1
+LISTEN_BACKLOG = 128
+
+
+def run_workers(host, port, count):
+    """
+    Serves the application with given number of worker processes. The listening socket is opened here and shared
+    by all workers, every worker has its own copy of the model and keeps it up to date with changes committed
+    by the others (see PostmanToolkit.synchronize). Workers that exit are restarted.
+    """
+    sock = _listen(host, port)
+    # Workers are spawned rather than forked, so that they don't inherit database connections and threads
+    context = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+    started: Dict[int, float] = {}
+
+    def start(index):
+        delay = started.get(index, 0) + WORKER_RESTART_DELAY - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        worker = context.Process(target=_serve_worker, args=(sock, host, port, index),
+                                 name="worker-{}".format(index))
+        worker.start()
+        workers[index] = worker
+        started[index] = time.time()
+
+    # Workers are stopped on termination of this process as well, not only on keyboard interrupt
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    Log.i("Serving on http://{}:{} with {} workers", host, port, count)
+    try:
+        for i in range(count):
+            start(i)
+
+        while True:
+            sentinels = {worker.sentinel: index for (index, worker) in workers.items()}
+            for sentinel in multiprocessing.connection.wait(list(sentinels.keys())):
+                index = sentinels[sentinel]
+                worker = workers[index]
+                worker.join()
+                Log.w("Worker {} exited with code {}, restarting", index, worker.exitcode)
+                start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers.values():
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers.values():
+            worker.join()
+        sock.close()
+
+
+def _listen(host, port) -> socket.socket:
+    # Same address family as the one werkzeug expects when the socket is handed over to it
+    family = select_address_family(host, port)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if os.name != "nt":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(get_sockaddr(host, int(port), family))
+    sock.listen(LISTEN_BACKLOG)
+    return sock
+
+
+def _serve_worker(sock: socket.socket, host, port, index):
+    from . import web
+
+    app = web.create_app()
+    web.toolkit.enable_synchronization()
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    Log.i("Worker {} started (pid {})", index, os.getpid())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        web.toolkit.shutdown()
+        web.PostmanToolkit.destroy()
@@ -1,39 +1,117 @@
-from flask import Flask, request, make_response, jsonify
-
-from .facade import WebFacade, FacadeException
+import time
+import uuid
+from typing import Optional
+
+from flask import Flask, Response, request, make_response, jsonify, json, stream_with_context, g
+
+from .facade import WebFacade, FacadeException, DEFAULT_ENVIRONMENT, PROPERTY_FIELDS, PROFILE_FIELDS
+from .response_cache import ResponseCache
+from .assets import AssetTable
+from .postman import render_postman_document, POSTMAN_SCOPES
+from .events import EventBroadcaster
+from .server import run_workers
 from ..core.config import ConfigProperty
-from ..core.toolkit import PostmanToolkit
+from ..core.metrics import Metrics, HTTP_REQUEST_DURATION, HTTP_REQUEST_QUERIES, RESPONSE_SERIALIZATION_DURATION
+from ..core.toolkit import PostmanToolkit, PERSISTENCE_MODE_WRITE_BEHIND
+
 
+app = Flask("postman-toolkit-web", static_url_path="/unused")
+# Routes without environment prefix use the default environment, requests to the prefixed routes
+# mustn't be redirected to them
+app.url_map.redirect_defaults = False
+# Model is loaded by create_app in the process serving the requests, importing this module doesn't load it
+toolkit: Optional[PostmanToolkit] = None
+facade: Optional[WebFacade] = None
+broadcaster = EventBroadcaster()
+response_cache = ResponseCache()
+
+assets = AssetTable()
 if not ConfigProperty.DEBUG:
-    import importlib.resources as pkg_resources
-    # noinspection PyUnresolvedReferences
-    import toolkit.front as front_resources
-    # noinspection PyUnresolvedReferences
-    import toolkit.front.js as front_js
-    # noinspection PyUnresolvedReferences
-    import toolkit.front.css as front_css
-    # noinspection PyUnresolvedReferences
-    import toolkit.front.img as front_img
-    # noinspection PyUnresolvedReferences
-    import toolkit.front.fonts as front_fonts
+    # Front-end files are loaded (and compressed) on the first request for them, not at startup
+    assets.defer({
+        None: "toolkit.front",
+        "js": "toolkit.front.js",
+        "css": "toolkit.front.css",
+        "img": "toolkit.front.img",
+        "fonts": "toolkit.front.fonts"
+    })
 
+# Interval (in seconds) of keep-alive comments sent to idle event stream subscribers
+EVENT_KEEP_ALIVE_INTERVAL = 15
 
-app = Flask("postman-toolkit-web", static_url_path="/unused")
-with app.app_context():
-    toolkit = PostmanToolkit()
-    facade = WebFacade(toolkit)
+NDJSON_MIME_TYPES = ["application/x-ndjson", "application/ndjson"]
 
+SEARCH_MODES = ["substring", "prefix"]
+SEARCH_FIELDS = ["name", "value"]
+# Default and maximum number of properties on a page of search results
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 500
+# Maximum number of properties or profiles on a page of list endpoints
+MAX_PAGE_LIMIT = 1000
 
-def exception_handler(original):
-    def _wrapper(*args, **kwargs):
-        try:
-            original(*args, **kwargs)
-        except FacadeException as e:
-            error = {
-                "message": e.message
-            }
-            return make_response(error, 400)
-    return _wrapper
+# Versions are kept in memory only, ETags of different application runs mustn't match
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+
+def create_app() -> Flask:
+    """
+    Loads the model (once per process) and returns the application serving it
+    """
+    global toolkit, facade
+    if toolkit is None:
+        toolkit = PostmanToolkit()
+        facade = WebFacade(toolkit, broadcaster)
+    return app
+
+
+@app.errorhandler(FacadeException)
+def facade_exception_handler(e: FacadeException):
+    """
+    Invalid requests rejected by the facade (unknown entities, conflicting names, invalid operations)
+    """
+    error = {
+        "message": e.message
+    }
+    return make_response(error, e.status)
+
+
+def versioned_response(environment, producer):
+    """
+    Returns JSON response tagged with current environment version. Request with matching If-None-Match header
+    gets 304 response, serialized bodies are cached per endpoint, query arguments and version.
+    :param environment: environment name
+    :param producer: function returning response payload
+    """
+    (env_id, version) = facade.get_environment_version(environment)
+    etag = version_etag(env_id, version)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    key = (request.path, tuple(sorted(request.args.items(multi=True))), env_id, version)
+    body = response_cache.get(key)
+    if body is None:
+        payload = producer()
+        start = time.perf_counter()
+        body = json.dumps(payload).encode("utf-8")
+        RESPONSE_SERIALIZATION_DURATION.observe(time.perf_counter() - start, (request_endpoint(),))
+        # Environment could have been modified in the meantime, such body can't be cached under this version
+        if facade.get_environment_version(environment) == (env_id, version):
+            response_cache.put(key, body)
+
+    response = make_response(body, 200)
+    response.headers["Content-Type"] = "application/json"
+    response.set_etag(etag)
+    return response
+
+
+def version_etag(env_id, version):
+    return "{}-{}-{}".format(ETAG_EPOCH, env_id, version)
+
+
+def not_modified_response(etag):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
 
 
 @app.route("/app")
@@ -46,170 +124,451 @@ def front_app(path=None, resource_type=None):
     if not path or len(path) == 0:
         path = "index.html"
 
-    content_type = "text/html"
-    binary_mode = False
-
-    if resource_type == "js":
-        package = front_js
-    elif resource_type == "fonts":
-        package = front_fonts
-        binary_mode = True
-    elif resource_type == "css":
-        package = front_css
-        content_type = "text/css"
-    elif resource_type == "img":
-        package = front_img
-    else:
-        package = front_resources
+    asset = assets.get(resource_type, path)
+    if asset is None:
+        return make_response("", 404)
+    return asset.to_response(request)
 
-    data = pkg_resources.read_text(package, path) if not binary_mode else pkg_resources.read_binary(package, path)
-    response = make_response(data, 200)
-    response.headers["Content-Type"] = content_type
-    return response
+
+def request_endpoint():
+    # Rule rather than path, so that the number of label values stays bounded
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def before_request():
+    g.request_start = time.perf_counter()
+    Metrics.start_request()
+    # Picks up changes committed by other worker processes, no-op with a single process
+    toolkit.synchronize()
+
+
+@app.teardown_request
+def record_request(_):
+    start = g.get("request_start")
+    if start is None:
+        return
+    endpoint = request_endpoint()
+    stats = Metrics.finish_request()
+    HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, (endpoint, request.method, g.get("status", 500)))
+    HTTP_REQUEST_QUERIES.observe(stats.queries, (endpoint,))
 
 
 @app.teardown_appcontext
 def on_destroy(_):
-    PostmanToolkit.destroy()
+    PostmanToolkit.release_connection()
 
 
-@exception_handler
-@app.route("/api/config/details", methods=["POST"])
-def get_config_details():
-    property_name = request.json["name"]
-    v = facade.get_property_details(property_name)
-    if v is not None:
-        return jsonify(v)
-    else:
-        return make_response("", 404)
+@app.route("/api/environments", methods=["GET"])
+def list_environments():
+    return jsonify(facade.list_environments())
 
 
-@exception_handler
-@app.route("/api/config", methods=["GET"])
-def list_properties():
-    active_only = request.args.get("active_only", None) is not None
+@app.route("/api/environments", methods=["POST"])
+def create_environment():
+    body = read_json_object()
+    if body is None or not body.get("name"):
+        return make_response("Name not specified", 422)
+    if not isinstance(body["name"], str):
+        return make_response("Name has to be a string", 422)
 
-    v = facade.list_properties(active_only)
-    return make_response(v)
+    facade.create_environment(body["name"])
+    return make_response("", 201)
 
 
-@exception_handler
-@app.route("/api/profiles", methods=["POST"])
-def create_profile():
-    body = request.json
-    facade.create_profile(body["name"], body["active"])
-    return make_response("", 201)
+@app.route("/api/environments/<environment>", methods=["DELETE"])
+def delete_environment(environment):
+    if facade.delete_environment(environment):
+        return make_response("", 204)
+    return make_response("", 404)
+
+
+@app.route("/api/config/details", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/config/details", methods=["POST"])
+def get_config_details(environment):
+    body = read_json_object()
+    if body is None or not body.get("name"):
+        return make_response("Name not specified", 422)
+    if not isinstance(body["name"], str):
+        return make_response("Name has to be a string", 422)
 
+    return jsonify(facade.get_property_details(environment, body["name"]))
 
-@exception_handler
-@app.route("/api/profiles", methods=["GET"])
-def list_profiles():
+
+@app.route("/api/config", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/config", methods=["GET"])
+def list_properties(environment):
     active_only = request.args.get("active_only", None) is not None
-    return make_response(facade.list_profiles(active_only))
+    try:
+        (cursor, limit, fields) = read_page_arguments(PROPERTY_FIELDS)
+    except ValueError as e:
+        return make_response("Invalid arguments: {}".format(e), 422)
+    return versioned_response(environment, lambda: facade.list_properties(environment, active_only, None, cursor,
+                                                                          limit, fields))
+
+
+@app.route("/api/search", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT, "id": None})
+@app.route("/api/environments/<environment>/search", methods=["GET"], defaults={"id": None})
+@app.route("/api/profiles/<id>/search", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/search", methods=["GET"])
+def search_properties(environment, id):
+    query = request.args.get("q", "")
+    if len(query) == 0:
+        return make_response("Query not specified", 422)
+    mode = request.args.get("mode", SEARCH_MODES[0])
+    if mode not in SEARCH_MODES:
+        return make_response("Unknown search mode {}".format(mode), 422)
+    fields = request.args.get("fields", ",".join(SEARCH_FIELDS)).split(",")
+    if any(f not in SEARCH_FIELDS for f in fields):
+        return make_response("Unknown search fields {}".format(",".join(fields)), 422)
+    try:
+        page = int(request.args.get("page", 0))
+        size = int(request.args.get("size", SEARCH_PAGE_SIZE))
+    except ValueError:
+        return make_response("Page and size have to be numbers", 422)
+    if page < 0 or size < 1 or size > MAX_SEARCH_PAGE_SIZE:
+        return make_response("Page has to be at least 0, size between 1 and {}".format(MAX_SEARCH_PAGE_SIZE), 422)
+
+    return versioned_response(environment, lambda: facade.search_properties(
+        environment, query, mode == "prefix", "name" in fields, "value" in fields, page, size, id))
+
+
+@app.route("/api/profiles", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles", methods=["POST"])
+def create_profile(environment):
+    body = read_json_object()
+    if body is None or not body.get("name"):
+        return make_response("Name not specified", 422)
+    if not isinstance(body["name"], str):
+        return make_response("Name has to be a string", 422)
 
+    facade.create_profile(environment, body["name"], bool(body.get("active", True)))
+    return make_response("", 201)
 
-@exception_handler
-@app.route("/api/profiles/<id>/activate", methods=["POST"])
-def activate_profile(id):
-    facade.set_profile_enabled_state(id, True)
+
+@app.route("/api/profiles", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles", methods=["GET"])
+def list_profiles(environment):
+    active_only = request.args.get("active_only", None) is not None
+    try:
+        (cursor, limit, fields) = read_page_arguments(PROFILE_FIELDS, int)
+    except ValueError as e:
+        return make_response("Invalid arguments: {}".format(e), 422)
+    return versioned_response(environment, lambda: facade.list_profiles(environment, active_only, cursor, limit,
+                                                                        fields))
+
+
+@app.route("/api/profiles/<id>/activate", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/activate", methods=["POST"])
+def activate_profile(environment, id):
+    facade.set_profile_enabled_state(environment, id, True)
     return make_response("", 200)
 
 
-@exception_handler
-@app.route("/api/profiles/<id>/deactivate", methods=["POST"])
-def deactivate_profile(id):
-    facade.set_profile_enabled_state(id, False)
+@app.route("/api/profiles/<id>/deactivate", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/deactivate", methods=["POST"])
+def deactivate_profile(environment, id):
+    facade.set_profile_enabled_state(environment, id, False)
     return make_response("", 200)
 
 
-@exception_handler
-@app.route("/api/profiles/<id>/up", methods=["POST"])
-def move_profile_up(id):
-    facade.change_profile_priority(id, True)
+@app.route("/api/profiles/<id>/up", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/up", methods=["POST"])
+def move_profile_up(environment, id):
+    facade.change_profile_priority(environment, id, True)
     return make_response("", 200)
 
 
-@exception_handler
-@app.route("/api/profiles/<id>/down", methods=["POST"])
-def move_profile_down(id):
-    facade.change_profile_priority(id, False)
+@app.route("/api/profiles/<id>/down", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/down", methods=["POST"])
+def move_profile_down(environment, id):
+    facade.change_profile_priority(environment, id, False)
     return make_response("", 200)
 
 
-@exception_handler
-@app.route("/api/profiles/<id>", methods=["DELETE"])
-def delete_profile(id):
-    if facade.delete_profile(id):
+@app.route("/api/profiles/<id>", methods=["DELETE"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>", methods=["DELETE"])
+def delete_profile(environment, id):
+    if facade.delete_profile(environment, id):
         return make_response("", 204)
     return make_response("", 404)
 
 
-@exception_handler
-@app.route("/api/profiles/<id>/config", methods=["GET"])
-def list_profile_config(id):
+@app.route("/api/profiles/<id>/config", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/config", methods=["GET"])
+def list_profile_config(environment, id):
     active_only = request.args.get("active_only", None) is not None
-    config_list = facade.list_properties(active_only, id)
-    if config_list is None:
-        return make_response("", 404)
-    else:
-        return make_response(config_list)
-
-
-@exception_handler
-@app.route("/api/profiles/<id>/config", methods=["PUT"])
-def create_profile_config(id):
-    body = request.json
+    try:
+        (cursor, limit, fields) = read_page_arguments(PROPERTY_FIELDS)
+    except ValueError as e:
+        return make_response("Invalid arguments: {}".format(e), 422)
+    return versioned_response(environment, lambda: facade.list_properties(environment, active_only, id, cursor,
+                                                                          limit, fields))
+
+
+@app.route("/api/profiles/<id>/config", methods=["PUT"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/config", methods=["PUT"])
+def create_profile_config(environment, id):
+    body = read_json_object()
     if body is None or "name" not in body or body["name"] is None:
         return make_response("Name not specified", 422)
+    if not isinstance(body["name"], str):
+        return make_response("Name has to be a string", 422)
     value = ""
     if "value" in body and body["value"] is not None:
         value = body["value"]
+    if not isinstance(value, str):
+        return make_response("Value has to be a string", 422)
 
-    facade.create_property(id, body["name"], value)
+    facade.create_property(environment, id, body["name"], value)
     return make_response("", 201)
 
 
-@exception_handler
-@app.route("/api/profiles/<profile_id>/config/<property_id>", methods=["POST"])
-def update_profile_config(profile_id, property_id):
-    body = request.json
+@app.route("/api/profiles/<profile_id>/config/<property_id>", methods=["POST"],
+           defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<profile_id>/config/<property_id>", methods=["POST"])
+def update_profile_config(environment, profile_id, property_id):
+    body = read_json_object()
     if body is None or "value" not in body or body["value"] is None:
         return make_response("New value not specified", 422)
+    if not isinstance(body["value"], str):
+        return make_response("Value has to be a string", 422)
 
-    facade.set_property_value(profile_id, property_id, body["value"])
+    facade.set_property_value(environment, profile_id, property_id, body["value"])
     return make_response("")
 
 
-@exception_handler
-@app.route("/api/profiles/<profile_id>/config/<property_id>", methods=["DELETE"])
-def delete_profile_config(profile_id, property_id):
-    facade.delete_property(profile_id, property_id)
+@app.route("/api/profiles/<profile_id>/config/<property_id>", methods=["DELETE"],
+           defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<profile_id>/config/<property_id>", methods=["DELETE"])
+def delete_profile_config(environment, profile_id, property_id):
+    facade.delete_property(environment, profile_id, property_id)
     return make_response("")
 
 
-@exception_handler
-@app.route("/api/profiles/<profile_name>/config/<old_name>/rename", methods=["POST"])
-def rename_profile_config(profile_name, old_name):
-    body = request.json
+@app.route("/api/profiles/<profile_name>/config/<old_name>/rename", methods=["POST"],
+           defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<profile_name>/config/<old_name>/rename", methods=["POST"])
+def rename_profile_config(environment, profile_name, old_name):
+    body = read_json_object()
     if body is None or "new_name" not in body or body["new_name"] is None:
         return make_response("New name not specified", 422)
+    if not isinstance(body["new_name"], str):
+        return make_response("New name has to be a string", 422)
 
-    facade.rename_property(profile_name, old_name, body["new_name"])
+    facade.rename_property(environment, profile_name, old_name, body["new_name"])
     return make_response("", 200)
 
 
+@app.route("/api/profiles/<id>/config/bulk", methods=["POST"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/config/bulk", methods=["POST"])
+def bulk_profile_config(environment, id):
+    """
+    Applies create, update and delete operations sent as a JSON array or as NDJSON (one operation per line)
+    """
+    try:
+        operations = read_json_items()
+    except ValueError as e:
+        return make_response("Invalid body: {}".format(e), 422)
+
+    (applied, results) = facade.apply_bulk_operations(environment, id, operations)
+    content = {
+        "applied": applied,
+        "results": results
+    }
+    return make_response({"content": content}, 200 if applied else 422)
+
+
+@app.route("/api/config/export", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/config/export", methods=["GET"])
+def export_config(environment):
+    active_only = request.args.get("active_only", None) is not None
+    return ndjson_response(facade.iter_properties(environment, active_only))
+
+
+@app.route("/api/profiles/<id>/config/export", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/profiles/<id>/config/export", methods=["GET"])
+def export_profile_config(environment, id):
+    return ndjson_response(facade.iter_properties(environment, False, id))
+
+
+@app.route("/api/postman/environment", methods=["GET"], defaults={"environment": DEFAULT_ENVIRONMENT})
+@app.route("/api/environments/<environment>/postman/environment", methods=["GET"])
+def export_postman_environment(environment):
+    """
+    Returns resolved properties as a Postman environment (or globals, with scope=globals) document.
+    Rendered document is cached per environment version, the first render is streamed.
+    """
+    scope = request.args.get("scope", POSTMAN_SCOPES[0])
+    if scope not in POSTMAN_SCOPES:
+        return make_response("Unknown scope {}".format(scope), 422)
+
+    (env_id, version) = facade.get_environment_version(environment)
+    etag = version_etag(env_id, version)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    key = ("postman", scope, env_id, version)
+    body = response_cache.get(key)
+    if body is not None:
+        response = make_response(body, 200)
+    else:
+        (_, env_name, variables) = facade.get_resolved_values(environment)
+        chunks = render_postman_document(env_id, env_name, scope, variables)
+        response = Response(stream_with_context(caching_stream(key, environment, (env_id, version), chunks)))
+
+    response.headers["Content-Type"] = "application/json"
+    response.headers["Content-Disposition"] = "attachment; filename=\"postman_{}.json\"".format(scope)
+    response.set_etag(etag)
+    return response
+
+
+def caching_stream(key, environment, env_version, chunks):
+    """
+    Streams chunks and stores the complete body in the response cache, unless the environment has been
+    modified in the meantime
+    """
+    rendered = []
+    for chunk in chunks:
+        encoded = chunk.encode("utf-8")
+        rendered.append(encoded)
+        yield encoded
+
+    if facade.get_environment_version(environment) == env_version:
+        response_cache.put(key, b"".join(rendered))
+
+
+@app.route("/api/events", methods=["GET"])
+@app.route("/api/environments/<environment>/events", methods=["GET"])
+def change_events(environment=None):
+    """
+    Server-Sent Events stream of changes made through the API, either in all environments or in a single one
+    """
+    environment_id = facade.get_environment_version(environment)[0] if environment is not None else None
+    subscription = broadcaster.subscribe(environment_id)
+
+    def _generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.next(EVENT_KEEP_ALIVE_INTERVAL)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                event_id = "id: {}\n".format(event["id"]) if "id" in event else ""
+                yield "{}event: {}\ndata: {}\n\n".format(event_id, event["type"], json.dumps(event))
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = Response(_generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def read_page_arguments(fields, cursor_type=str):
+    """
+    Reads page arguments of list endpoints: cursor (nextCursor of the previous page), limit and fields
+    (comma-separated projection)
+    :param fields: fields that can be requested
+    :param cursor_type: type of the cursor, properties are paged by name, profiles by priority
+    :return: triple (cursor, limit, fields), None for every argument that wasn't specified
+    """
+    cursor = request.args.get("cursor", None)
+    if cursor is not None:
+        try:
+            cursor = cursor_type(cursor)
+        except ValueError:
+            raise ValueError("invalid cursor {}".format(cursor))
+
+    limit = request.args.get("limit", None)
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_LIMIT:
+            raise ValueError("limit has to be a number between 1 and {}".format(MAX_PAGE_LIMIT))
+        limit = int(limit)
+
+    requested = request.args.get("fields", None)
+    if requested is not None:
+        requested = requested.split(",")
+        if any(f not in fields for f in requested):
+            raise ValueError("unknown fields {}, available fields: {}".format(",".join(requested), ",".join(fields)))
+    return cursor, limit, requested
+
+
+def read_json_object():
+    """
+    Reads JSON object body
+    :return: body or None if the body isn't a JSON object
+    """
+    body = request.json
+    return body if isinstance(body, dict) else None
+
+
+def read_json_items():
+    """
+    Reads list of items from a JSON array body or, line by line, from NDJSON body
+    """
+    if request.mimetype in NDJSON_MIME_TYPES:
+        items = []
+        for line in request.stream:
+            line = line.strip()
+            if len(line) > 0:
+                items.append(json.loads(line))
+        return items
+
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, list):
+        raise ValueError("JSON array expected")
+    return body
+
+
+def ndjson_response(items):
+    def _generate():
+        for item in items:
+            yield json.dumps(item) + "\n"
+    return Response(stream_with_context(_generate()), mimetype=NDJSON_MIME_TYPES[0])
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Metrics of this process in Prometheus text format
+    """
+    return Response(Metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.after_request
 def after_request(response):
+    g.status = response.status_code
     if app.debug:
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Headers"] = "*"
         response.headers["Access-Control-Allow-Methods"] = "*"
+        response.headers["Access-Control-Expose-Headers"] = "ETag"
 
     return response
 
 
 def run_web():
-    app.run(
-        ConfigProperty. SERVER_HOST,
-        ConfigProperty.SERVER_PORT,
-        ConfigProperty.DEBUG)
+    if ConfigProperty.SERVER_WORKERS > 1 and not ConfigProperty.DEBUG:
+        if ConfigProperty.PERSISTENCE_MODE == PERSISTENCE_MODE_WRITE_BEHIND:
+            raise Exception("Write-behind persistence can't be used with multiple workers")
+        # Every worker loads its own model, this process only prepares the database and shares the listening socket
+        PostmanToolkit.prepare_database()
+        PostmanToolkit.destroy()
+        run_workers(ConfigProperty.SERVER_HOST, ConfigProperty.SERVER_PORT, ConfigProperty.SERVER_WORKERS)
+        return
+
+    create_app()
+    if ConfigProperty.PERSISTENCE_MODE == PERSISTENCE_MODE_WRITE_BEHIND:
+        toolkit.start_write_behind()
+
+    try:
+        app.run(
+            ConfigProperty. SERVER_HOST,
+            ConfigProperty.SERVER_PORT,
+            ConfigProperty.DEBUG)
+    finally:
+        toolkit.shutdown()
+        PostmanToolkit.destroy()